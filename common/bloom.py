@@ -0,0 +1,219 @@
+# -*- coding: utf8 -*-
+
+"""
+布隆过滤器
+
+A BloomFilter answers "definitely absent" or "maybe present" for a key with
+a few bit probes. Keys are given as two 64-bit hashes (h1, h2), the i-th
+probe being (h1 + i * h2) mod m (double hashing). hash_ids / hash_id_columns
+compute them for word-id tuples, in Python and vectorized with numpy, with
+identical results, so that a filter filled from the arrays of an NgramTrie
+can be probed with the ids of a single lookup.
+
+A MappedBloomFilter probes the bits of a filter stored in a memory-mapped
+file (see common.ngram_binary), so that opening it costs nothing and its
+pages are shared between the processes mapping the same file.
+"""
+
+import math
+
+import numpy as np
+
+
+MASK = (1 << 64) - 1
+
+FNV_PRIME = 1099511628211
+FNV_BASIS = 14695981039346656037
+SECOND_BASIS = 0x9E3779B97F4A7C15
+
+
+class BloomFilter(object):
+
+    """
+    固定容量的布隆过滤器
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+
+        capacity = max(capacity, 1)
+
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        ''' 位数 '''
+
+        self.nb_hashes = max(1, int(round(float(self.size) / capacity * math.log(2))))
+        ''' 每个键的探测次数 '''
+
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def array(self):
+
+        """
+        以uint8数组返回位数组（不复制），用于写入文件
+        """
+
+        return np.frombuffer(self.bits, dtype=np.uint8)
+
+    def add_hashes(self, h1, h2):
+
+        """
+        向量化地添加一批键
+        :param h1: uint64数组
+        :param h2: uint64数组
+        """
+
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+
+        for i in range(self.nb_hashes):
+            position = (h1 + np.uint64(i) * h2) % np.uint64(self.size)
+            np.bitwise_or.at(bits, (position >> np.uint64(3)).astype(np.int64),
+                             (np.uint8(1) << (position & np.uint64(7)).astype(np.uint8)))
+
+    def contains_ids(self, ids):
+
+        """
+        判断一个词编号序列是否可能存在，与contains_hashes(*hash_ids(ids))相同，
+        省去一次函数调用及元组构造
+        :param ids:
+        :return: False表示一定不存在
+        """
+
+        h1 = FNV_BASIS
+        h2 = SECOND_BASIS
+
+        for i in ids:
+            h1 = ((h1 ^ i) * FNV_PRIME) & MASK
+            h2 = ((h2 ^ i) * FNV_PRIME) & MASK
+
+        h2 |= 1
+        bits = self.bits
+        size = self.size
+
+        for i in range(self.nb_hashes):
+            position = ((h1 + i * h2) & MASK) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+    def contains_hashes(self, h1, h2):
+
+        """
+        判断单个键是否可能存在
+        :param h1:
+        :param h2:
+        :return: False表示一定不存在
+        """
+
+        bits = self.bits
+        size = self.size
+
+        for i in range(self.nb_hashes):
+            position = ((h1 + i * h2) & MASK) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+
+class MappedBloomFilter(BloomFilter):
+
+    """
+    映射在文件中的只读布隆过滤器，与写入时的BloomFilter探测结果相同
+
+    The bits are read from the mapped buffer in place: indexing an mmap gives
+    a one-character string, hence the ord() of the probes below.
+    """
+
+    def __init__(self, buf, offset, size, nb_hashes):
+
+        self.size = size
+        ''' 位数 '''
+
+        self.nb_hashes = nb_hashes
+        ''' 每个键的探测次数 '''
+
+        self.bits = buf
+        ''' 映射的缓冲区 '''
+
+        self.offset = offset
+        ''' 位数组在缓冲区中的起始位置 '''
+
+    def array(self):
+
+        return np.frombuffer(self.bits, dtype=np.uint8, count=(self.size + 7) // 8, offset=self.offset)
+
+    def add_hashes(self, h1, h2):
+
+        raise TypeError('a mapped bloom filter is read-only')
+
+    def contains_ids(self, ids):
+
+        h1 = FNV_BASIS
+        h2 = SECOND_BASIS
+
+        for i in ids:
+            h1 = ((h1 ^ i) * FNV_PRIME) & MASK
+            h2 = ((h2 ^ i) * FNV_PRIME) & MASK
+
+        h2 |= 1
+        bits = self.bits
+        offset = self.offset
+        size = self.size
+
+        for i in range(self.nb_hashes):
+            position = ((h1 + i * h2) & MASK) % size
+            if not ord(bits[offset + (position >> 3)]) & (1 << (position & 7)):
+                return False
+
+        return True
+
+    def contains_hashes(self, h1, h2):
+
+        bits = self.bits
+        offset = self.offset
+        size = self.size
+
+        for i in range(self.nb_hashes):
+            position = ((h1 + i * h2) & MASK) % size
+            if not ord(bits[offset + (position >> 3)]) & (1 << (position & 7)):
+                return False
+
+        return True
+
+
+def hash_ids(ids):
+
+    """
+    词编号序列的两个64位哈希值
+    :param ids:
+    :return: (h1, h2)
+    """
+
+    h1 = FNV_BASIS
+    h2 = SECOND_BASIS
+
+    for i in ids:
+        h1 = ((h1 ^ i) * FNV_PRIME) & MASK
+        h2 = ((h2 ^ i) * FNV_PRIME) & MASK
+
+    return h1, h2 | 1
+
+
+def hash_id_columns(columns):
+
+    """
+    向量化的hash_ids
+    :param columns: k个等长的词编号数组
+    :return: (h1, h2) uint64数组
+    """
+
+    n = len(columns[0])
+    h1 = np.full(n, FNV_BASIS, dtype=np.uint64)
+    h2 = np.full(n, SECOND_BASIS, dtype=np.uint64)
+
+    for column in columns:
+        column = np.asarray(column).astype(np.uint64)
+        h1 = (h1 ^ column) * np.uint64(FNV_PRIME)
+        h2 = (h2 ^ column) * np.uint64(FNV_PRIME)
+
+    return h1, h2 | np.uint64(1)
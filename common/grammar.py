@@ -1,8 +1,14 @@
 # -*- coding: utf8 -*-
 
+import os
 import sys
-import re
+import time
+import hashlib
+import tempfile
+from collections import OrderedDict
 from common import *
+from common.ngram_reader import NgramModelReader
+from common.score_cache import ScoreCache, sentence_key
 
 
 class GrammarScorer(object):
@@ -12,71 +18,616 @@ class GrammarScorer(object):
     @author zhenchao.Wang 2016-1-3 15:35:00
     """
 
-    def __init__(self, modelpath):
+    def __init__(self, modelpath, storage='dict', fmt='auto', vocabulary=None, cache_size=65536,
+                 quantize_bits=None, bloom_error_rate=None, score_cache_path=None, instrument=False):
 
         self.modelpath = modelpath
         ''' 语法模型所在路径 '''
 
+        self.storage = storage
+        '''
+        模型存储方式: dict（字符串为键的dict）、trie（整数编号的数组trie，
+        见common.ngram_trie，内存占用小得多，需要numpy）或mmap（modelpath为
+        common.ngram_binary转换得到的二进制模型，映射打开，几乎不需加载时间）
+        '''
+
+        self.fmt = fmt
+        ''' 文本模型的格式: tsv、arpa或auto（据首行判断），可为.gz或.bz2压缩文件 '''
+
+        self.vocabulary = None
+        '''
+        只加载由这些词（及<unk>、<s>、</s>）构成的N元组，None则加载全部。
+        待打分语句中的词都在其中时，得分与加载全部模型完全一致。mmap方式下忽略
+        '''
+        if vocabulary is not None:
+            self.vocabulary = set(vocabulary)
+            self.vocabulary.update(['<unk>', '<s>', '</s>'])
+
+        self.quantize_bits = quantize_bits
+        ''' trie方式下将概率及回退概率量化为8或16位编码，None则不量化 '''
+
+        self.bloom_error_rate = bloom_error_rate
+        '''
+        不为None时，trie方式下为最高阶N元组建立该误判率的布隆过滤器，
+        查找前先排除一定不存在的N元组（dict方式下一次查找本就只是一次哈希探测，忽略）。
+        mmap方式下使用转换时写入模型文件的过滤器（见common.ngram_binary.convert_model），
+        只映射不重建；share()将过滤器写入共享模型文件
+        '''
+
         self.ngram_model = self.__load_ngram_model()
         ''' N元语法模型 '''
 
+        self.ngram_lookup = None
+        ''' 根据词序列查找N元组(prob, backoff)，不存在返回None '''
+        self.__prepare_model()
+
+        self.shared_path = None
+        ''' share()创建的共享模型文件 '''
+
+        self.cache_size = cache_size
+        ''' 三元组得分LRU缓存的容量，0表示不使用缓存 '''
+
+        self.cache = OrderedDict()
+        ''' 三元组得分缓存: (w1, w2, w3) -> cal_ngram_fluency的结果，按最近使用排序 '''
+
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        ''' 缓存的命中、未命中及淘汰次数 '''
+
+        self.score_cache = None
+        '''
+        三元组及语句得分的持久缓存（见common.score_cache），score_cache_path
+        不为None时打开，在多次运行（如参数扫描）之间复用得分，模型文件改变时失效
+        '''
+        if score_cache_path is not None:
+            vocabulary = None if self.vocabulary is None else hashlib.sha1(' '.join(sorted(self.vocabulary))).hexdigest()
+            self.score_cache = ScoreCache(score_cache_path, modelpath, (storage, fmt, quantize_bits, vocabulary))
+
+        self.stats = None
+        '''
+        打分统计（见reset_stats、stats_snapshot），instrument为True时开启，
+        None表示不统计，此时每次调用只多一次判断
+        '''
+
+        self.measuring = False
+        ''' 是否处在已计时的调用中，嵌套调用不重复计时 '''
+
+        if instrument:
+            self.reset_stats()
+
+    def share(self, path=None):
+
+        """
+        将已加载的模型写入只读的内存映射文件（默认建在共享内存/dev/shm中），
+        此后本打分器改为映射该文件。多进程时，子进程继承或反序列化得到的打分器
+        只重新映射同一文件，各进程共享同一份物理内存，不复制模型，得分与共享前
+        完全相同。文件在不再需要时由调用者调用release()删除
+        :param path: 共享模型文件路径，None则自动创建
+        :return: 共享模型文件路径
+        """
+
+        if self.storage == 'mmap':
+            return self.modelpath
+
+        from common.ngram_binary import open_binary_model, write_binary_model
+        from common.ngram_trie import NgramTrieBuilder
+
+        model = self.ngram_model
+        if isinstance(model, dict):
+            # float64存储，与dict中的得分完全相同
+            builder = NgramTrieBuilder('float64')
+            for tri_gram, (prob_score, back_off_score) in model.iteritems():
+                builder.add(tri_gram, prob_score, back_off_score)
+            model = builder.build()
+
+        # 过滤器随模型写入共享文件，各进程映射同一份
+        if self.bloom_error_rate is not None and not model.blooms:
+            model.build_bloom(self.bloom_error_rate)
+
+        if path is None:
+            shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, path = tempfile.mkstemp(prefix='ngram_', suffix='.bin', dir=shm)
+            os.close(fd)
+            self.shared_path = path
+
+        write_binary_model(model, path)
+
+        self.modelpath = path
+        self.storage = 'mmap'
+        self.ngram_model = open_binary_model(path)
+        self.__prepare_model()
+
+        logging.info('ngram model shared through [%s]', path)
+
+        return path
+
+    def release(self):
+
+        """
+        删除share()自动创建的共享模型文件（已映射的进程不受影响）
+        """
+
+        if self.shared_path is not None and os.path.exists(self.shared_path):
+            os.remove(self.shared_path)
+        self.shared_path = None
+
+    def __getstate__(self):
+
+        # mmap方式只序列化文件路径，反序列化时重新映射；缓存不随之复制
+        state = dict(self.__dict__)
+        state['ngram_lookup'] = None
+        state['cache'] = OrderedDict()
+        state['shared_path'] = None
+        if self.storage == 'mmap':
+            state['ngram_model'] = None
+
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+
+        if self.storage == 'mmap':
+            from common.ngram_binary import open_binary_model
+            self.ngram_model = open_binary_model(self.modelpath)
+
+        self.__prepare_model()
+
+    def __prepare_model(self):
+
+        # 建立布隆过滤器（按需，已有的过滤器不重建，映射的模型只使用文件中的过滤器），绑定查找函数
+        if self.bloom_error_rate is not None and hasattr(self.ngram_model, 'build_bloom') and \
+                not self.ngram_model.blooms:
+            if self.storage == 'mmap':
+                logging.warn('binary ngram model[%s] has no bloom filter, convert it with a bloom error rate',
+                             self.modelpath)
+            else:
+                self.ngram_model.build_bloom(self.bloom_error_rate)
+
+        self.ngram_lookup = getattr(self.ngram_model, 'lookup_words', None)
+        if self.ngram_lookup is None:
+            model = self.ngram_model
+            self.ngram_lookup = lambda words: model.get(' '.join(words))
+
     def cal_fluency(self, sentence):
 
+        return self.cal_fluency_tokens(sentence.split())
+
+    def cal_fluency_tokens(self, tokens):
+
+        """
+        计算已切分成词的语句的语法得分，与cal_fluency(' '.join(tokens))相同，
+        但不需要拼接和切分字符串
+        :param tokens: 词序列（不含<s>、</s>）
+        :return:
+        """
+
+        if self.stats is not None and not self.measuring:
+            return self.__measure('fluency_calls', 1, self.cal_fluency_tokens, tokens)
+
+        if self.score_cache is None:
+            return self.__fluency_tokens(tokens)
+
+        key = sentence_key(tokens)
+
+        score = self.score_cache.get_sentence(key)
+        if score is None:
+            score = self.__fluency_tokens(tokens)
+            self.score_cache.put_sentence(key, score)
+        elif self.stats is not None:
+            self.stats['persistent_hits'] += 1
+
+        return score
+
+    def __fluency_tokens(self, tokens):
+
         score = 0.0
 
-        sent = '<s> ' + sentence + ' </s>'
-        strs = re.split('\s+', sent)
+        strs = ['<s>'] + list(tokens) + ['</s>']
 
         for i in range(2, len(strs)):
+            score += self.cal_ngram_fluency(strs[i - 2], strs[i - 1], strs[i])
+
+        return score
+
+    def begin(self):
 
-            w1 = strs[i - 2]
-            w2 = strs[i - 1]
-            w3 = strs[i]
+        """
+        语句开始（<s>）的状态。状态是可哈希的元组，由最近的至多两个词构成，
+        两个以同一状态结尾的短语之后的得分增量完全相同，可据此合并搜索假设
+        :return: 状态
+        """
 
-            if (w1 not in self.ngram_model) and ('<s>' != w1) and ('</s>' != w1):
-                w1 = '<unk>'
+        return ('<s>',)
 
-            if w2 not in self.ngram_model:
-                w2 = '<unk>'
+    def advance(self, state, word):
 
-            if (w3 not in self.ngram_model) and ('<s>' != w3) and ('</s>' != w3):
-                w3 = '<unk>'
+        """
+        在状态后接一个词。从begin()开始依次累加各词的得分增量，再加上finish()，
+        与cal_fluency_tokens的结果（包括浮点累加顺序）完全相同
+        :param state:
+        :param word:
+        :return: (新状态, 得分增量)
+        """
 
-            score += float(10**self.__extract_ngram_score(w1 + ' ' + w2 + ' ' + w3))
+        if len(state) < 2:
+            return (state[0], word), 0.0
 
-        return score
+        return (state[1], word), self.cal_ngram_fluency(state[0], state[1], word)
 
-    def __extract_ngram_score(self, wordstr):
+    def finish(self, state):
 
         """
-        计算语法得分
-        :param wordstr:
+        语句结束（</s>）的得分增量
+        :param state:
         :return:
         """
 
-        words = re.split('\s+', wordstr)
+        if len(state) < 2:
+            return 0.0
 
-        if len(words) == 3:
+        return self.cal_ngram_fluency(state[0], state[1], '</s>')
 
-            if wordstr in self.ngram_model:
-                return self.ngram_model[wordstr][0]
+    def expand(self, state, words):
 
-            elif (words[0] + ' ' + words[1]) in self.ngram_model:
-                return self.ngram_model[words[0] + ' ' + words[1]][1] + self.__extract_ngram_score(words[0] + ' ' + words[1])
+        """
+        在状态后分别接words中的每个词，与对每个词调用advance、再对新状态调用
+        finish的结果完全相同。搜索一次扩展一个结点的全部后继时使用，
+        GrammarClient据此将未缓存的三元组合并成一次请求
+        :param state:
+        :param words:
+        :return: [(新状态, 得分增量, 语句结束的得分增量), ...]，与words一一对应
+        """
 
-            else:
-                return self.__extract_ngram_score(words[1] + ' ' + words[2])
+        expansions = []
+        for word in words:
+            next_state, increment = self.advance(state, word)
+            expansions.append((next_state, increment, self.finish(next_state)))
 
-        elif len(words) == 2:
+        return expansions
 
-            if (words[0] + ' ' + words[1]) in self.ngram_model:
-                return self.ngram_model[words[0] + ' ' + words[1]][0]
+    def cal_fluency_batch(self, sentences):
 
-            else:
-                return self.ngram_model[words[0]][1] + self.__extract_ngram_score(words[1])
+        """
+        批量计算多个语句的语法得分，结果与逐句调用cal_fluency_tokens相同。
+        trie或mmap方式下所有三元组在一次向量化查找中完成，dict方式下逐句计算
+        :param sentences: 词序列（不含<s>、</s>）的列表
+        :return: 得分列表
+        """
 
-        else:
-            return self.ngram_model[words[0]][0]
+        if self.stats is not None and not self.measuring:
+            return self.__measure('batch_calls', len(sentences), self.cal_fluency_batch, sentences)
+
+        if self.score_cache is None:
+            return self.__fluency_batch(sentences)
+
+        # 只计算持久缓存中没有的语句
+        keys = [sentence_key(tokens) for tokens in sentences]
+        scores = [self.score_cache.get_sentence(key) for key in keys]
+        missing = [i for i in range(len(scores)) if scores[i] is None]
+
+        if self.stats is not None:
+            self.stats['persistent_hits'] += len(scores) - len(missing)
+
+        for i, score in zip(missing, self.__fluency_batch([sentences[i] for i in missing])):
+            scores[i] = score
+            self.score_cache.put_sentence(keys[i], score)
+
+        return scores
+
+    def __fluency_batch(self, sentences):
+
+        if not hasattr(self.ngram_model, 'lookup_batch'):
+            return [self.__fluency_tokens(tokens) for tokens in sentences]
+
+        return self.cal_fluency_ids_batch([self.token_ids(tokens) for tokens in sentences])
+
+    def token_ids(self, tokens):
+
+        """
+        将词序列转换为模型中的词编号，词表外的词为-1（仅trie、mmap方式）
+        :param tokens:
+        :return:
+        """
+
+        vocab = self.ngram_model.vocab
+        return [vocab.get(word, -1) for word in tokens]
+
+    def cal_fluency_ids_batch(self, sequences):
+
+        """
+        批量计算以词编号表示的多个语句的语法得分（仅trie、mmap方式）
+        :param sequences: 词编号序列（不含<s>、</s>，见token_ids）的列表
+        :return: 得分列表
+        """
+
+        if self.stats is not None and not self.measuring:
+            return self.__measure('batch_calls', len(sequences), self.cal_fluency_ids_batch, sequences)
+
+        import numpy as np
+
+        model = self.ngram_model
+        vocab = model.vocab
+        bos, eos, unk = vocab.get('<s>', -1), vocab.get('</s>', -1), vocab.get('<unk>', -1)
+
+        if len(sequences) == 0:
+            return []
+
+        # 1. 所有语句首尾相接，加上<s>、</s>，并标记不需替换成<unk>的位置
+        tokens = []
+        for sequence in sequences:
+            tokens.append(bos)
+            tokens.extend(sequence)
+            tokens.append(eos)
+        tokens = np.array(tokens, dtype=np.int64)
+
+        lengths = np.array([len(sequence) + 2 for sequence in sequences], dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+
+        boundary = np.zeros(len(tokens), dtype=bool)
+        boundary[starts] = True
+        boundary[starts + lengths - 1] = True
+        boundary |= ((tokens == bos) & (bos >= 0)) | ((tokens == eos) & (eos >= 0))
+
+        # 2. 不在模型中的词替换成<unk>（<s>、</s>在w1、w3位置上除外）
+        present = model.lookup_batch([tokens])[0]
+        outer = np.where(present | boundary, tokens, unk)
+        inner = np.where(present, tokens, unk)
+
+        # 3. 各语句的三元组窗口: 以第三个词的位置表示
+        windows = lengths - 2
+        sentence_of = np.repeat(np.arange(len(sequences)), windows)
+        offset = np.arange(len(sentence_of)) - np.repeat(np.cumsum(windows) - windows, windows)
+        third = starts[sentence_of] + 2 + offset
+
+        w1, w2, w3 = outer[third - 2], inner[third - 1], outer[third]
+
+        # 4. 与__extract_ngram_score相同的回退顺序
+        tri_found, tri_prob, _ = model.lookup_batch([w1, w2, w3])
+        left_found, left_prob, left_backoff = model.lookup_batch([w1, w2])
+        right_found, right_prob, _ = model.lookup_batch([w2, w3])
+        uni_backoff_found, _, uni_backoff = model.lookup_batch([w2])
+        uni_prob_found, uni_prob, _ = model.lookup_batch([w3])
+
+        unigram = ~(tri_found | left_found | right_found)
+        missing = unigram & ~(uni_backoff_found & uni_prob_found)
+        if missing.any():
+            raise KeyError(int(third[np.argmax(missing)]))
+
+        if self.stats is not None:
+            substituted = ~(present | boundary)
+            self.stats['unk_substitutions'] += int(np.count_nonzero(substituted[third - 2]) +
+                                                   np.count_nonzero(~present[third - 1]) +
+                                                   np.count_nonzero(substituted[third]))
+            self.stats['trigrams'] += len(third)
+            depth = self.stats['backoff_depth']
+            depth[0] += int(np.count_nonzero(tri_found))
+            depth[1] += int(np.count_nonzero(~tri_found & left_found))
+            depth[2] += int(np.count_nonzero(~tri_found & ~left_found & right_found))
+            depth[3] += int(np.count_nonzero(unigram))
+
+        log_score = np.where(tri_found, tri_prob,
+                             np.where(left_found, left_backoff + left_prob,
+                                      np.where(right_found, right_prob, uni_backoff + uni_prob)))
+
+        # 5. 逐句按顺序累加（与cal_fluency的累加顺序一致，保证结果完全相同）
+        scores = np.zeros((len(sequences), max(int(windows.max()), 1)))
+        scores[sentence_of, offset] = np.power(10.0, log_score)
+
+        return [float(score) for score in np.cumsum(scores, axis=1)[:, -1]]
+
+    def cal_ngram_fluency(self, w1, w2, w3):
+
+        """
+        计算单个三元组的语法得分，即cal_fluency中每个三元组的累加项
+        :param w1:
+        :param w2:
+        :param w3:
+        :return:
+        """
+
+        if self.stats is not None and not self.measuring:
+            return self.__measure('ngram_calls', 0, self.cal_ngram_fluency, w1, w2, w3)
+
+        if not self.cache_size:
+            return self.__stored_ngram_fluency(w1, w2, w3)
+
+        key = (w1, w2, w3)
+
+        score = self.cache.pop(key, None)
+        if score is not None:
+            self.cache_stats['hits'] += 1
+            if self.stats is not None:
+                self.stats['cache_hits'] += 1
+            self.cache[key] = score
+            return score
+
+        self.cache_stats['misses'] += 1
+        if self.stats is not None:
+            self.stats['cache_misses'] += 1
+
+        score = self.__stored_ngram_fluency(w1, w2, w3)
+        self.cache[key] = score
+
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.cache_stats['evictions'] += 1
+
+        return score
+
+    def cache_info(self):
+
+        """
+        返回缓存的统计信息
+        :return: dict(hits, misses, evictions, size, capacity)
+        """
+
+        info = dict(self.cache_stats)
+        info['size'] = len(self.cache)
+        info['capacity'] = self.cache_size
+
+        return info
+
+    def clear_cache(self):
+
+        """
+        清空缓存及其统计信息
+        """
+
+        self.cache.clear()
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def reset_stats(self):
+
+        """
+        开启（或清零）打分统计
+        """
+
+        self.stats = {
+            'fluency_calls': 0,  # cal_fluency、cal_fluency_tokens的调用次数
+            'batch_calls': 0,  # cal_fluency_batch、cal_fluency_ids_batch的调用次数
+            'ngram_calls': 0,  # 直接调用cal_ngram_fluency（含advance、finish、expand）的次数
+            'sentences': 0,  # 打分的语句数
+            'trigrams': 0,  # 实际查找模型计算的三元组数（不含缓存命中）
+            'backoff_depth': [0, 0, 0, 0],  # 得分来自三元组、(w1 w2)回退、(w2 w3)、一元组回退的次数
+            'unk_substitutions': 0,  # 替换成<unk>的词数
+            'cache_hits': 0,  # LRU缓存命中次数
+            'cache_misses': 0,  # LRU缓存未命中次数
+            'persistent_hits': 0,  # 持久缓存命中的三元组及语句数
+            'seconds': 0.0,  # 打分累计耗时
+        }
+
+    def stats_snapshot(self, reset=False):
+
+        """
+        返回打分统计的快照，另外给出各阶命中次数（order_hits）及LRU缓存命中率
+        :param reset: 是否在取快照后清零，用于按类别统计
+        :return: dict，未开启统计时返回None
+        """
+
+        if self.stats is None:
+            return None
+
+        snapshot = dict(self.stats)
+        depth = snapshot['backoff_depth'] = list(self.stats['backoff_depth'])
+        snapshot['order_hits'] = {3: depth[0], 2: depth[1] + depth[2], 1: depth[3]}
+
+        lookups = snapshot['cache_hits'] + snapshot['cache_misses']
+        snapshot['cache_hit_rate'] = float(snapshot['cache_hits']) / lookups if lookups else 0.0
+
+        if reset:
+            self.reset_stats()
+
+        return snapshot
+
+    def __measure(self, counter, sentences, method, *args):
+
+        """
+        计时并计数一次最外层的打分调用
+        """
+
+        self.stats[counter] += 1
+        self.stats['sentences'] += sentences
+        self.measuring = True
+        start_time = time.time()
+
+        try:
+            return method(*args)
+        finally:
+            self.stats['seconds'] += time.time() - start_time
+            self.measuring = False
+
+    def flush(self):
+
+        """
+        将新计算的得分写入持久缓存（未打开持久缓存时什么也不做）
+        """
+
+        if self.score_cache is not None:
+            self.score_cache.flush()
+
+    def __stored_ngram_fluency(self, w1, w2, w3):
+
+        # 先查持久缓存
+        if self.score_cache is None:
+            return self.__ngram_fluency(w1, w2, w3)
+
+        key = (w1, w2, w3)
+
+        score = self.score_cache.get_ngram(key)
+        if score is None:
+            score = self.__ngram_fluency(w1, w2, w3)
+            self.score_cache.put_ngram(key, score)
+        elif self.stats is not None:
+            self.stats['persistent_hits'] += 1
+
+        return score
+
+    def __ngram_fluency(self, w1, w2, w3):
+
+        lookup = self.ngram_lookup
+        stats = self.stats
+
+        if (lookup((w1,)) is None) and ('<s>' != w1) and ('</s>' != w1):
+            w1 = '<unk>'
+            if stats is not None:
+                stats['unk_substitutions'] += 1
+
+        if lookup((w2,)) is None:
+            w2 = '<unk>'
+            if stats is not None:
+                stats['unk_substitutions'] += 1
+
+        if (lookup((w3,)) is None) and ('<s>' != w3) and ('</s>' != w3):
+            w3 = '<unk>'
+            if stats is not None:
+                stats['unk_substitutions'] += 1
+
+        if stats is not None:
+            stats['trigrams'] += 1
+
+        return float(10**self.__extract_ngram_score(w1, w2, w3))
+
+    def __extract_ngram_score(self, w1, w2, w3):
+
+        """
+        计算语法得分，按三元组、二元组回退、一元组的顺序迭代查找
+        （三元组不存在而(w1 w2)存在时，得分为(w1 w2)的回退概率与概率之和）
+        :param w1:
+        :param w2:
+        :param w3:
+        :return:
+        """
+
+        lookup = self.ngram_lookup
+        depth = None if self.stats is None else self.stats['backoff_depth']
+
+        entry = lookup((w1, w2, w3))
+        if entry is not None:
+            if depth is not None:
+                depth[0] += 1
+            return entry[0]
+
+        entry = lookup((w1, w2))
+        if entry is not None:
+            if depth is not None:
+                depth[1] += 1
+            return entry[1] + entry[0]
+
+        entry = lookup((w2, w3))
+        if entry is not None:
+            if depth is not None:
+                depth[2] += 1
+            return entry[0]
+
+        backoff = lookup((w2,))
+        prob = lookup((w3,))
+        if backoff is None or prob is None:
+            raise KeyError(w2 if backoff is None else w3)
+
+        if depth is not None:
+            depth[3] += 1
+
+        return backoff[1] + prob[0]
 
     def __load_ngram_model(self):
 
@@ -86,38 +637,66 @@ class GrammarScorer(object):
         :return: map(word, (prob, backOffProb))
         """
 
-        ngram_model = {}
-
         logging.info("loading ngram model...")
 
-        with open(self.modelpath, mode = 'r') as modelfile:
+        if self.storage == 'dict':
 
-            for line in modelfile:
+            ngram_model = {}
 
-                strs = re.split('\t', line.strip())
+            for tri_gram, prob_score, back_off_score in self.__read_ngram_entries(NgramModelReader(self.modelpath, self.fmt)):
+                ngram_model[tri_gram] = (prob_score, back_off_score)
 
-                if len(strs) < 2:
-                    logging.warn('The elements count is less than 2, ignore line[' + line + ']')
-                    continue
+        elif self.storage == 'mmap':
 
-                prob_score = float(strs[0])
-                tri_gram = strs[1]
-                back_off_score = 0.0
+            from common.ngram_binary import open_binary_model
 
-                if len(strs) == 3:
-                    back_off_score = float(strs[2])
+            ngram_model = open_binary_model(self.modelpath)
 
-                ngram_model[tri_gram] = (prob_score, back_off_score)
+        elif self.storage == 'trie':
+
+            from common.ngram_trie import NgramTrieBuilder
+
+            reader = NgramModelReader(self.modelpath, self.fmt)
+            # 过滤时实际个数远小于声明的个数，不预分配
+            builder = NgramTrieBuilder(counts=reader.counts if self.vocabulary is None else None,
+                                       bits=self.quantize_bits)
+
+            for tri_gram, prob_score, back_off_score in self.__read_ngram_entries(reader):
+                builder.add(tri_gram, prob_score, back_off_score)
+
+            ngram_model = builder.build()
+
+        else:
+            raise ValueError('unknown ngram model storage: ' + str(self.storage))
 
         logging.info("load ngram model finished!")
 
         return ngram_model
 
+    def __read_ngram_entries(self, reader):
+
+        """
+        按词表过滤读到的N元组
+        :param reader:
+        :return: iterator of (ngram, prob, backOffProb)
+        """
+
+        if self.vocabulary is None:
+            return reader
+
+        vocabulary = self.vocabulary
+        return (entry for entry in reader if all(word in vocabulary for word in entry[0].split(' ')))
+
 
 if __name__ == '__main__':
 
-    modelpath = sys.argv[1]
-    grammr_scorer = GrammarScorer(modelpath)
+    if len(sys.argv) > 2 and sys.argv[1] == '--server':
+        # 连接本地语言模型打分服务（见common.lm_server），无需加载模型
+        from common.lm_server import GrammarClient
+        grammr_scorer = GrammarClient(sys.argv[2])
+    else:
+        modelpath = sys.argv[1]
+        grammr_scorer = GrammarScorer(modelpath)
 
     sentence = raw_input('Please input a sentence:(blank string exit)')
 
@@ -0,0 +1,336 @@
+# -*- coding: utf8 -*-
+
+"""
+本地语言模型打分服务
+
+LMServer holds one loaded GrammarScorer and serves it over a Unix domain
+socket, so that short-lived processes share one warm model. GrammarClient
+connects to it and exposes the scoring interface of GrammarScorer
+(cal_fluency, cal_fluency_tokens, cal_fluency_batch, cal_ngram_fluency and
+begin/advance/finish/expand), so it can be given to the compressors instead
+of a GrammarScorer. Trigram scores are kept in a client-side LRU cache, and
+expand() fetches the uncached trigrams of all the successors of a search
+state in one request.
+
+The protocol is one JSON object per line in both directions. A request is
+{"id": ..., "op": ..., ...}, the response {"id": ..., "result": ...} or
+{"id": ..., "error": ...}. Requests of a connection are answered in order,
+so a client may send several of them before reading the responses:
+
+- fluency: {"sentences": [sentence, ...]} -> [score, ...]
+- fluency_tokens: {"sentences": [[word, ...], ...]} -> [score, ...]
+- ngram: {"trigrams": [[w1, w2, w3], ...]} -> [score, ...]
+- info: {} -> model path, storage and cache statistics
+
+Starting the server::
+
+    python -m common.lm_server model socket_path [dict|trie|mmap]
+"""
+
+import os
+import sys
+import json
+import socket
+import threading
+import SocketServer
+from collections import OrderedDict
+
+from common.logger import logging
+
+
+class LMServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    """
+    语言模型打分服务，每个连接一个线程，打分器的调用串行化
+    """
+
+    daemon_threads = True
+
+    def __init__(self, grammar_scorer, socket_path):
+
+        self.grammar_scorer = grammar_scorer
+        ''' 语言模型打分器 '''
+
+        self.socket_path = socket_path
+        ''' Unix域套接字路径 '''
+
+        self.lock = threading.Lock()
+        ''' 打分器（及其缓存）不是线程安全的 '''
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        SocketServer.UnixStreamServer.__init__(self, socket_path, LMRequestHandler)
+
+    def dispatch(self, line):
+
+        """
+        处理一个请求
+        :param line: JSON请求
+        :return: JSON响应
+        """
+
+        request_id = None
+
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            op = request.get('op')
+
+            with self.lock:
+
+                if op == 'fluency':
+                    result = [self.grammar_scorer.cal_fluency(_to_str(sentence)) for sentence in request['sentences']]
+
+                elif op == 'fluency_tokens':
+                    result = self.grammar_scorer.cal_fluency_batch(
+                        [[_to_str(word) for word in tokens] for tokens in request['sentences']])
+
+                elif op == 'ngram':
+                    result = [self.grammar_scorer.cal_ngram_fluency(*[_to_str(word) for word in trigram])
+                              for trigram in request['trigrams']]
+
+                elif op == 'info':
+                    result = {'modelpath': self.grammar_scorer.modelpath,
+                              'storage': self.grammar_scorer.storage,
+                              'cache': self.grammar_scorer.cache_info()}
+
+                else:
+                    raise ValueError('unknown op: ' + str(op))
+
+            return json.dumps({'id': request_id, 'result': result})
+
+        except Exception as e:
+            logging.warn('lm server request failed: %s', e)
+            return json.dumps({'id': request_id, 'error': '%s: %s' % (type(e).__name__, e)})
+
+    def server_close(self):
+
+        SocketServer.UnixStreamServer.server_close(self)
+        self.grammar_scorer.flush()
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class LMRequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+
+        while True:
+
+            line = self.rfile.readline()
+            if not line:
+                break
+
+            self.wfile.write(self.server.dispatch(line) + '\n')
+
+
+class GrammarClient(object):
+
+    """
+    语言模型打分服务的客户端，可代替GrammarScorer使用
+
+    submit() sends a request without waiting for its response and result()
+    waits for the response of a submitted request, so that several requests
+    can be pipelined; the scoring methods send at most one request each and
+    wait, the trigram scores being first looked up in the local cache.
+    """
+
+    def __init__(self, socket_path, cache_size=65536, max_pending=64):
+
+        self.socket_path = socket_path
+        ''' 服务的Unix域套接字路径 '''
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+
+        self.next_id = 0
+        ''' 下一个请求的编号 '''
+
+        self.pending = []
+        ''' 已发送、尚未读取响应的请求编号，按发送顺序 '''
+
+        self.responses = {}
+        ''' 已读取、尚未取走的响应 '''
+
+        self.max_pending = max_pending
+        ''' 未读取响应的请求数上限，超过时先读取响应，避免双方的套接字缓冲区写满 '''
+
+        self.cache_size = cache_size
+        ''' 三元组得分的本地LRU缓存容量，0表示不使用缓存 '''
+
+        self.cache = OrderedDict()
+
+    def submit(self, op, **payload):
+
+        """
+        发送一个请求，不等待响应
+        :param op: fluency、fluency_tokens、ngram或info
+        :return: 请求编号
+        """
+
+        while len(self.pending) >= self.max_pending:
+            self.__receive()
+
+        request_id = self.next_id
+        self.next_id += 1
+
+        payload['id'] = request_id
+        payload['op'] = op
+        self.wfile.write(json.dumps(payload) + '\n')
+        self.pending.append(request_id)
+
+        return request_id
+
+    def result(self, request_id):
+
+        """
+        等待并返回请求的结果
+        :param request_id:
+        :return:
+        """
+
+        while request_id not in self.responses:
+            self.__receive()
+
+        response = self.responses.pop(request_id)
+
+        if 'error' in response:
+            raise RuntimeError('lm server error: ' + response['error'])
+
+        return response['result']
+
+    def call(self, op, **payload):
+
+        return self.result(self.submit(op, **payload))
+
+    def cal_fluency(self, sentence):
+
+        return self.call('fluency', sentences=[sentence])[0]
+
+    def cal_fluency_tokens(self, tokens):
+
+        return self.call('fluency_tokens', sentences=[list(tokens)])[0]
+
+    def cal_fluency_batch(self, sentences):
+
+        return self.call('fluency_tokens', sentences=[list(tokens) for tokens in sentences])
+
+    def cal_ngram_fluency(self, w1, w2, w3):
+
+        return self.__ngram_scores([(w1, w2, w3)])[0]
+
+    def begin(self):
+
+        return ('<s>',)
+
+    def advance(self, state, word):
+
+        if len(state) < 2:
+            return (state[0], word), 0.0
+
+        return (state[1], word), self.cal_ngram_fluency(state[0], state[1], word)
+
+    def finish(self, state):
+
+        if len(state) < 2:
+            return 0.0
+
+        return self.cal_ngram_fluency(state[0], state[1], '</s>')
+
+    def expand(self, state, words):
+
+        """
+        与GrammarScorer.expand相同，本地缓存中没有的三元组合并成一次请求，
+        而不是每个词一次往返
+        """
+
+        next_states = [(state[-1], word) for word in words]
+        ends = [(next_state[0], next_state[1], '</s>') for next_state in next_states]
+
+        if len(state) < 2:
+            return zip(next_states, [0.0] * len(words), self.__ngram_scores(ends))
+
+        scores = self.__ngram_scores([(state[0], state[1], word) for word in words] + ends)
+
+        return zip(next_states, scores[:len(words)], scores[len(words):])
+
+    def stats_snapshot(self, reset=False):
+
+        # 打分统计只在服务端的打分器中进行
+        return None
+
+    def flush(self):
+
+        # 持久缓存（如有）由服务端的打分器维护
+        pass
+
+    def close(self):
+
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+    def __ngram_scores(self, trigrams):
+
+        """
+        返回各三元组的得分，先查本地LRU缓存，未缓存的三元组用一次请求取得
+        """
+
+        scores = [self.cache.get(key) for key in trigrams]
+
+        missing = list(OrderedDict.fromkeys(key for key, score in zip(trigrams, scores) if score is None))
+        if missing:
+            fetched = dict(zip(missing, self.call('ngram', trigrams=missing)))
+            scores = [fetched[key] if score is None else score for key, score in zip(trigrams, scores)]
+
+        if self.cache_size:
+            for key, score in zip(trigrams, scores):
+                self.cache.pop(key, None)
+                self.cache[key] = score
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return scores
+
+    def __receive(self):
+
+        self.wfile.flush()
+
+        line = self.rfile.readline()
+        if not line:
+            raise IOError('lm server closed the connection')
+
+        response = json.loads(line)
+        self.pending.remove(response['id'])
+        self.responses[response['id']] = response
+
+
+def _to_str(word):
+
+    """ JSON解码得到unicode，模型中的词为utf-8编码的str """
+
+    if isinstance(word, unicode):
+        return word.encode('utf-8')
+    return word
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        print 'usage: python -m common.lm_server model socket_path [dict|trie|mmap]'
+        sys.exit(-1)
+
+    from common.grammar import GrammarScorer
+
+    server = LMServer(GrammarScorer(sys.argv[1], sys.argv[3] if len(sys.argv) > 3 else 'dict'), sys.argv[2])
+    logging.info('lm server listening on [%s]', sys.argv[2])
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
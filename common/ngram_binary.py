@@ -0,0 +1,247 @@
+# -*- coding: utf8 -*-
+
+"""
+可内存映射的二进制N元语法模型
+
+The binary file holds an NgramTrie (see common.ngram_trie) as raw arrays, so
+that opening it only maps the file: nothing is parsed or copied, the pages
+are read on demand and shared between the processes through the OS page
+cache. Layout::
+
+    MAGIC | header length (uint64) | JSON header | arrays (8-byte aligned)
+
+the header giving the order and (dtype, offset, count) of every array,
+quantized models (see common.ngram_quantize) adding their codebooks. The
+vocabulary is stored sorted as a concatenation of the words plus their
+offsets and ids, and looked up by binary search. The Bloom filters of the
+trie (see NgramTrie.build_bloom), if any, are stored as bloom_k bit arrays,
+their sizes in the header, and probed in place once mapped.
+
+Conversion, done once::
+
+    python -m common.ngram_binary model.lm model.bin [auto|tsv|arpa] [float32|float64|8|16] [bloom error rate]
+"""
+
+import sys
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from common.bloom import MappedBloomFilter
+from common.logger import logging
+from common.ngram_reader import read_ngram_entries
+from common.ngram_trie import NgramTrie, NgramTrieBuilder
+
+
+MAGIC = 'NGRAMBIN'
+''' 二进制模型文件标识 '''
+
+VERSION = 1
+
+
+class MappedVocabulary(object):
+
+    """
+    映射在文件中的有序词表，提供与dict相同的get()
+    """
+
+    def __init__(self, chars, offsets, ids):
+
+        self.chars = chars
+        ''' 按字节序排列的词拼接而成的缓冲区 '''
+
+        self.offsets = offsets
+        ''' 各词在chars中的起始位置，最后一个为总长度 '''
+
+        self.ids = ids
+        ''' 各词的编号 '''
+
+        self.cache = {}
+        ''' 已查找过的词，同一批语句中的词大量重复 '''
+
+    def get(self, word, default=None):
+
+        i = self.cache.get(word)
+        if i is not None:
+            return i
+
+        lo = 0
+        hi = len(self.ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.chars[self.offsets[mid]:self.offsets[mid + 1]] < word:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(self.ids) and self.chars[self.offsets[lo]:self.offsets[lo + 1]] == word:
+            i = int(self.ids[lo])
+            self.cache[word] = i
+            return i
+
+        return default
+
+    def iteritems(self):
+
+        for i in range(len(self.ids)):
+            yield self.chars[self.offsets[i]:self.offsets[i + 1]], int(self.ids[i])
+
+    def __len__(self):
+
+        return len(self.ids)
+
+
+def write_binary_model(trie, binpath):
+
+    """
+    将NgramTrie写成二进制模型文件
+    :param trie:
+    :param binpath:
+    :return:
+    """
+
+    words = sorted(trie.vocab.iteritems())
+
+    arrays = dict(trie.arrays)
+    arrays['vocab_chars'] = np.frombuffer(''.join(word for word, i in words) or '\0', dtype=np.uint8)
+    arrays['vocab_offsets'] = np.cumsum([0] + [len(word) for word, i in words]).astype(np.int64)
+    arrays['vocab_ids'] = np.array([i for word, i in words], dtype=np.int32)
+
+    # 布隆过滤器的位数组，映射打开后直接探测，无需重建
+    blooms = {}
+    for k, bloom in trie.blooms.iteritems():
+        arrays['bloom_%d' % k] = bloom.array()
+        blooms[k] = [bloom.size, bloom.nb_hashes]
+
+    names = sorted(arrays)
+
+    # 先以占位偏移计算头部长度（为各偏移的位数预留空间），再确定各数组的位置
+    table = dict((name, [arrays[name].dtype.str, 0, len(arrays[name])]) for name in names)
+    header = {'version': VERSION, 'order': trie.order, 'arrays': table, 'blooms': blooms}
+    reserved = len(json.dumps(header)) + 24 * len(names)
+    offset = _align(len(MAGIC) + 8 + reserved)
+    for name in names:
+        table[name][1] = offset
+        offset = _align(offset + arrays[name].nbytes)
+
+    encoded = json.dumps(header)
+    encoded += ' ' * (reserved - len(encoded))
+
+    with open(binpath, 'wb') as binfile:
+
+        binfile.write(MAGIC)
+        binfile.write(struct.pack('<Q', len(encoded)))
+        binfile.write(encoded)
+
+        for name in names:
+            binfile.write('\0' * (table[name][1] - binfile.tell()))
+            binfile.write(np.ascontiguousarray(arrays[name]).tostring())
+
+
+def open_binary_model(binpath):
+
+    """
+    以只读内存映射方式打开二进制模型文件
+    :param binpath:
+    :return: NgramTrie
+    """
+
+    with open(binpath, 'rb') as binfile:
+        buf = mmap.mmap(binfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a binary ngram model: ' + binpath)
+
+    size, = struct.unpack('<Q', buf[len(MAGIC):len(MAGIC) + 8])
+    header = json.loads(buf[len(MAGIC) + 8:len(MAGIC) + 8 + size])
+
+    if header['version'] != VERSION:
+        raise ValueError('unsupported binary ngram model version: ' + str(header['version']))
+
+    arrays = {}
+    for name, (dtype, offset, count) in header['arrays'].iteritems():
+        arrays[str(name)] = np.frombuffer(buf, dtype=np.dtype(str(dtype)), count=count, offset=offset)
+
+    vocab = MappedVocabulary(_BufferSlicer(buf, header['arrays']['vocab_chars'][1]),
+                             arrays.pop('vocab_offsets'), arrays.pop('vocab_ids'))
+    del arrays['vocab_chars']
+
+    trie = NgramTrie(vocab, arrays, header['order'])
+    trie.mapped = buf
+
+    for k, (size, nb_hashes) in header.get('blooms', {}).iteritems():
+        name = 'bloom_%s' % k
+        del arrays[name]
+        trie.blooms[int(k)] = MappedBloomFilter(buf, header['arrays'][name][1], size, nb_hashes)
+
+    return trie
+
+
+def convert_model(modelpath, binpath, fmt='auto', dtype='float32', bits=None, bloom_error_rate=None):
+
+    """
+    将文本模型（tsv或arpa，可为.gz或.bz2压缩文件）转换为二进制模型文件
+    :param modelpath:
+    :param binpath:
+    :param fmt:
+    :param dtype: 概率的存储类型，float32或float64
+    :param bits: 不为None时将概率量化为8或16位编码（见common.ngram_quantize）
+    :param bloom_error_rate: 不为None时为最高阶N元组建立该误判率的布隆过滤器，写入模型文件
+    :return:
+    """
+
+    logging.info('converting ngram model[%s] to [%s]...', modelpath, binpath)
+
+    reader = read_ngram_entries(modelpath, fmt)
+    builder = NgramTrieBuilder(dtype, reader.counts, bits)
+    for ngram, prob, backoff in reader:
+        builder.add(ngram, prob, backoff)
+
+    trie = builder.build()
+    if bloom_error_rate is not None:
+        trie.build_bloom(bloom_error_rate)
+
+    write_binary_model(trie, binpath)
+
+    logging.info('convert ngram model finished!')
+
+
+class _BufferSlicer(object):
+
+    """
+    以相对位置切片映射缓冲区，切片结果为str
+    """
+
+    def __init__(self, buf, base):
+
+        self.buf = buf
+        self.base = base
+
+    def __getitem__(self, s):
+
+        return self.buf[self.base + s.start:self.base + s.stop]
+
+
+def _align(offset):
+
+    return (offset + 7) // 8 * 8
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        print 'usage: python -m common.ngram_binary model binpath [auto|tsv|arpa] [float32|float64|8|16] [bloom error rate]'
+        sys.exit(-1)
+
+    # 第四个参数为8或16时量化存储
+    storage = sys.argv[4] if len(sys.argv) > 4 else 'float32'
+    bloom_error_rate = float(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    if storage.isdigit():
+        convert_model(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else 'auto', bits=int(storage),
+                      bloom_error_rate=bloom_error_rate)
+    else:
+        convert_model(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else 'auto', storage,
+                      bloom_error_rate=bloom_error_rate)
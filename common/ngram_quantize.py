@@ -0,0 +1,134 @@
+# -*- coding: utf8 -*-
+
+"""
+N元语法模型概率及回退概率的量化
+
+Every prob_k / backoff_k array of an NgramTrie is replaced by 8 or 16-bit
+codes plus a per-order codebook (prob_k_codebook, backoff_k_codebook), code 0
+standing for the absent entries (NaN). When an order has fewer distinct
+values than codes, the codebook holds them all and the quantization is
+lossless; otherwise the sorted values are split into bins of equal size and
+each value is coded by the nearest bin mean.
+"""
+
+import numpy as np
+
+from common.ngram_trie import NgramTrie
+
+
+CODE_TYPES = {8: np.uint8, 16: np.uint16}
+''' 量化位数对应的编码类型 '''
+
+
+def quantize_values(values, bits=8):
+
+    """
+    量化一个概率数组
+    :param values: 概率数组，NaN表示不存在的N元组
+    :param bits: 8或16
+    :return: (编码数组, 码本)
+    """
+
+    if bits not in CODE_TYPES:
+        raise ValueError('quantization bits must be 8 or 16, not ' + str(bits))
+
+    values = np.asarray(values, dtype=np.float64)
+    known = values == values
+
+    nb_codes = 2 ** bits - 1
+    centers = np.unique(values[known])
+
+    if len(centers) > nb_codes:
+        ordered = np.sort(values[known])
+        centers = np.unique([chunk.mean() for chunk in np.array_split(ordered, nb_codes)])
+
+    codes = np.zeros(len(values), dtype=CODE_TYPES[bits])
+    if len(centers) > 0:
+        bounds = (centers[:-1] + centers[1:]) / 2
+        codes[known] = bounds.searchsorted(values[known]) + 1
+
+    return codes, np.concatenate(([np.nan], centers))
+
+
+def quantize_trie(trie, bits=8):
+
+    """
+    返回概率及回退概率量化后的NgramTrie
+    :param trie:
+    :param bits: 8或16
+    :return:
+    """
+
+    arrays = {}
+
+    for name, values in trie.arrays.iteritems():
+        if (name.startswith('prob_') or name.startswith('backoff_')) and not name.endswith('_codebook'):
+            arrays[name], arrays[name + '_codebook'] = quantize_values(values, bits)
+        else:
+            arrays[name] = values
+
+    return NgramTrie(trie.vocab, arrays, trie.order)
+
+
+def quantization_report(reference, quantized, clusters):
+
+    """
+    比较量化前后的打分器在一组参考聚类上的差异
+    :param reference: 未量化模型的GrammarScorer
+    :param quantized: 量化模型的GrammarScorer
+    :param clusters: 参考聚类，每个聚类为若干候选语句（词序列）
+    :return: dict(max_abs_diff, mean_abs_diff, max_rel_diff: 语法得分的差异;
+                  same_top: 得分最高的候选不变的聚类比例;
+                  same_ranking: 候选排序完全不变的聚类比例;
+                  kendall_tau: 各聚类排序一致性的平均Kendall tau)
+    """
+
+    diffs = []
+    rel_diffs = []
+    same_top = 0
+    same_ranking = 0
+    taus = []
+
+    for candidates in clusters:
+
+        expected = reference.cal_fluency_batch(candidates)
+        actual = quantized.cal_fluency_batch(candidates)
+
+        for e, a in zip(expected, actual):
+            diffs.append(abs(e - a))
+            rel_diffs.append(abs(e - a) / abs(e) if e != 0 else 0.0)
+
+        expected_order = sorted(range(len(candidates)), key=lambda i: expected[i], reverse=True)
+        actual_order = sorted(range(len(candidates)), key=lambda i: actual[i], reverse=True)
+
+        same_top += expected_order[:1] == actual_order[:1]
+        same_ranking += expected_order == actual_order
+        taus.append(_kendall_tau(expected, actual))
+
+    nb_clusters = max(len(clusters), 1)
+
+    return {
+        'max_abs_diff': max(diffs) if diffs else 0.0,
+        'mean_abs_diff': sum(diffs) / max(len(diffs), 1),
+        'max_rel_diff': max(rel_diffs) if rel_diffs else 0.0,
+        'same_top': float(same_top) / nb_clusters,
+        'same_ranking': float(same_ranking) / nb_clusters,
+        'kendall_tau': sum(taus) / max(len(taus), 1),
+    }
+
+
+def _kendall_tau(x, y):
+
+    """ 两组得分的Kendall tau（tau-a） """
+
+    n = len(x)
+    if n < 2:
+        return 1.0
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    i, j = np.triu_indices(n, 1)
+    concordance = np.sign(x[i] - x[j]) * np.sign(y[i] - y[j])
+
+    return float(concordance.sum()) / len(i)
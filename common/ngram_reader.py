@@ -0,0 +1,234 @@
+# -*- coding: utf8 -*-
+
+"""
+N元语法模型文件的读取
+
+Two formats are supported:
+
+- tsv: the historical format of GrammarScorer, one "prob<TAB>ngram<TAB>backoff"
+  line per n-gram, the backoff being optional
+- arpa: the standard ARPA format, with its \\data\\ header and \\N-grams:
+  sections
+
+Files ending with .gz or .bz2 are decompressed on the fly, and read in large
+chunks rather than line by line.
+"""
+
+import bz2
+import gzip
+import time
+from common.logger import logging
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+''' 每次读取的字节数 '''
+
+
+class NgramModelReader(object):
+
+    """
+    流式读取模型文件，迭代得到(ngram, prob, backOffProb)
+
+    For ARPA files, the n-gram counts of the \\data\\ header are available in
+    *counts* before the iteration starts, so that the storage can be
+    preallocated, and are checked against the n-grams actually read. *stats*
+    reports the amount of data read and the load throughput.
+    """
+
+    def __init__(self, modelpath, fmt='auto', chunk_size=CHUNK_SIZE):
+
+        self.modelpath = modelpath
+        ''' 模型文件路径 '''
+
+        self.chunk_size = chunk_size
+
+        self.stats = {'bytes': 0, 'lines': 0, 'ngrams': 0, 'skipped': 0, 'seconds': 0.0}
+        ''' 读取的字节数、行数、N元组个数、忽略的行数及耗时 '''
+
+        self.start_time = time.time()
+
+        self.lines = self.__iter_lines()
+
+        # 跳过开头的空行，据第一行判断格式
+        self.first_line = ''
+        for line in self.lines:
+            self.first_line = line.strip()
+            if len(self.first_line) > 0:
+                break
+
+        if fmt == 'auto':
+            fmt = 'arpa' if self.first_line == '\\data\\' else 'tsv'
+
+        if fmt not in ('tsv', 'arpa'):
+            raise ValueError('unknown ngram model format: ' + str(fmt))
+
+        self.fmt = fmt
+        ''' tsv或arpa '''
+
+        self.counts = {}
+        ''' \\data\\中声明的各阶N元组个数，仅arpa格式 '''
+
+        if self.fmt == 'arpa':
+            self.__read_arpa_header()
+
+    def __iter__(self):
+
+        if self.fmt == 'arpa':
+            entries = self.__iter_arpa_entries()
+        else:
+            entries = self.__iter_tsv_entries()
+
+        for entry in entries:
+            yield entry
+
+        self.stats['seconds'] = time.time() - self.start_time
+
+        if self.stats['skipped'] > 0:
+            logging.warn('%d malformed lines ignored in [%s]', self.stats['skipped'], self.modelpath)
+
+        logging.info('read %d ngrams from [%s] in %.2fs (%.0f ngrams/s, %.2f MB/s)',
+                     self.stats['ngrams'], self.modelpath, self.stats['seconds'],
+                     self.stats['ngrams'] / max(self.stats['seconds'], 1e-6),
+                     self.stats['bytes'] / max(self.stats['seconds'], 1e-6) / 1024 / 1024)
+
+    def __open(self):
+
+        if self.modelpath.endswith('.gz'):
+            return gzip.open(self.modelpath, 'rb')
+        elif self.modelpath.endswith('.bz2'):
+            return bz2.BZ2File(self.modelpath, 'rb')
+        else:
+            return open(self.modelpath, 'rb')
+
+    def __iter_lines(self):
+
+        """
+        按块读取文件并切分成行
+        """
+
+        with self.__open() as modelfile:
+
+            rest = ''
+
+            while True:
+
+                chunk = modelfile.read(self.chunk_size)
+                if not chunk:
+                    break
+
+                self.stats['bytes'] += len(chunk)
+
+                lines = (rest + chunk).split('\n')
+                rest = lines.pop()
+
+                self.stats['lines'] += len(lines)
+                for line in lines:
+                    yield line
+
+            if rest:
+                self.stats['lines'] += 1
+                yield rest
+
+    def __iter_tsv_entries(self):
+
+        if len(self.first_line) > 0:
+            entry = self.__parse_tsv_line(self.first_line)
+            if entry is not None:
+                yield entry
+
+        for line in self.lines:
+            entry = self.__parse_tsv_line(line.strip())
+            if entry is not None:
+                yield entry
+
+    def __parse_tsv_line(self, line):
+
+        strs = line.split('\t')
+
+        if len(strs) < 2:
+            self.stats['skipped'] += 1
+            return None
+
+        self.stats['ngrams'] += 1
+
+        if len(strs) == 3:
+            return strs[1], float(strs[0]), float(strs[2])
+
+        return strs[1], float(strs[0]), 0.0
+
+    def __read_arpa_header(self):
+
+        """
+        读取\\data\\段中的"ngram N=count"行，直到第一个N元组段
+        """
+
+        self.section = None
+
+        for line in self.lines:
+
+            line = line.strip()
+
+            if line.startswith('ngram '):
+                order, count = line[len('ngram '):].split('=')
+                self.counts[int(order)] = int(count)
+
+            elif line.startswith('\\'):
+                self.section = line
+                break
+
+        if len(self.counts) == 0:
+            raise ValueError('no ngram counts in the \\data\\ section of ' + self.modelpath)
+
+    def __iter_arpa_entries(self):
+
+        found = {}
+        section = self.section
+
+        while section is not None and section != '\\end\\':
+
+            if not (section.startswith('\\') and section.endswith('-grams:')):
+                raise ValueError('unexpected section %s in %s' % (section, self.modelpath))
+
+            order = int(section[1:-len('-grams:')])
+            found[order] = 0
+            section = None
+
+            for line in self.lines:
+
+                strs = line.split()
+
+                if len(strs) == 0:
+                    continue
+
+                if strs[0].startswith('\\'):
+                    section = line.strip()
+                    break
+
+                if len(strs) == order + 2:
+                    yield ' '.join(strs[1:order + 1]), float(strs[0]), float(strs[order + 1])
+                elif len(strs) == order + 1:
+                    yield ' '.join(strs[1:]), float(strs[0]), 0.0
+                else:
+                    self.stats['skipped'] += 1
+                    continue
+
+                found[order] += 1
+                self.stats['ngrams'] += 1
+
+        # 校验\data\中声明的个数
+        for order in sorted(set(self.counts) | set(found)):
+            if self.counts.get(order, 0) != found.get(order, 0):
+                raise ValueError('%d %d-grams declared in the \\data\\ section of %s, %d found'
+                                 % (self.counts.get(order, 0), order, self.modelpath, found.get(order, 0)))
+
+
+def read_ngram_entries(modelpath, fmt='auto'):
+
+    """
+    逐条读取模型文件中的N元组
+    :param modelpath: 模型文件路径，可以是.gz或.bz2压缩文件
+    :param fmt: tsv、arpa或auto（根据文件首行判断）
+    :return: NgramModelReader, iterator of (ngram, prob, backOffProb)
+    """
+
+    return NgramModelReader(modelpath, fmt)
@@ -0,0 +1,379 @@
+# -*- coding: utf8 -*-
+
+import numpy as np
+
+from common.bloom import BloomFilter, hash_id_columns
+
+
+class NgramTrie(object):
+
+    """
+    以整数编号存储的N元语法模型
+
+    Words are mapped to integer ids and the n-grams of each order are stored
+    in sorted arrays: the n-grams of order k + 1 starting with a given n-gram
+    of order k are contiguous, their range being given by the child offsets of
+    the order k, and they are sorted by last word id so that a lookup is one
+    binary search per order. Unigrams are indexed by word id directly.
+
+    The trie behaves as the read-only dict used by GrammarScorer, i.e. it maps
+    space-joined n-gram strings to (prob, backoff) tuples.
+    """
+
+    def __init__(self, vocab, arrays, order):
+
+        self.vocab = vocab
+        ''' 词到编号的映射，dict或提供get()的只读映射（见common.ngram_binary） '''
+
+        self.arrays = arrays
+        '''
+        各阶的数组: words_k (k > 1), prob_k, backoff_k, child_k (k < order)，
+        不存在的N元组（仅作为更高阶N元组的前缀）的prob为NaN
+        '''
+
+        self.order = order
+        ''' 最高阶数 '''
+
+        self.batch_keys = {}
+        ''' 批量查找用的各阶全局有序键: 前缀下标 * 词表大小 + 末词编号，按需生成 '''
+
+        self.blooms = {}
+        ''' 各阶N元组的布隆过滤器（见build_bloom），查找前先排除一定不存在的N元组 '''
+
+    def word_id(self, word):
+
+        """
+        返回词的编号，不在词表中返回None
+        """
+
+        return self.vocab.get(word)
+
+    def lookup(self, ids):
+
+        """
+        根据词编号序列查找N元组
+        :param ids:
+        :return: (prob, backoff)，不存在返回None
+        """
+
+        if len(ids) > self.order:
+            return None
+
+        bloom = self.blooms.get(len(ids))
+        if bloom is not None and not bloom.contains_ids(ids):
+            return None
+
+        index = ids[0]
+
+        for k in range(2, len(ids) + 1):
+
+            child = self.arrays['child_%d' % (k - 1)]
+            lo = child[index]
+            hi = child[index + 1]
+
+            words = self.arrays['words_%d' % k]
+            index = lo + words[lo:hi].searchsorted(ids[k - 1])
+
+            if index >= hi or words[index] != ids[k - 1]:
+                return None
+
+        prob = self.__values('prob_%d' % len(ids), index)
+        if prob != prob:
+            return None
+
+        return float(prob), float(self.__values('backoff_%d' % len(ids), index))
+
+    def build_bloom(self, error_rate=0.01, orders=None):
+
+        """
+        为N元组（不含占位元组）建立布隆过滤器，之后lookup中一定不存在的N元组
+        只需几次位探测即可排除，不再逐阶二分查找。打分时最高阶的查找大多不命中，
+        低阶的查找大多命中（过滤器只增加开销），故默认只过滤最高阶
+        :param error_rate: 误判率
+        :param orders: 建立过滤器的阶，默认为最高阶
+        """
+
+        if orders is None:
+            orders = [self.order]
+
+        size = len(self.arrays['prob_1'])
+        columns = [np.arange(size, dtype=np.int64)]
+
+        for k in range(1, max(orders) + 1):
+
+            if k > 1:
+                child = self.arrays['child_%d' % (k - 1)]
+                parent = np.repeat(np.arange(len(child) - 1, dtype=np.int64), np.diff(child))
+                columns = [column[parent] for column in columns] + [self.arrays['words_%d' % k].astype(np.int64)]
+
+            # 一元组的查找只是一次下标访问，不需要过滤
+            if k == 1 or k not in orders:
+                continue
+
+            prob = self.__values('prob_%d' % k, slice(None))
+            present = prob == prob
+
+            bloom = BloomFilter(int(np.count_nonzero(present)), error_rate)
+            bloom.add_hashes(*hash_id_columns([column[present] for column in columns]))
+            self.blooms[k] = bloom
+
+    def lookup_words(self, words):
+
+        """
+        根据词序列查找N元组，不构造N元组字符串
+        :param words:
+        :return: (prob, backoff)，不存在返回None
+        """
+
+        ids = []
+        for word in words:
+            i = self.vocab.get(word)
+            if i is None:
+                return None
+            ids.append(i)
+
+        return self.lookup(ids)
+
+    def lookup_batch(self, columns):
+
+        """
+        向量化地查找一批同阶N元组
+        :param columns: k个等长的词编号数组，第j个为各N元组的第j个词，-1表示词表外的词
+        :return: (是否存在, prob, backoff)三个数组，概率为float64
+        """
+
+        size = len(self.arrays['prob_1'])
+
+        index = np.asarray(columns[0], dtype=np.int64)
+        found = index >= 0
+
+        if len(columns) > self.order:
+            found[:] = False
+
+        for k in range(2, min(len(columns), self.order) + 1):
+
+            keys = self.__batch_keys(k)
+            words = np.asarray(columns[k - 1], dtype=np.int64)
+            found &= words >= 0
+
+            if len(keys) == 0:
+                found[:] = False
+                break
+
+            query = index * size + words
+            position = np.minimum(keys.searchsorted(query), len(keys) - 1)
+            found &= keys[position] == query
+            index = position
+
+        k = min(len(columns), self.order)
+        index = np.where(found, index, 0)
+
+        prob = self.__values('prob_%d' % k, index).astype(np.float64)
+        backoff = self.__values('backoff_%d' % k, index).astype(np.float64)
+        found &= prob == prob
+
+        return found, prob, backoff
+
+    def __values(self, name, index):
+
+        """
+        读取概率数组，量化存储时（见common.ngram_quantize）经码本解码
+        """
+
+        values = self.arrays[name][index]
+
+        codebook = self.arrays.get(name + '_codebook')
+        if codebook is not None:
+            values = codebook[values]
+
+        return values
+
+    def __batch_keys(self, k):
+
+        keys = self.batch_keys.get(k)
+
+        if keys is None:
+            child = self.arrays['child_%d' % (k - 1)]
+            parent = np.repeat(np.arange(len(child) - 1, dtype=np.int64), np.diff(child))
+            keys = parent * len(self.arrays['prob_1']) + self.arrays['words_%d' % k]
+            self.batch_keys[k] = keys
+
+        return keys
+
+    def nbytes(self):
+
+        """
+        返回各数组占用的字节数（不含词表）
+        """
+
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def __contains__(self, ngram):
+
+        return self.lookup_words(ngram.split(' ')) is not None
+
+    def __getitem__(self, ngram):
+
+        entry = self.lookup_words(ngram.split(' '))
+
+        if entry is None:
+            raise KeyError(ngram)
+
+        return entry
+
+    def __len__(self):
+
+        count = 0
+        for k in range(1, self.order + 1):
+            prob = self.__values('prob_%d' % k, slice(None))
+            count += int(np.count_nonzero(prob == prob))
+
+        return count
+
+
+class NgramTrieBuilder(object):
+
+    """
+    逐条添加N元组，最后一次性排序生成NgramTrie
+
+    N-grams may be added in any order. When an n-gram is added several times
+    the last one wins, as with a dict.
+    """
+
+    def __init__(self, dtype='float32', counts=None, bits=None):
+
+        self.dtype = dtype
+        ''' 概率数组的类型，float32减半内存，float64与dict存储得分完全一致 '''
+
+        self.bits = bits
+        ''' 不为None时将概率及回退概率量化为8或16位编码（见common.ngram_quantize） '''
+
+        self.counts = counts or {}
+        ''' 预先知道的各阶N元组个数（如ARPA文件的\\data\\段），用于预分配数组 '''
+
+        self.words = []
+        self.vocab = {}
+
+        self.columns = {}
+        ''' 各阶的[词编号矩阵, 概率, 回退概率, 添加顺序, 已用行数] '''
+
+        self.count = 0
+
+    def add(self, ngram, prob, backoff=0.0):
+
+        ids = []
+        for word in ngram.split(' '):
+            i = self.vocab.get(word)
+            if i is None:
+                i = len(self.words)
+                self.vocab[word] = i
+                self.words.append(word)
+            ids.append(i)
+
+        k = len(ids)
+        columns = self.columns.get(k)
+        if columns is None:
+            columns = self.columns[k] = self.__allocate(k, max(self.counts.get(k, 0), 1024))
+        elif columns[4] == len(columns[1]):
+            # 容量不足时加倍
+            columns = self.columns[k] = self.__grow(columns, 2 * len(columns[1]))
+
+        n = columns[4]
+        columns[0][n] = ids
+        columns[1][n] = prob
+        columns[2][n] = backoff
+        columns[3][n] = self.count
+        columns[4] = n + 1
+
+        self.count += 1
+
+    def __allocate(self, k, capacity):
+
+        return [np.empty((capacity, k), dtype=np.int32), np.empty(capacity),
+                np.empty(capacity), np.empty(capacity, dtype=np.int_), 0]
+
+    def __grow(self, columns, capacity):
+
+        grown = self.__allocate(columns[0].shape[1], capacity)
+        for j in range(4):
+            grown[j][:columns[4]] = columns[j][:columns[4]]
+        grown[4] = columns[4]
+
+        return grown
+
+    def build(self):
+
+        trie = self.__build('float64' if self.bits else self.dtype)
+
+        if self.bits:
+            from common.ngram_quantize import quantize_trie
+            trie = quantize_trie(trie, self.bits)
+
+        return trie
+
+    def __build(self, dtype):
+
+        order = max(self.columns) if self.columns else 1
+        size = len(self.words)
+
+        levels = {}
+        for k in range(1, order + 1):
+            if k in self.columns:
+                ids, probs, backoffs, positions, n = self.columns[k]
+                levels[k] = ([ids[:n, j] for j in range(k)], probs[:n], backoffs[:n], positions[:n])
+            else:
+                levels[k] = ([np.zeros(0, dtype=np.int32) for _ in range(k)],
+                             np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int_))
+
+        # 1. 高阶N元组的前缀作为占位元组加入低一阶（添加顺序为-1，去重时让位于真实元组）
+        for k in range(order, 2, -1):
+            ids_columns, _, _, _ = levels[k]
+            lower_columns, probs, backoffs, positions = levels[k - 1]
+            n = len(ids_columns[0])
+            levels[k - 1] = ([np.concatenate((lower_columns[j], ids_columns[j])) for j in range(k - 1)],
+                             np.concatenate((probs, np.full(n, np.nan))),
+                             np.concatenate((backoffs, np.zeros(n))),
+                             np.concatenate((positions, np.full(n, -1, dtype=np.int_))))
+
+        arrays = {}
+
+        # 2. 一元组直接以词编号为下标
+        ids_columns, probs, backoffs, positions = levels[1]
+        ranking = np.argsort(positions, kind='mergesort')
+        arrays['prob_1'] = np.full(size, np.nan, dtype=dtype)
+        arrays['backoff_1'] = np.zeros(size, dtype=dtype)
+        arrays['prob_1'][ids_columns[0][ranking]] = probs[ranking]
+        arrays['backoff_1'][ids_columns[0][ranking]] = backoffs[ranking]
+
+        # 3. 逐阶排序，键为(前缀在低一阶中的下标, 末词编号)
+        keys = {1: np.arange(size, dtype=np.int64)}
+        parents = {}
+        for k in range(2, order + 1):
+
+            ids_columns, probs, backoffs, positions = levels[k]
+
+            parent = ids_columns[0].astype(np.int64)
+            for j in range(2, k):
+                parent = keys[j].searchsorted(parent * size + ids_columns[j - 1])
+
+            key = parent * size + ids_columns[k - 1]
+            ranking = np.lexsort((positions, key))
+            key = key[ranking]
+
+            # 重复的N元组保留最后添加的
+            keep = np.ones(len(key), dtype=bool)
+            keep[:-1] = key[:-1] != key[1:]
+            ranking = ranking[keep]
+
+            keys[k] = key[keep]
+            parents[k] = parent[ranking]
+            arrays['words_%d' % k] = ids_columns[k - 1][ranking].astype(np.int32)
+            arrays['prob_%d' % k] = probs[ranking].astype(dtype)
+            arrays['backoff_%d' % k] = backoffs[ranking].astype(dtype)
+
+        # 4. 各阶子元组在高一阶中的起止位置
+        for k in range(1, order):
+            n = len(keys[k])
+            arrays['child_%d' % k] = parents[k + 1].searchsorted(np.arange(n + 1), 'left').astype(np.int64)
+
+        return NgramTrie(dict(self.vocab), arrays, order)
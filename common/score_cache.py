@@ -0,0 +1,221 @@
+# -*- coding: utf8 -*-
+
+"""
+语言模型得分的持久缓存
+
+Parameter sweeps rerun the compression of the same corpus many times, and
+rescore the same trigrams and candidate sentences on every run. A
+ScoreCache keeps these scores in a local SQLite file across the runs.
+
+Every score is stored under the fingerprint of the model that computed it:
+the fingerprint of the model file (see model_fingerprint: its size,
+modification time and leading and trailing bytes) combined with the scorer
+settings that change the scores. When a model file changes, the scores
+computed from its previous versions are deleted on open. The scores of the
+current fingerprint are loaded into memory, so a lookup costs one dict
+access; new scores are buffered and written in batches by flush().
+
+The file may be shared by several processes, each writing its own scores.
+After a fork the child opens its own connection and leaves the buffered
+scores of the parent to the parent.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+
+from common.logger import logging
+
+
+SAMPLE_SIZE = 1024 * 1024
+''' 计算指纹时读取的模型文件首尾字节数 '''
+
+FLUSH_SIZE = 10000
+''' 缓冲的新得分达到该数量时自动写入 '''
+
+
+def model_fingerprint(modelpath):
+
+    """
+    计算模型文件的指纹
+    :param modelpath: 模型文件路径
+    :return: 十六进制字符串
+    """
+
+    digest = hashlib.sha1()
+
+    stat = os.stat(modelpath)
+    digest.update('%d:%d' % (stat.st_size, int(stat.st_mtime * 1000)))
+
+    with open(modelpath, 'rb') as modelfile:
+        digest.update(modelfile.read(SAMPLE_SIZE))
+        if stat.st_size > SAMPLE_SIZE:
+            modelfile.seek(max(SAMPLE_SIZE, stat.st_size - SAMPLE_SIZE))
+            digest.update(modelfile.read(SAMPLE_SIZE))
+
+    return digest.hexdigest()
+
+
+def sentence_key(tokens):
+
+    """
+    语句（词序列）的缓存键
+    :param tokens:
+    :return:
+    """
+
+    return hashlib.sha1(' '.join(tokens)).hexdigest()
+
+
+class ScoreCache(object):
+
+    """
+    基于SQLite的三元组及语句得分缓存
+    """
+
+    NGRAM = 0
+    SENTENCE = 1
+
+    def __init__(self, path, modelpath, settings=()):
+
+        self.path = path
+        ''' SQLite文件路径 '''
+
+        self.modelpath = os.path.abspath(modelpath)
+        ''' 模型文件路径 '''
+
+        self.file_fingerprint = model_fingerprint(modelpath)
+        ''' 模型文件的指纹，同一路径下其它文件指纹的得分在打开时删除 '''
+
+        self.fingerprint = hashlib.sha1(self.file_fingerprint + repr(tuple(settings))).hexdigest()
+        ''' 模型文件及影响得分的设置（存储方式、量化位数等）的指纹，得分按此存储 '''
+
+        self.ngrams = {}
+        ''' (w1, w2, w3) -> 三元组得分 '''
+
+        self.sentences = {}
+        ''' sentence_key -> 语句得分 '''
+
+        self.pending = []
+        ''' 尚未写入的(kind, key, score) '''
+
+        self.pid = None
+        self.connection = None
+
+        self.__load()
+
+    def get_ngram(self, key):
+
+        return self.ngrams.get(key)
+
+    def put_ngram(self, key, score):
+
+        self.ngrams[key] = score
+        self.__append(self.NGRAM, ' '.join(key), score)
+
+    def get_sentence(self, key):
+
+        return self.sentences.get(key)
+
+    def put_sentence(self, key, score):
+
+        self.sentences[key] = score
+        self.__append(self.SENTENCE, key, score)
+
+    def flush(self):
+
+        """
+        将缓冲的新得分写入文件
+        """
+
+        if len(self.pending) == 0:
+            return
+
+        connection = self.__connect()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)',
+                                   ((self.fingerprint, kind, key, score) for kind, key, score in self.pending))
+
+        self.pending = []
+
+    def close(self):
+
+        self.flush()
+
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+
+    def __getstate__(self):
+
+        # 连接不能序列化，反序列化后按需重新连接；内存中的得分随之复制
+        state = dict(self.__dict__)
+        state['connection'] = None
+        state['pid'] = None
+        state['pending'] = []
+
+        return state
+
+    def __append(self, kind, key, score):
+
+        self.pending.append((kind, key, score))
+
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def __connect(self):
+
+        """
+        返回本进程的连接，fork得到的子进程重新连接，父进程缓冲的得分由父进程写入
+        """
+
+        if self.pid != os.getpid():
+
+            if self.pid is not None:
+                self.pending = []
+
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.text_factory = str
+            self.pid = os.getpid()
+
+        return self.connection
+
+    def __load(self):
+
+        start_time = time.time()
+
+        connection = self.__connect()
+
+        with connection:
+
+            connection.execute('CREATE TABLE IF NOT EXISTS models '
+                               '(fingerprint TEXT PRIMARY KEY, modelpath TEXT, file_fingerprint TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS scores '
+                               '(fingerprint TEXT, kind INTEGER, key TEXT, score REAL, '
+                               'PRIMARY KEY (fingerprint, kind, key))')
+
+            # 模型文件已改变：删除其旧指纹下的得分
+            stale = [row[0] for row in connection.execute(
+                'SELECT fingerprint FROM models WHERE modelpath = ? AND file_fingerprint != ?',
+                (self.modelpath, self.file_fingerprint))]
+
+            for fingerprint in stale:
+                connection.execute('DELETE FROM scores WHERE fingerprint = ?', (fingerprint,))
+                connection.execute('DELETE FROM models WHERE fingerprint = ?', (fingerprint,))
+
+            if stale:
+                logging.info('ngram model[%s] changed, %d cached score sets invalidated', self.modelpath, len(stale))
+
+            connection.execute('INSERT OR REPLACE INTO models VALUES (?, ?, ?)',
+                               (self.fingerprint, self.modelpath, self.file_fingerprint))
+
+        for kind, key, score in connection.execute(
+                'SELECT kind, key, score FROM scores WHERE fingerprint = ?', (self.fingerprint,)):
+            if kind == self.NGRAM:
+                self.ngrams[tuple(key.split(' '))] = score
+            else:
+                self.sentences[key] = score
+
+        logging.info('loaded %d ngram and %d sentence scores from cache[%s] in %.2fs',
+                     len(self.ngrams), len(self.sentences), self.path, time.time() - start_time)
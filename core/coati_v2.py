@@ -30,6 +30,27 @@ import Queue
 import networkx as nx
 
 from common.logger import logging
+from core import graph_simplify
+
+
+def sentence_vocabulary(sentence_list, pos_separator='/'):
+    """
+    Returns the set of the words the language model is queried with when
+    compressing *sentence_list* (sentences in the WordGraph input format), i.e.
+    the lowercased tokens plus the start and end tokens of the graph. Passed
+    to GrammarScorer, it restricts the model loaded to what the compression
+    needs.
+    """
+
+    vocabulary = set(['-start-', '-end-'])
+
+    pos_separator_re = re.escape(pos_separator)
+    for sentence in sentence_list:
+        for w in sentence.split():
+            m = re.match("^(.+)" + pos_separator_re + "(.+)" + pos_separator_re + "(\d+(\.\d+)*)$", w)
+            vocabulary.add(m.group(1).lower())
+
+    return vocabulary
 
 
 class WordGraph:
@@ -96,6 +117,10 @@ class WordGraph:
 
         self.term_weight = {}
         """The weight of a given term. """
+
+        self.simplify_stats = {}
+        """ How much the word graph shrank during its simplification. """
+
         
         self.verbs = set(['VB', 'VBD', 'VBP', 'VBZ', 'VH', 'VHD', 'VHP', 'VBZ', 'VV', 'VVD', 'VVP', 'VVZ'])
         """
@@ -116,6 +141,9 @@ class WordGraph:
         # 3. 构建词图
         self.build_graph()
 
+        # 4. 简化词图，删除不可能出现在压缩结果中的边和结点
+        self.simplify_graph()
+
     def pre_process_sentences(self):
 
         """
@@ -150,6 +178,15 @@ class WordGraph:
 
             self.sentence[i] = container
 
+    def parsed_sentences(self):
+
+        """
+        返回预处理后的句子，每句为(word, pos)列表（不含首尾结点），
+        可直接交给keyphrase_reranker，免去重复切分
+        """
+
+        return [[(token, pos) for token, pos, weight in sentence[1:-1]] for sentence in self.sentence]
+
     def compute_statistics(self):
 
         """
@@ -542,6 +579,28 @@ class WordGraph:
         for node1, node2 in self.graph.edges_iter():
             self.graph.add_edge(node1, node2, weight=self.cal_edge_weight(node1, node2))
 
+    def simplify_graph(self):
+        """
+        简化词图：删除权重为0的边（剪枝广度搜索不会经过这些边），以及不可能
+        出现在长度不小于8（包含起始和终止结点）的路径上的结点
+        :return: 简化前后词图的规模
+        """
+
+        start = (self.start + self.sep + self.start, 0)
+        stop = (self.stop + self.sep + self.stop, 0)
+
+        self.simplify_stats = graph_simplify.prune_graph(self.graph, start, stop, 8,
+                                                         lambda node: 1, drop_zero_weight=True)
+
+        logging.info('graph simplified: nodes[%d -> %d] edges[%d -> %d] zero weight edges[%d] '
+                     'unreachable nodes[%d] too short nodes[%d]',
+                     self.simplify_stats['nodes_before'], self.simplify_stats['nodes_after'],
+                     self.simplify_stats['edges_before'], self.simplify_stats['edges_after'],
+                     self.simplify_stats['zero_weight_edges'], self.simplify_stats['unreachable_nodes'],
+                     self.simplify_stats['too_short_nodes'])
+
+        return self.simplify_stats
+
     def __all_successors(self, succseeor_collection, key, successors):
 
         if key not in succseeor_collection:
@@ -720,62 +779,108 @@ class WordGraph:
         :return:
         """
 
-        # 进行剪枝广度搜索
-        sentences = self.__pruning_bfs(lambd, max_neighbors, queue_size)
+        # 进行剪枝广度搜索，并批量计算句子的综合得分
+        sentences = self.__score_sentences(list(self.__pruning_bfs(lambd, max_neighbors, queue_size)), lambd)
 
-        # 计算句子的综合得分
-        for i in range(len(sentences)):
+        # 按照得分从大到小进行排序，并选择指定的数目进行返回（可以考虑堆排序提升性能）
+        sentences.sort(lambda x, y : cmp(x[0], y[0]), reverse=True)
 
-            # 当前句子
-            sentence = sentences[i]
+        return sentences[0: sentence_count]
 
-            # 路径得分
-            path_weight = 0.0
-            # 句子：字符串形式
-            str_sentence = ''
+    def iter_event_guided_compress(self, lambd, max_neighbors, queue_size):
+        """
+        基于事件指导的多语句压缩（流式版本）
+        每当剪枝广度搜索得到一条完整的路径，立即计算其综合得分并返回(得分, 句子)，
+        返回顺序为路径完成的顺序，未排序
+        :param lambd:
+        :param max_neighbors:
+        :param queue_size:
+        :return: (得分, 句子)生成器
+        """
 
-            for j in range(1, len(sentence) - 2):
+        for sentence in self.__pruning_bfs(lambd, max_neighbors, queue_size):
+            yield self.__score_sentence(sentence, lambd)
 
-                # 路径得分
-                path_weight += self.graph.get_edge_data(sentence[j], sentence[j + 1])['weight']
+    def __score_sentence(self, sentence, lambd):
+        """
+        计算路径对应句子的综合得分
+        :param sentence: 路径（结点列表）
+        :param lambd:
+        :return: (综合得分, 句子)
+        """
 
-                str_sentence += sentence[j][0].split(self.sep)[0] + ' '
+        path_weight, tokens = self.__path_tokens(sentence)
 
-            # 语言模型得分
-            fluency_weight = self.grammar_scorer.cal_fluency(str_sentence) / len(re.split('\s+', str_sentence))
+        # 语言模型得分（按词数加一归一化）
+        fluency_weight = self.grammar_scorer.cal_fluency_tokens(tokens) / (len(tokens) + 1)
 
-            # 依次计算每个句子的综合得分，并选择指定数目的句子进行封装返回
-            sentences[i] = (len(sentence)/path_weight + lambd * fluency_weight, str_sentence.strip())
+        return len(sentence)/path_weight + lambd * fluency_weight, ' '.join(tokens)
 
-        # 按照得分从大到小进行排序，并选择指定的数目进行返回（可以考虑堆排序提升性能）
-        sentences.sort(lambda x, y : cmp(x[0], y[0]), reverse=True)
+    def __score_sentences(self, sentences, lambd):
+        """
+        批量计算多条路径对应句子的综合得分，语言模型得分由cal_fluency_batch
+        一次计算，结果与逐条调用__score_sentence相同
+        :param sentences: 路径列表
+        :param lambd:
+        :return: (综合得分, 句子)列表
+        """
 
-        return sentences[0: sentence_count]
+        path_tokens = [self.__path_tokens(sentence) for sentence in sentences]
+        fluencies = self.grammar_scorer.cal_fluency_batch([tokens for path_weight, tokens in path_tokens])
+
+        results = []
+        for sentence, (path_weight, tokens), fluency in zip(sentences, path_tokens, fluencies):
+            fluency_weight = fluency / (len(tokens) + 1)
+            results.append((len(sentence)/path_weight + lambd * fluency_weight, ' '.join(tokens)))
+
+        return results
+
+    def __path_tokens(self, sentence):
+        """
+        计算路径得分及路径对应的词序列
+        :param sentence: 路径（结点列表）
+        :return: (路径得分, 词序列)
+        """
+
+        # 路径得分
+        path_weight = 0.0
+        # 句子中的词
+        tokens = []
+
+        for j in range(1, len(sentence) - 2):
+
+            # 路径得分
+            path_weight += self.graph.get_edge_data(sentence[j], sentence[j + 1])['weight']
+
+            tokens.append(sentence[j][0].split(self.sep)[0])
+
+        return path_weight, tokens
 
     def __pruning_bfs(self, lambd, max_neighbors, queue_size):
         """
-        剪枝广度优先搜素
+        剪枝广度优先搜素，每搜索到一条完整的路径即返回
         :param lambd:
         :param max_neighbors:
         :param queue_size:
-        :return:
+        :return: 路径生成器
         """
 
-        # 存放搜索到的路径
-        results = []
+        # 已搜索到的路径数
+        nb_results = 0
         # 起始结点
         start = (self.start + self.sep + self.start, 0)
         # 终止结点
         stop = (self.stop + self.sep + self.stop, 0)
 
         queue = Queue.Queue(queue_size)
-        # 起始结点入栈
-        queue.put([start])
+        # 起始结点入栈，同时记录短语（不含</s>）的语言模型得分及语言模型状态
+        start_state, start_score = self.grammar_scorer.advance(self.grammar_scorer.begin(), self.start)
+        queue.put(([start], start_score, start_state))
 
         while not queue.empty():
 
             # 出队
-            phrase = queue.get()
+            phrase, open_score, state = queue.get()
 
             # 获取当前短语的最后一个单词
             node = phrase[len(phrase) - 1]
@@ -784,7 +889,8 @@ class WordGraph:
                 # 已经是最后一个结点
                 if len(phrase) >= 8:
                     # 只选择长度在8个单词以上的句子
-                    results.append(phrase)
+                    nb_results += 1
+                    yield phrase
                 continue
 
             # 将当前短语转换成字符串形式
@@ -792,21 +898,30 @@ class WordGraph:
             for nodeflag, num in phrase:
                 str_phrase += nodeflag.split(self.sep)[0] + ' '
 
-            logging.info('results size[%d] queue size[%d] phrase[%s]', len(results), queue.qsize(), str_phrase)
+            logging.info('results size[%d] queue size[%d] phrase[%s]', nb_results, queue.qsize(), str_phrase)
 
             # 获取当前结点的邻接后继结点
             pos_neighbors = self.graph.neighbors(node)
             # 每个后继结点的综合得分（考虑路径得分和语言模型得分）
             neighbor_weight = {}
+            # 扩展后的短语的语言模型得分（不含</s>）及语言模型状态
+            neighbor_open_score = {}
+            neighbor_state = {}
+            # 边的权重不为0的后继结点
+            pos_neighbors = [pos_neighbor for pos_neighbor in pos_neighbors
+                             if self.graph.get_edge_data(node, pos_neighbor)['weight'] != 0]
+            # 由短语的状态一次计算所有后继结点的语言模型得分增量
+            expansions = self.grammar_scorer.expand(state, [pos_neighbor[0].split(self.sep)[0]
+                                                           for pos_neighbor in pos_neighbors])
             # 依次处理每个后继结点
-            for pos_neighbor in pos_neighbors:
+            for pos_neighbor, (next_state, increment, end_increment) in zip(pos_neighbors, expansions):
                 # 获取两个结点之间边的权重
                 edge_weight = self.graph.get_edge_data(node, pos_neighbor)['weight']
-                if edge_weight == 0:
-                    continue
 
-                # 计算当前结点与之前语句构成的新的语句的语言模型得分
-                fluency_weight = self.grammar_scorer.cal_fluency(str_phrase + pos_neighbor[0].split(self.sep)[0])
+                # 当前结点与之前语句构成的新的语句的语言模型得分
+                neighbor_state[pos_neighbor] = next_state
+                neighbor_open_score[pos_neighbor] = open_score + increment
+                fluency_weight = neighbor_open_score[pos_neighbor] + end_increment
 
                 # 计算综合得分
                 general_score = 1 / edge_weight + lambd * fluency_weight / (len(re.split('\s+', str_phrase)) + 1)
@@ -827,9 +942,8 @@ class WordGraph:
 
                 # 综合得分最高的max_neighbors个邻接后继结点如队列
                 new_phrase = phrase + [sort_neighbor_weight[i][0]]
-                queue.put(new_phrase)
-
-        return results
+                queue.put((new_phrase, neighbor_open_score.get(sort_neighbor_weight[i][0]),
+                           neighbor_state.get(sort_neighbor_weight[i][0])))
 
     def load_stopwords(self, path):
         """
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    graph simplify
+
+:Version:
+    0.1
+
+:Description:
+    Simplification passes run on a word graph between its construction and the
+    search of the compressions. They only remove what no search strategy could
+    use, so that every strategy explores a smaller graph.
+"""
+
+import networkx as nx
+
+
+def prune_graph(graph, start, stop, min_length, node_length, drop_zero_weight=False):
+    """
+    Removes in place the edges and the nodes of *graph* that cannot lie on a
+    start-to-end path of at least *min_length*:
+
+    - edges of weight 0 (only if *drop_zero_weight* is set)
+    - nodes not reachable from *start* or from which *stop* is not reachable
+    - nodes for which the longest start-to-end path going through them is
+      shorter than *min_length*, the length of a path being the sum of
+      *node_length(node)* over its nodes
+
+    Longest paths are computed on the condensation of the graph, each strongly
+    connected component counting as the sum of its nodes, which gives an upper
+    bound of the simple path lengths when the graph contains cycles.
+
+    Returns a dict reporting how much the graph shrank.
+    """
+
+    stats = {
+        'nodes_before': graph.number_of_nodes(),
+        'edges_before': graph.number_of_edges(),
+        'zero_weight_edges': 0,
+        'unreachable_nodes': 0,
+        'too_short_nodes': 0,
+    }
+
+    # 1. 删除权重为0的边
+    if drop_zero_weight:
+        zero_edges = [(u, v) for u, v, data in graph.edges_iter(data=True) if data.get('weight', 0) == 0]
+        graph.remove_edges_from(zero_edges)
+        stats['zero_weight_edges'] = len(zero_edges)
+
+    while True:
+
+        # 2. 删除起始结点不可达或无法到达终止结点的结点
+        reachable = nx.descendants(graph, start) & nx.ancestors(graph, stop)
+        reachable.update([start, stop])
+        unreachable = [node for node in graph.nodes_iter() if node not in reachable]
+        graph.remove_nodes_from(unreachable)
+        stats['unreachable_nodes'] += len(unreachable)
+
+        # 3. 删除经过其的最长路径仍小于min_length的结点
+        too_short = [node for node in _too_short_nodes(graph, min_length, node_length)
+                     if node != start and node != stop]
+        graph.remove_nodes_from(too_short)
+        stats['too_short_nodes'] += len(too_short)
+
+        if len(unreachable) == 0 and len(too_short) == 0:
+            break
+
+    stats['nodes_after'] = graph.number_of_nodes()
+    stats['edges_after'] = graph.number_of_edges()
+
+    return stats
+
+
+def _too_short_nodes(graph, min_length, node_length):
+    """
+    Returns the nodes whose longest path through them (upper bound computed on
+    the condensation of the graph) is shorter than *min_length*.
+    """
+
+    condensed = nx.condensation(graph)
+
+    # 每个强连通分量的长度
+    length = {}
+    for component in condensed.nodes_iter():
+        length[component] = sum(node_length(node) for node in condensed.node[component]['members'])
+
+    order = list(nx.topological_sort(condensed))
+
+    # 以各分量结尾的最长前缀长度
+    before = {}
+    for component in order:
+        previous = [before[p] for p in condensed.predecessors_iter(component)]
+        before[component] = length[component] + (max(previous) if previous else 0)
+
+    # 以各分量开头的最长后缀长度
+    after = {}
+    for component in reversed(order):
+        following = [after[s] for s in condensed.successors_iter(component)]
+        after[component] = length[component] + (max(following) if following else 0)
+
+    nodes = []
+    for component in order:
+        if before[component] + after[component] - length[component] < min_length:
+            nodes.extend(condensed.node[component]['members'])
+
+    return nodes
+
+
+def contract_chains(graph, start, stop, node_data=None):
+    """
+    Returns a contracted copy of *graph* in which every maximal chain of nodes
+    having exactly one predecessor and one successor is collapsed into a single
+    super-node. A super-node is identified by the first node of its chain and
+    each node of the contracted graph has the following attributes:
+
+    - members: the list of the original nodes it stands for
+    - cost: the summed weight of the edges inside the chain
+
+    plus the attributes returned by *node_data(members)*, if given. The weight
+    of an edge entering a super-node is the weight of the original edge plus
+    the cost of the chain, so that path weights are preserved. The start and
+    the stop nodes are never contracted.
+    """
+
+    def is_chain_node(node):
+        return node != start and node != stop and \
+            graph.in_degree(node) == 1 and graph.out_degree(node) == 1
+
+    # 原始结点到其所在链（超级结点）的映射
+    group = {}
+    contracted = nx.DiGraph()
+
+    for node in graph.nodes_iter():
+
+        if node in group:
+            continue
+
+        # 只从链的第一个结点开始收缩
+        if is_chain_node(node) and is_chain_node(graph.predecessors(node)[0]):
+            continue
+
+        members = [node]
+        if is_chain_node(node):
+            successor = graph.successors(node)[0]
+            while is_chain_node(successor) and successor not in group and successor != node:
+                members.append(successor)
+                successor = graph.successors(successor)[0]
+
+        _add_super_node(graph, contracted, group, members, node_data)
+
+    # 全部由链结点构成的环，保持原状
+    for node in graph.nodes_iter():
+        if node not in group:
+            _add_super_node(graph, contracted, group, [node], node_data)
+
+    # 链之间的边：离开链的最后一个结点，进入链的第一个结点
+    for u, v, data in graph.edges_iter(data=True):
+        if v == group[v] and u == contracted.node[group[u]]['members'][-1]:
+            contracted.add_edge(group[u], v, weight=data['weight'] + contracted.node[v]['cost'])
+
+    return contracted
+
+
+def _add_super_node(graph, contracted, group, members, node_data):
+    """ Adds the super-node standing for the chain *members* to *contracted*. """
+
+    cost = 0.0
+    for i in range(1, len(members)):
+        cost += graph[members[i - 1]][members[i]]['weight']
+
+    attributes = {'members': members, 'cost': cost}
+    if node_data is not None:
+        attributes.update(node_data(members))
+
+    contracted.add_node(members[0], **attributes)
+    for member in members:
+        group[member] = members[0]
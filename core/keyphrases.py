@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    keyphrases
+
+:Version:
+    0.1
+
+:Description:
+    Keyphrase processing shared by the keyphrase rerankers (takahe and
+    coati). The clustering of the candidates finds the clusters containing
+    all the words of a keyphrase through a word -> clusters inverted index,
+    so that a keyphrase is only compared with the clusters sharing its words.
+    The keyphrases contained in a compression are found by an Aho-Corasick
+    automaton over word sequences, built once for all the compressions: a
+    compression is scanned in a single pass over its words, and keyphrases
+    only match whole words.
+"""
+
+
+def cluster_keyphrases(keyphrase_candidates, keyphrase_scores):
+    """
+    Clusters the keyphrase candidates by word overlap and removes redundancy:
+
+    - by decreasing number of words, a keyphrase joins every cluster whose
+      representative (the keyphrase that created it) contains all its words,
+      or creates a new cluster
+    - the best scored keyphrase of each cluster is selected
+    - by decreasing score, a selected keyphrase is dropped if it is a
+      substring of a previously kept one
+
+    :return: the set of the non redundant keyphrases
+    """
+
+    # Sort keyphrase candidates by length
+    descending = sorted(keyphrase_candidates,
+                        key=lambda x: len(keyphrase_candidates[x]),
+                        reverse=True)
+
+    # Clusters, and the clusters whose representative contains each word
+    clusters = {}
+    clusters_of_word = {}
+
+    # Loop over keyphrases by decreasing length
+    for keyphrase in descending:
+
+        keyphrase_words = set(keyphrase.split(' '))
+
+        # Clusters containing all the words: intersection of the clusters
+        # of each word, starting from the word in the fewest clusters
+        candidates = sorted((clusters_of_word.get(word, ()) for word in keyphrase_words), key=len)
+        found = set(candidates[0])
+        for word_clusters in candidates[1:]:
+            if not found:
+                break
+            found.intersection_update(word_clusters)
+
+        # Add keyphrase to the clusters
+        for cluster in found:
+            clusters[cluster].append(keyphrase)
+
+        # If keyphrase does not fit into any existing cluster
+        if not found:
+            clusters[keyphrase] = [keyphrase]
+            for word in keyphrase_words:
+                clusters_of_word.setdefault(word, set()).add(keyphrase)
+
+    # Find the best scored keyphrase candidate in each cluster
+    best_candidate_keyphrases = []
+    for cluster in clusters:
+        best_candidate_keyphrases.append(max(clusters[cluster], key=lambda keyphrase: keyphrase_scores[keyphrase]))
+
+    # Sort best candidate by score
+    sorted_keyphrases = sorted(best_candidate_keyphrases,
+                               key=lambda keyphrase: keyphrase_scores[keyphrase],
+                               reverse=True)
+
+    # Remove redundancy in cluster best candidates: the kept keyphrases are
+    # joined by a character that no keyphrase contains, so that one substring
+    # search covers them all
+    non_redundant_keyphrases = set()
+    kept = ''
+    for keyphrase in sorted_keyphrases:
+        if not non_redundant_keyphrases or keyphrase not in kept:
+            non_redundant_keyphrases.add(keyphrase)
+            kept += '\x00' + keyphrase
+
+    return non_redundant_keyphrases
+
+
+class KeyphraseMatcher:
+    """
+    Aho-Corasick automaton whose symbols are words, finding which keyphrases
+    (word sequences) occur in a sequence of words.
+    """
+
+    #-T-----------------------------------------------------------------------T-
+    def __init__(self, keyphrases):
+
+        self.transitions = [{}]
+        """ The outgoing transitions of each state, word -> state. State 0 is
+        the root. """
+
+        self.fail = [0]
+        """ The state of the longest proper suffix of each state that is also
+        a prefix of a keyphrase. """
+
+        self.outputs = [()]
+        """ The keyphrases ending at each state, including those ending at its
+        suffix states. """
+
+        self.rank = {}
+        """ The position of each keyphrase in *keyphrases*. """
+
+        # 1. Trie of the keyphrases
+        ends = {}
+        for keyphrase in keyphrases:
+            self.rank[keyphrase] = len(self.rank)
+            state = 0
+            for word in keyphrase.split(' '):
+                next_state = self.transitions[state].get(word)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions[state][word] = next_state
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = next_state
+            ends.setdefault(state, []).append(keyphrase)
+
+        for state, matched in ends.iteritems():
+            self.outputs[state] = tuple(matched)
+
+        # 2. Failure links, breadth first
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            for word, next_state in self.transitions[state].iteritems():
+                queue.append(next_state)
+
+                fail = self.fail[state]
+                while fail and word not in self.transitions[fail]:
+                    fail = self.fail[fail]
+                fail = self.transitions[fail].get(word, 0)
+
+                self.fail[next_state] = fail
+                self.outputs[next_state] += self.outputs[fail]
+    #-B-----------------------------------------------------------------------B-
+
+
+    #-T-----------------------------------------------------------------------T-
+    def matches(self, words):
+        """
+        Returns the keyphrases occurring in the sequence *words*, found in
+        one pass over the words, in the order they were given to the
+        constructor.
+        """
+
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+
+        found = set()
+        state = 0
+
+        for word in words:
+            while state and word not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(word, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+
+        return sorted(found, key=self.rank.get)
+    #-B-----------------------------------------------------------------------B-
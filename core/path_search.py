@@ -0,0 +1,497 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    path search
+
+:Version:
+    0.1
+
+:Description:
+    Search helpers shared by the k-shortest paths engines of takahe.word_graph
+    and coati.WordGraph. The word graph object given to the functions below
+    must provide the ``graph``, ``sep``, ``verbs`` and ``nb_words`` attributes.
+"""
+
+import bisect
+import cPickle
+import logging
+import re
+import tempfile
+
+
+def node_counters(wordgraph, node):
+    """
+    Returns the constraint counters of a single node as a [number of verbs,
+    number of words (punctuation marks excluded), parentheses balance,
+    number of quotation marks] list.
+    """
+
+    word, tag = node[0].split(wordgraph.sep)
+
+    counters = [0, 0, 0, 0]
+    if tag in wordgraph.verbs:
+        counters[0] += 1
+    if not re.search('(?u)^\W$', word):
+        counters[1] += 1
+    elif word == '(':
+        counters[2] -= 1
+    elif word == ')':
+        counters[2] += 1
+    elif word == '"':
+        counters[3] += 1
+
+    return counters
+
+
+def chain_data(wordgraph, members):
+    """
+    Precomputes the attributes of a super-node standing for the chain of nodes
+    *members* (see graph_simplify.contract_chains): its summed constraint
+    counters and its words.
+    """
+
+    counters = [0, 0, 0, 0]
+    for node in members:
+        for i, count in enumerate(node_counters(wordgraph, node)):
+            counters[i] += count
+
+    return {'counters': counters,
+            'words': [node[0].split(wordgraph.sep)[0] for node in members]}
+
+
+def check_path_constraints(wordgraph, nodes, graph=None):
+    """
+    Checks the constraints of a candidate compression, *nodes* being the nodes
+    of the path without the start and the end nodes:
+
+    1. the path contains at least one verb
+    2. the path contains at least nb_words words (punctuation marks excluded)
+    3. parentheses and quotation marks are paired
+
+    Nodes of a contracted *graph* use their precomputed counters. Returns the
+    raw sentence of the path (used for removing duplicates) if the constraints
+    are satisfied, None otherwise.
+    """
+
+    nb_verbs = 0
+    length = 0
+    paired_parentheses = 0
+    quotation_mark_number = 0
+    words = []
+
+    for node in nodes:
+
+        if graph is not None and 'counters' in graph.node[node]:
+            counters = graph.node[node]['counters']
+            words.extend(graph.node[node]['words'])
+        else:
+            counters = node_counters(wordgraph, node)
+            words.append(node[0].split(wordgraph.sep)[0])
+
+        nb_verbs += counters[0]
+        length += counters[1]
+        paired_parentheses += counters[2]
+        quotation_mark_number += counters[3]
+
+    if nb_verbs > 0 and \
+        length >= wordgraph.nb_words and \
+        paired_parentheses == 0 and \
+        (quotation_mark_number % 2) == 0:
+        return ' '.join(words)
+
+    return None
+
+
+class BoundedFrontier:
+
+    """
+    The ordered label container of the k-shortest paths algorithms, i.e. a
+    sorted list of (weight, node, id) labels together with the path of each
+    label. Its size can be capped with *max_size*; when the cap is exceeded the
+    *policy* decides what happens:
+
+    - 'evict' drops the worst labels, like a beam
+    - 'spill' moves the worst half of the labels to a temporary file, as a
+      sorted run which is loaded back as soon as it holds the best label.
+      The file is cut back when its last runs are loaded back, and compacted
+      when less than half of it still holds runs, so that it stays within
+      twice the size of the labels currently spilled
+
+    Without a cap the container behaves exactly as the original sorted list.
+    The number of evicted, spilled and reloaded labels is kept in self.stats,
+    and close() logs a warning if labels were evicted, since the search may
+    then have missed some of the k best paths.
+    """
+
+    def __init__(self, max_size=None, policy='evict'):
+
+        if policy not in ('evict', 'spill'):
+            raise ValueError('unknown frontier policy: %s' % policy)
+
+        self.max_size = max_size
+        """ The maximal number of labels kept in memory, None for no limit. """
+
+        self.policy = policy
+        """ What to do with the worst labels when max_size is exceeded. """
+
+        self.labels = []
+        """ The labels kept in memory, sorted. """
+
+        self.paths = {}
+        """ The path of each label kept in memory. """
+
+        self.runs = []
+        """
+        The spilled runs as (first label, offset, number of labels, number of
+        bytes) tuples.
+        """
+
+        self.spill_file = None
+        """ The temporary file holding the spilled runs. """
+
+        self.stats = {'policy': policy, 'max_frontier': max_size,
+                      'evictions': 0, 'spilled': 0, 'reloaded': 0, 'compactions': 0}
+        """ The frontier statistics. """
+
+    def __len__(self):
+        return len(self.labels) + sum(run[2] for run in self.runs)
+
+    def push(self, label, path):
+        """ Adds a label and its path to the frontier. """
+
+        bisect.insort(self.labels, label)
+        self.paths[label] = path
+
+        if self.max_size is not None and len(self.labels) > self.max_size:
+            if self.policy == 'evict':
+                del self.paths[self.labels.pop()]
+                self.stats['evictions'] += 1
+            else:
+                self.__spill()
+
+    def pop(self):
+        """ Removes the best label from the frontier, returns (label, path). """
+
+        # Load back the run holding the best label
+        if len(self.runs) > 0:
+            best_run = min(self.runs)
+            if len(self.labels) == 0 or best_run[0] < self.labels[0]:
+                self.__reload(best_run)
+
+        label = self.labels.pop(0)
+        return label, self.paths.pop(label)
+
+    def close(self):
+        """
+        Releases the temporary file of the spilled runs, warns if labels were
+        evicted.
+        """
+
+        if self.stats['evictions'] > 0:
+            logging.warning('frontier capped at %d labels: %d labels evicted, '
+                            'the k best paths may be incomplete',
+                            self.max_size, self.stats['evictions'])
+
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.runs = []
+
+    def __spill(self):
+
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix='frontier_')
+
+        # The worst half is written as a sorted run at the end of the file
+        half = max(len(self.labels) // 2, 1)
+        cold = self.labels[half:]
+        del self.labels[half:]
+
+        self.spill_file.seek(0, 2)
+        offset = self.spill_file.tell()
+        cPickle.dump([(label, self.paths.pop(label)) for label in cold],
+                     self.spill_file, cPickle.HIGHEST_PROTOCOL)
+
+        self.runs.append((cold[0], offset, len(cold), self.spill_file.tell() - offset))
+        self.stats['spilled'] += len(cold)
+
+    def __reload(self, run):
+
+        self.runs.remove(run)
+        self.spill_file.seek(run[1])
+
+        for label, path in cPickle.load(self.spill_file):
+            bisect.insort(self.labels, label)
+            self.paths[label] = path
+        self.stats['reloaded'] += run[2]
+
+        self.__release_space()
+
+        if self.max_size is not None and len(self.labels) > self.max_size:
+            self.__spill()
+
+    def __release_space(self):
+        """ Gives back the space of the runs loaded back. """
+
+        # Cut the file after the last run still spilled
+        end = max([run[1] + run[3] for run in self.runs] or [0])
+        self.spill_file.truncate(end)
+
+        # Copy the runs to a new file when most of the file is dead space
+        live = sum(run[3] for run in self.runs)
+        if end > 2 * live:
+            compacted = tempfile.TemporaryFile(prefix='frontier_')
+            runs = []
+            for run in sorted(self.runs, key=lambda run: run[1]):
+                self.spill_file.seek(run[1])
+                runs.append((run[0], compacted.tell(), run[2], run[3]))
+                compacted.write(self.spill_file.read(run[3]))
+
+            self.spill_file.close()
+            self.spill_file = compacted
+            self.runs = runs
+            self.stats['compactions'] += 1
+
+
+def iter_shortest_paths(wordgraph, start, end, graph=None, max_frontier=None, frontier_policy='evict'):
+    """
+    Generator version of the k-shortest paths algorithm. Paths reaching the
+    end node are pushed back into the ordered label container instead of being
+    collected directly, so that (path, weight) tuples are yielded in
+    nondecreasing weight order as soon as they are confirmed. Paths violating
+    the constraints are never pushed, duplicate sentences are only yielded
+    once (with their smallest weight). The search runs on *graph* if given
+    (e.g. a contracted word graph), on the word graph otherwise. The size of
+    the label container can be capped (see BoundedFrontier), its statistics
+    are kept in wordgraph.search_stats.
+    """
+
+    if graph is None:
+        graph = wordgraph.graph
+
+    # Initializing the label and path container
+    orderedX = BoundedFrontier(max_frontier, frontier_policy)
+    orderedX.push((0, start, 0), [start])
+    wordgraph.search_stats = orderedX.stats
+
+    # Initialize the visited container
+    visited = {start: 0}
+
+    # Sentences already yielded
+    sentence_container = set()
+
+    try:
+        while len(orderedX) > 0:
+
+            # Searching for the shortest distance in orderedX
+            shortest, shortestpath = orderedX.pop()
+
+            # A confirmed path, no label left can be shorter
+            if shortest[1] == end:
+                raw_sentence = check_path_constraints(wordgraph, shortestpath[1:-1], graph)
+                if raw_sentence not in sentence_container:
+                    sentence_container.add(raw_sentence)
+                    yield shortestpath, float(shortest[0])
+                continue
+
+            # Iterating over the accessible nodes
+            for node in graph.neighbors(shortest[1]):
+
+                # To avoid loops
+                if node in shortestpath:
+                    continue
+
+                # Check the constraints before pushing a complete path
+                if node == end and \
+                    check_path_constraints(wordgraph, shortestpath[1:], graph) is None:
+                    continue
+
+                # Compute the weight to node
+                w = shortest[0] + graph[shortest[1]][node]['weight']
+
+                # test if node has already been visited
+                if node in visited:
+                    visited[node] += 1
+                else:
+                    visited[node] = 0
+
+                # Add the node to orderedX
+                orderedX.push((w, node, visited[node]), shortestpath + [node])
+
+    finally:
+        orderedX.close()
+
+
+def iter_bidirectional_paths(wordgraph, start, end, graph=None):
+    """
+    Bidirectional (meet-in-the-middle) version of iter_shortest_paths. Partial
+    paths are expanded best-first from the start node along the edges and from
+    the end node against the edges, always on the side with the smaller
+    frontier. Each time a partial path is extended over an edge, it is joined
+    with the partial paths of the other side settled at the end of that edge,
+    as long as the joined path stays simple and meets the constraints, checked
+    from the counters carried by both halves. Edge weights being additive, a
+    joined path is confirmed once its weight is not greater than the sum of
+    the best weights of both frontiers, so that (path, weight) tuples are
+    yielded in nondecreasing weight order.
+    """
+
+    if graph is None:
+        graph = wordgraph.graph
+
+    # The forward and backward label containers
+    frontiers = (BoundedFrontier(), BoundedFrontier())
+    frontiers[0].push((0, start, 0), ((start,), [0, 0, 0, 0]))
+    frontiers[1].push((0, end, 0), ((end,), [0, 0, 0, 0]))
+
+    # Settled partial paths, i.e. (weight, path, counters) tuples, by node:
+    # forward ones ending at the node, backward ones starting at it
+    settled = ({}, {})
+
+    # Initialize the visited containers
+    visited = ({start: 0}, {end: 0})
+
+    # Joined paths waiting for confirmation, as (weight, path) tuples
+    candidates = []
+    joined = set()
+
+    # Sentences already yielded
+    sentence_container = set()
+
+    while True:
+
+        top = [frontier.labels[0][0] if len(frontier) > 0 else None for frontier in frontiers]
+
+        # Confirm the joined paths that no unsettled path can beat
+        while len(candidates) > 0 and \
+            (None in top or candidates[0][0] <= top[0] + top[1]):
+
+            weight, path = candidates.pop(0)
+            raw_sentence = check_path_constraints(wordgraph, path[1:-1], graph)
+            if raw_sentence not in sentence_container:
+                sentence_container.add(raw_sentence)
+                yield list(path), float(weight)
+
+        if None in top:
+            break
+
+        # Expand the smaller frontier (both roots are settled first)
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        if len(settled[1]) == 0:
+            side = 1
+        if len(settled[0]) == 0:
+            side = 0
+
+        (weight, node, id), (path, counters) = frontiers[side].pop()
+        settled[side].setdefault(node, []).append((weight, path, counters))
+
+        nodes = set(path)
+
+        if side == 0:
+            neighbors = graph.successors(node)
+        else:
+            neighbors = graph.predecessors(node)
+
+        for neighbor in neighbors:
+
+            # To avoid loops
+            if neighbor in nodes:
+                continue
+
+            if side == 0:
+                w = weight + graph[node][neighbor]['weight']
+            else:
+                w = weight + graph[neighbor][node]['weight']
+
+            # Join with the settled partial paths of the other side
+            for other_weight, other_path, other_counters in settled[1 - side].get(neighbor, []):
+
+                if any(n in nodes for n in other_path):
+                    continue
+
+                if side == 0:
+                    full_path = path + other_path
+                else:
+                    full_path = other_path + path
+
+                total = [counters[i] + other_counters[i] for i in range(4)]
+                if full_path in joined or not _check_counters(wordgraph, total):
+                    continue
+
+                joined.add(full_path)
+                bisect.insort(candidates, (w + other_weight, full_path))
+
+            # The roots are never pushed again
+            if neighbor == start or neighbor == end:
+                continue
+
+            neighbor_counters = list(counters)
+            for i, count in enumerate(_node_counters(wordgraph, graph, neighbor)):
+                neighbor_counters[i] += count
+
+            # test if node has already been visited
+            if neighbor in visited[side]:
+                visited[side][neighbor] += 1
+            else:
+                visited[side][neighbor] = 0
+
+            if side == 0:
+                new_path = path + (neighbor,)
+            else:
+                new_path = (neighbor,) + path
+
+            frontiers[side].push((w, neighbor, visited[side][neighbor]), (new_path, neighbor_counters))
+
+
+def _node_counters(wordgraph, graph, node):
+    """ Constraint counters of a node, precomputed for contracted nodes. """
+
+    if 'counters' in graph.node[node]:
+        return graph.node[node]['counters']
+    return node_counters(wordgraph, node)
+
+
+def _check_counters(wordgraph, counters):
+    """ Checks the constraints of check_path_constraints on summed counters. """
+
+    return counters[0] > 0 and \
+        counters[1] >= wordgraph.nb_words and \
+        counters[2] == 0 and \
+        (counters[3] % 2) == 0
+
+
+def iter_compression(wordgraph, contract=False, max_frontier=None, frontier_policy='evict',
+                     bidirectional=False):
+    """
+    Generator version of get_compression, yields (cummulative score, path)
+    tuples, path being a list of (word, POS) tuples, smaller scores first. If
+    *contract* is set, the search runs on the contracted word graph and paths
+    are expanded back to words on output. *max_frontier* and
+    *frontier_policy* cap the label container (see BoundedFrontier). If
+    *bidirectional* is set, iter_bidirectional_paths is used instead (the
+    frontier is not capped then).
+    """
+
+    start = (wordgraph.start + wordgraph.sep + wordgraph.start, 0)
+    end = (wordgraph.stop + wordgraph.sep + wordgraph.stop, 0)
+
+    graph = wordgraph.graph
+    if contract:
+        graph = wordgraph.contract_graph()
+
+    if bidirectional:
+        paths = iter_bidirectional_paths(wordgraph, start, end, graph)
+    else:
+        paths = iter_shortest_paths(wordgraph, start, end, graph, max_frontier, frontier_policy)
+
+    for nodes, weight in paths:
+
+        sentence = []
+        for node in nodes[1:-1]:
+            for member in graph.node[node].get('members', [node]):
+                word, tag = member[0].split(wordgraph.sep)
+                sentence.append((word, tag))
+
+        yield weight, sentence
@@ -105,15 +105,21 @@
     November 20, 1948. (Wikipedia, http://en.wikipedia.org/wiki/takahe)  
 """
 
-import math
 import codecs
 import os
 import re
 import sys
 import bisect
+import itertools
+from collections import Counter
 import networkx as nx
 #import matplotlib.pyplot as plt
 
+from core import path_search
+from core import graph_simplify
+from core import keyphrases
+from core import textrank
+
 #~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~
 # [ Class word_graph
 #~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~-~
@@ -175,6 +181,15 @@ class word_graph:
         
         self.term_freq = {}
         """ The frequency of a given term. """
+
+        self.simplify_stats = {}
+        """ How much the word graph shrank during its simplification. """
+
+        self.contracted_graph = None
+        """ The word graph with its unbranched chains contracted, built lazily. """
+
+        self.search_stats = {}
+        """ The frontier statistics of the last search. """
         
         self.verbs = set(['VB', 'VBD', 'VBP', 'VBZ', 'VH', 'VHD', 'VHP', 'VBZ', 'VV', 'VVD', 'VVP', 'VVZ'])
         """
@@ -194,6 +209,9 @@ class word_graph:
 
         # 3. Build the word graph
         self.build_graph()
+
+        # 4. 简化词图，删除不可能出现在压缩结果中的边和结点
+        self.simplify_graph()
     #-B-----------------------------------------------------------------------B-
 
 
@@ -234,6 +252,18 @@ class word_graph:
     #-B-----------------------------------------------------------------------B-
     
     
+    #-T-----------------------------------------------------------------------T-
+    def parsed_sentences(self):
+        """
+        Returns the input sentences as lists of (word, POS) tuples, as parsed
+        by pre_process_sentences (without the start and end tokens). Given to
+        keyphrase_reranker, they spare it a second parse of the sentences.
+        """
+
+        return [[(token, POS) for token, POS in sentence[1:-1]] for sentence in self.sentence]
+    #-B-----------------------------------------------------------------------B-
+    
+    
     #-T-----------------------------------------------------------------------T-
     def build_graph(self):
         """
@@ -593,6 +623,32 @@ class word_graph:
     #-B-----------------------------------------------------------------------B-
 
  
+    #-T-----------------------------------------------------------------------T-
+    def simplify_graph(self):
+        """
+        Removes the nodes that cannot lie on a start-to-end path containing at
+        least nb_words words (punctuation marks excluded), i.e. the nodes that
+        are not reachable from the start node, the nodes from which the end
+        node is not reachable and the nodes on too short paths only. Returns
+        the simplification statistics, also kept in self.simplify_stats.
+        """
+
+        start = (self.start+self.sep+self.start, 0)
+        stop = (self.stop+self.sep+self.stop, 0)
+
+        def node_length(node):
+            word = node[0].split(self.sep)[0]
+            if node == start or node == stop or re.search('(?u)^\W$', word):
+                return 0
+            return 1
+
+        self.simplify_stats = graph_simplify.prune_graph(self.graph, start, stop,
+                                                         self.nb_words, node_length)
+
+        return self.simplify_stats
+    #-B-----------------------------------------------------------------------B-
+
+
     #-T-----------------------------------------------------------------------T-
     def ambiguous_nodes(self, node):
         """
@@ -742,23 +798,27 @@ class word_graph:
    
    
     #-T-----------------------------------------------------------------------T-
-    def k_shortest_paths(self, start, end, k=10):
+    def k_shortest_paths(self, start, end, k=10, max_frontier=None, frontier_policy='evict'):
         """
         Simple implementation of a k-shortest paths algorithms. Takes three
         parameters: the starting node, the ending node and the number of 
         shortest paths desired. Returns a list of k tuples (path, weight).
+
+        The size of the label container can be capped with max_frontier,
+        frontier_policy deciding whether the worst labels are evicted or
+        spilled to disk (see path_search.BoundedFrontier). The policy and the
+        number of evicted labels are reported in self.search_stats, and a
+        warning is logged when labels were evicted, as fewer than k paths may
+        then be returned.
         """
 
         # Initialize the list of shortest paths
         kshortestpaths = []
 
-        # Initializing the label container 
-        orderedX = []
-        orderedX.append((0, start, 0))
-        
-        # Initializing the path container
-        paths = {}
-        paths[(0, start, 0)] = [start]
+        # Initializing the label and path container
+        orderedX = path_search.BoundedFrontier(max_frontier, frontier_policy)
+        orderedX.push((0, start, 0), [start])
+        self.search_stats = orderedX.stats
         
         # Initialize the visited container
         visited = {}
@@ -772,11 +832,7 @@ class word_graph:
         while len(kshortestpaths) < k and len(orderedX) > 0:
         
             # Searching for the shortest distance in orderedX
-            shortest = orderedX.pop(0)
-            shortestpath = paths[shortest]
-            
-            # Removing the shortest node from X and paths
-            del paths[shortest]
+            shortest, shortestpath = orderedX.pop()
     
             # Iterating over the accessible nodes
             for node in self.graph.neighbors(shortest[1]):
@@ -853,30 +909,43 @@ class word_graph:
                     id = visited[node]
 
                     # Add the node to orderedX
-                    bisect.insort(orderedX, (w, node, id))
-                    
-                    # Add the node to paths
-                    paths[(w, node, id)] = [node]
-                    paths[(w, node, id)].extend(shortestpath)
+                    path = [node]
+                    path.extend(shortestpath)
+                    orderedX.push((w, node, id), path)
     
+        orderedX.close()
+
         # Returns the list of shortest paths
         return kshortestpaths
     #-B-----------------------------------------------------------------------B-
     
     #-T-----------------------------------------------------------------------T-
-    def get_compression(self, nb_candidates=50):
+    def get_compression(self, nb_candidates=50, contract=False, max_frontier=None, frontier_policy='evict',
+                        bidirectional=False):
         """
         Searches all possible paths from **start** to **end** in the word graph,
         removes paths containing no verb or shorter than *n* words. Returns an
         ordered list (smaller first) of nb (default value is 50) (cummulative 
         score, path) tuples. The score is not normalized with the sentence 
         length.
+
+        If *contract* is set, the search runs on the contracted word graph (see
+        contract_graph) with the streaming engine of iter_compression.
+        max_frontier and frontier_policy cap the memory used by the search (see
+        k_shortest_paths). If *bidirectional* is set, the paths are searched
+        from both ends of the word graph at once and joined in the middle,
+        which expands far fewer partial paths when the compressions are long.
         """
 
+        if contract or bidirectional:
+            return list(itertools.islice(self.iter_compression(contract, max_frontier, frontier_policy,
+                                                               bidirectional),
+                                         nb_candidates))
+
         # Search for the k-shortest paths in the graph
         self.paths = self.k_shortest_paths((self.start+self.sep+self.start, 0),
                                            (self.stop+self.sep+self.stop, 0),
-                                            nb_candidates)
+                                            nb_candidates, max_frontier, frontier_policy)
 
         # Initialize the fusion container
         fusions = []
@@ -898,6 +967,40 @@ class word_graph:
         return fusions
     #-B-----------------------------------------------------------------------B-
 
+    #-T-----------------------------------------------------------------------T-
+    def iter_compression(self, contract=False, max_frontier=None, frontier_policy='evict',
+                         bidirectional=False):
+        """
+        Streaming version of get_compression. Yields (cummulative score, path)
+        tuples in nondecreasing score order as soon as each path is confirmed,
+        so the caller can stop after the first acceptable candidates. If
+        *contract* is set, the search runs on the contracted word graph.
+        """
+
+        return path_search.iter_compression(self, contract, max_frontier, frontier_policy,
+                                            bidirectional)
+    #-B-----------------------------------------------------------------------B-
+
+
+    #-T-----------------------------------------------------------------------T-
+    def contract_graph(self):
+        """
+        Returns the word graph in which every chain of nodes having exactly one
+        predecessor and one successor is collapsed into a super-node carrying
+        its combined edge cost, its constraint counters and its words, so that
+        the search steps over the chain at once. Built once, then cached.
+        """
+
+        if self.contracted_graph is None:
+            self.contracted_graph = graph_simplify.contract_chains(
+                self.graph,
+                (self.start+self.sep+self.start, 0),
+                (self.stop+self.sep+self.stop, 0),
+                lambda members: path_search.chain_data(self, members))
+
+        return self.contracted_graph
+    #-B-----------------------------------------------------------------------B-
+
     #-T-----------------------------------------------------------------------T-
     def max_index(self, l):
         """ Returns the index of the maximum value of a given list. """
@@ -1021,8 +1124,13 @@ class keyphrase_reranker:
 
         :rtype: object
         """
+        # A word graph: reuse the sentences it has parsed
+        if hasattr(sentence_list, 'parsed_sentences'):
+            sentence_list = sentence_list.parsed_sentences()
+
         self.sentences = list(sentence_list)
-        """ The list of related sentences provided by the user. """
+        """ The list of related sentences provided by the user, either word/POS
+        strings or lists of (word, POS) tuples. """
 
         self.nbest_compressions = nbest_compressions
         """ The nbest compression candidates provided by the user. """
@@ -1049,6 +1157,12 @@ class keyphrase_reranker:
         self.word_scores = {}
         """ Scores for each word computed with TextRank. """
 
+        self.textrank_iterations = 0
+        """ Number of iterations of the last TextRank computation. """
+
+        self.textrank_residual = 0.0
+        """ Largest change of a word score in the last TextRank iteration. """
+
         self.keyphrase_scores = {}
         """ Scores for each keyphrase candidate. """
 
@@ -1084,72 +1198,61 @@ class keyphrase_reranker:
     #-T-----------------------------------------------------------------------T-
     def build_graph(self, window=0):
         """
-        Build a word graph from the list of sentences. Each node in the graph 
+        Build a word graph from the list of sentences. Each node in the graph
         represents a word. An edge is created between two nodes if they co-occur
         in a given window (default is 0, indicating the whole sentence).
+        Co-occurrences are counted for all the sentences first, and the edges
+        are added to the graph in one step.
         """
 
-        # For each sentence 
-        for i in range(len(self.sentences)):
-        
-            # Normalise extra white spaces
-            self.sentences[i] = re.sub(' +', ' ', self.sentences[i])
-            
-            # Tokenize the current sentence in word/POS
-            sentence = self.sentences[i].split(' ')
+        # Co-occurrence counts of the node pairs, see core.textrank
+        cooccurrences = Counter()
 
-            # 1. Looping over the words and creating the nodes. Sentences are
-            #    also converted to a list of tuples
-            for j in range(len(sentence)):
+        # For each sentence
+        for i in range(len(self.sentences)):
 
-                # Convert word/POS to (word, POS) tuple
-                word, pos = self.wordpos_to_tuple(sentence[j])
+            if isinstance(self.sentences[i], basestring):
 
-                # Replace word/POS by (word, POS) tuple in the sentence
-                sentence[j] = (word.lower(), pos)
+                # Normalise extra white spaces
+                self.sentences[i] = re.sub(' +', ' ', self.sentences[i])
 
-                # Modify the POS tags of stopwords to exclude them
-                if sentence[j][0] in self.stopwords:
-                    sentence[j] = (sentence[j][0], "STOPWORD")     
+                # Tokenize the current sentence in word/POS and convert
+                # word/POS to (word, POS) tuples
+                sentence = [self.wordpos_to_tuple(w) for w in self.sentences[i].split(' ')]
 
-                # Add the word only if it belongs to one of the syntactic 
-                # categories
-                if sentence[j][1] in self.syntactic_filter:
+            else:
 
-                    # Add node to the graph if not exists
-                    if not self.graph.has_node(sentence[j]):
-                        self.graph.add_node(sentence[j])
+                # Sentence already parsed, e.g. by a word graph
+                sentence = [(token[0], token[1]) for token in self.sentences[i]]
 
-            # 2. Create the edges between the nodes using co-occurencies
+            # 1. Looping over the words and keeping the nodes
+            nodes = []
             for j in range(len(sentence)):
 
-                # Get the first node
-                first_node = sentence[j]
-
-                # Switch to set the window for the whole sentence
-                max_window = window 
-                if window < 1:
-                    max_window = len(sentence)
+                word, pos = sentence[j]
 
-                # For the other words in the window
-                for k in range(j+1, min(len(sentence), j+max_window)):
+                # Lowercase the word
+                sentence[j] = (word.lower(), pos)
 
-                    # Get the second node
-                    second_node = sentence[k]
+                # Modify the POS tags of stopwords to exclude them
+                if sentence[j][0] in self.stopwords:
+                    sentence[j] = (sentence[j][0], "STOPWORD")
 
-                    # Check if nodes exists 
-                    if self.graph.has_node(first_node) and \
-                       self.graph.has_node(second_node):
+                # Keep the word only if it belongs to one of the syntactic
+                # categories
+                if sentence[j][1] in self.syntactic_filter:
+                    nodes.append((j, sentence[j]))
 
-                        # Add edge if not exists
-                        if not self.graph.has_edge(first_node, second_node):
-                            self.graph.add_edge(first_node,second_node,weight=1)
-                        # Else modify weight
-                        else:
-                            self.graph[first_node][second_node]['weight'] += 1
+            # 2. Add the nodes and count their co-occurrences
+            self.graph.add_nodes_from(node for j, node in nodes)
+            textrank.count_cooccurrences(nodes, window, cooccurrences)
 
             # Replace sentence by the list of tuples
             self.sentences[i] = sentence
+
+        # 3. Create the edges between the nodes, weighted by co-occurrences
+        self.graph.add_edges_from((first_node, second_node, {'weight': weight})
+                                  for (first_node, second_node), weight in cooccurrences.iteritems())
     #-B-----------------------------------------------------------------------B-
 
 
@@ -1222,54 +1325,25 @@ class keyphrase_reranker:
 
 
     #-T-----------------------------------------------------------------------T-
-    def undirected_TextRank(self, d=0.85, f_conv=0.0001):
+    def undirected_TextRank(self, d=0.85, f_conv=0.0001, max_iterations=100, relative=False):
         """
-        Implementation of the TextRank algorithm as described in 
+        Implementation of the TextRank algorithm as described in
         [mihalcea-tarau:2004:EMNLP]_. Node scores are computed iteratively until
-        convergence (a threshold is used, default is 0.0001). The dampling 
-        factor is by default set to 0.85 as recommended in the article.
+        convergence, i.e. until the largest change of a node score is below a
+        threshold (default is 0.0001, relative to the new score if *relative*
+        is set), or at most *max_iterations* times. The dampling factor is by
+        default set to 0.85 as recommended in the article.
+
+        Returns the number of iterations and the final residual (the largest
+        change of the last iteration), also kept in textrank_iterations and
+        textrank_residual.
         """
 
-        # Initialise the maximum node difference for checking stability
-        max_node_difference = f_conv
-    
-        # Initialise node scores to 1
-        self.word_scores = {}
-        for node in self.graph.nodes():
-            self.word_scores[node] = 1.0
-
-        # While the node scores are not stabilized
-        while (max_node_difference >= f_conv):
-
-            # Create a copy of the current node scores
-            current_node_scores = self.word_scores.copy()
-
-            # For each node I in the graph
-            for node_i in self.graph.nodes():
-
-                sum_Vj = 0
-
-                # For each node J connected to I
-                for node_j in self.graph.neighbors_iter(node_i):
-
-                    wji = self.graph[node_j][node_i]['weight']
-                    WSVj = current_node_scores[node_j]
-                    sum_wjk = 0.0
-
-                    # For each node K connected to J
-                    for node_k in self.graph.neighbors_iter(node_j):
-                        sum_wjk += self.graph[node_j][node_k]['weight']
+        # Sparse power iteration, see core.textrank
+        self.word_scores, self.textrank_iterations, self.textrank_residual = \
+            textrank.undirected_textrank(self.graph, d, f_conv, max_iterations, relative)
 
-                    sum_Vj += ( (wji * WSVj) / sum_wjk )
-
-                # Modify node score
-                self.word_scores[node_i] = (1 - d) + (d * sum_Vj)
-
-                # Compute the difference between old and new score
-                score_difference = math.fabs(self.word_scores[node_i] \
-                                   - current_node_scores[node_i])
-
-                max_node_difference = max(score_difference, score_difference)
+        return self.textrank_iterations, self.textrank_residual
     #-B-----------------------------------------------------------------------B-
 
 
@@ -1308,72 +1382,9 @@ class keyphrase_reranker:
         keyphrase with the highest score is selected.
         """
 
-        # Sort keyphrase candidates by length
-        descending = sorted(self.keyphrase_candidates, 
-                            key = lambda x: len(self.keyphrase_candidates[x]), 
-                            reverse=True)
-
-        # Initialize the cluster container
-        clusters = {}
-
-        # Loop over keyphrases by decreasing length
-        for keyphrase in descending:
-
-            found_cluster = False
-            
-            # Create a set of words from the keyphrase
-            keyphrase_words = set(keyphrase.split(' '))
-
-            # Loop over existing clusters
-            for cluster in clusters:
-
-                # Create a set of words from the cluster representative
-                cluster_words = set(cluster.split(' '))
-
-                # Check if keyphrase words are all contained in the cluster
-                # representative words
-                if len(keyphrase_words.difference(cluster_words)) == 0 :
-                    
-                    # Add keyphrase to cluster
-                    clusters[cluster].append(keyphrase)
-
-                    # Mark cluster as found
-                    found_cluster = True
-
-            # If keyphrase does not fit into any existing cluster
-            if not found_cluster:
-                clusters[keyphrase] = [keyphrase]
-
-        # Initialize the best candidate cluster container
-        best_candidate_keyphrases = []
-
-        # Loop over the clusters to find the best keyphrases
-        for cluster in clusters:
-
-            # Find the best scored keyphrase candidate in the cluster
-            sorted_cluster = sorted(clusters[cluster], 
-                            key=lambda cluster: self.keyphrase_scores[cluster], 
-                            reverse=True)
-
-            best_candidate_keyphrases.append(sorted_cluster[0])
-
-        # Initialize the non redundant clustered keyphrases
-        non_redundant_keyphrases = []
-
-        # Sort best candidate by score
-        sorted_keyphrases = sorted(best_candidate_keyphrases, 
-                        key=lambda keyphrase: self.keyphrase_scores[keyphrase], 
-                        reverse=True)
-
-        # Last loop to remove redundancy in cluster best candidates
-        for keyphrase in sorted_keyphrases:
-            is_redundant = False
-            for prev_keyphrase in non_redundant_keyphrases:
-                if keyphrase in prev_keyphrase:
-                    is_redundant = True
-                    break
-            if not is_redundant:
-                non_redundant_keyphrases.append(keyphrase)
+        # Cluster with an inverted index, see core.keyphrases
+        non_redundant_keyphrases = keyphrases.cluster_keyphrases(self.keyphrase_candidates,
+                                                                 self.keyphrase_scores)
 
         # Modify the keyphrase candidate dictionnaries according to the clusters
         for keyphrase in self.keyphrase_candidates.keys():
@@ -1389,30 +1400,31 @@ class keyphrase_reranker:
     def rerank_nbest_compressions(self):
         """
         Function that reranks the nbest compressions according to the keyphrases
-        they contain. The cummulative score (original score) is normalized by 
-        (compression length * Sum of keyphrase scores).
+        they contain. The cummulative score (original score) is normalized by
+        (compression length * Sum of keyphrase scores). A keyphrase is contained
+        in a compression if its words occur consecutively in the compression.
         """
 
         reranked_compressions = []
 
+        # Automaton matching all the keyphrases, see core.keyphrases
+        matcher = keyphrases.KeyphraseMatcher(self.keyphrase_candidates)
+
         # Loop over the compression candidates
         for cummulative_score, path in self.nbest_compressions:
 
-            # Generate the sentence form the path
-            compression = ' '.join([u[0] for u in path])
-
             # Initialize total keyphrase score
             total_keyphrase_score = 1.0
 
-            # Loop over the keyphrases and sum the scores
-            for keyphrase in self.keyphrase_candidates:
-                if keyphrase in compression:
-                    total_keyphrase_score += self.keyphrase_scores[keyphrase]
+            # Sum the scores of the keyphrases found in the compression words
+            for keyphrase in matcher.matches([u[0] for u in path]):
+                total_keyphrase_score += self.keyphrase_scores[keyphrase]
 
             score = ( cummulative_score / (len(path) * total_keyphrase_score) )
 
-            bisect.insort( reranked_compressions, 
-                           (score, path) )
+            reranked_compressions.append( (score, path) )
+
+        reranked_compressions.sort()
 
         return reranked_compressions
     #-B-----------------------------------------------------------------------B-
@@ -1421,17 +1433,26 @@ class keyphrase_reranker:
     def wordpos_to_tuple(self, word):
         """
         This function converts a word/POS to a (word, POS) tuple. The character
-        used for separating word and POS can be specified (default is /).
+        used for separating word and POS can be specified (default is /). The
+        weight of a weighted word/POS/weight is dropped.
         """
 
-        # Splitting word, POS using regex
-        pos_separator_re = re.escape(self.pos_separator)
-        m = re.match("^(.+)"+ pos_separator_re +"(.+)$", word)
+        # Splitting word, POS at the last separator
+        token, separator, POS = word.rpartition(self.pos_separator)
+
+        # Weighted word/POS/weight: splitting word, POS before the weight
+        if re.match("^\d+(\.\d+)*$", POS):
+            weighted_token, separator, weighted_POS = token.rpartition(self.pos_separator)
+            if weighted_token and weighted_POS:
+                token, POS = weighted_token, weighted_POS
 
-        # Extract the word information
-        token, POS = m.group(1), m.group(2)
+        # Word or POS ending with the separator: splitting using regex
+        if not token or not POS:
+            pos_separator_re = re.escape(self.pos_separator)
+            m = re.match("^(.+)"+ pos_separator_re +"(.+)$", word)
+            token, POS = m.group(1), m.group(2)
 
-        # Return the tuple 
+        # Return the tuple
         return (token.lower(), POS)
     #-B-----------------------------------------------------------------------B-
 
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    textrank
+
+:Version:
+    0.1
+
+:Description:
+    TextRank of the word co-occurrence graphs of the keyphrase rerankers
+    (takahe and coati), as a power iteration over a sparse, row-normalized
+    weight matrix: every iteration is one sparse matrix-vector product
+    instead of a walk over the neighbours of the neighbours of every node.
+    Without SciPy, the same iteration runs over adjacency lists, the total
+    weight of every node being computed once. The iteration stops when the
+    largest change of a node score falls below the threshold, or after a
+    maximum number of iterations. The co-occurrence counts of the graphs are
+    accumulated in a Counter (see count_cooccurrences) before the graph is
+    built in one step.
+"""
+
+from collections import Counter
+
+
+def undirected_textrank(graph, d=0.85, f_conv=0.0001, max_iterations=100, relative=False):
+    """
+    Computes the TextRank score of every node of the undirected weighted
+    *graph*: starting from 1, each iteration sets the score of node i to::
+
+        (1 - d) + d * sum_j(w_ji / sum_k(w_jk) * score_j)
+
+    from the scores of the previous iteration, until the residual, the
+    largest change of a node score in the iteration, is below *f_conv*, or
+    *max_iterations* iterations are done. If *relative* is set, the change
+    of a score is measured relatively to its new value.
+
+    :return: (dict(node -> score), number of iterations, final residual)
+    """
+
+    nodes = graph.nodes()
+    if len(nodes) == 0:
+        return {}, 0, 0.0
+
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        return _adjacency_textrank(graph, nodes, d, f_conv, max_iterations, relative)
+
+    index = dict((node, i) for i, node in enumerate(nodes))
+
+    rows = []
+    cols = []
+    weights = []
+    for node_i, node_j, data in graph.edges_iter(data=True):
+        i = index[node_i]
+        j = index[node_j]
+        rows.append(i)
+        cols.append(j)
+        weights.append(data['weight'])
+        if i != j:
+            rows.append(j)
+            cols.append(i)
+            weights.append(data['weight'])
+
+    n = len(nodes)
+    weight_matrix = sparse.csr_matrix((np.array(weights, dtype=np.float64), (rows, cols)), shape=(n, n))
+
+    # Row normalization, done once: w_jk / sum_k(w_jk)
+    total = np.asarray(weight_matrix.sum(axis=1)).ravel()
+    inverse = np.zeros(n)
+    inverse[total != 0] = 1.0 / total[total != 0]
+    transition = (sparse.diags(inverse).dot(weight_matrix)).T.tocsr()
+
+    scores = np.ones(n)
+    iterations = 0
+    residual = 0.0
+
+    while iterations < max_iterations:
+        previous = scores
+        scores = (1 - d) + d * transition.dot(previous)
+        iterations += 1
+
+        change = np.abs(scores - previous)
+        if relative:
+            change /= np.abs(scores)
+        residual = float(change.max())
+
+        if residual < f_conv:
+            break
+
+    return dict(zip(nodes, scores.tolist())), iterations, residual
+
+
+def _adjacency_textrank(graph, nodes, d, f_conv, max_iterations, relative):
+    """
+    undirected_textrank over the adjacency lists of *graph*.
+    """
+
+    total = {}
+    for node_j in nodes:
+        total[node_j] = sum(data['weight'] for data in graph[node_j].itervalues())
+
+    scores = dict((node, 1.0) for node in nodes)
+    iterations = 0
+    residual = 0.0
+
+    while iterations < max_iterations:
+        previous = scores
+        scores = {}
+        residual = 0.0
+        for node_i in nodes:
+            sum_vj = 0.0
+            for node_j, data in graph[node_i].iteritems():
+                sum_vj += (data['weight'] * previous[node_j]) / total[node_j]
+            scores[node_i] = (1 - d) + d * sum_vj
+
+            change = abs(scores[node_i] - previous[node_i])
+            if relative:
+                change /= abs(scores[node_i])
+            residual = max(residual, change)
+        iterations += 1
+
+        if residual < f_conv:
+            break
+
+    return scores, iterations, residual
+
+
+def count_cooccurrences(tokens, window, counts):
+    """
+    Adds to the Counter *counts* the co-occurrences of a sentence, *tokens*
+    being its (position, node) pairs kept for the graph, in order. Two nodes
+    co-occur if their positions differ by less than *window*, or anywhere in
+    the sentence if *window* < 1. The key of a pair is (node_a, node_b) with
+    node_a <= node_b, a node occurring twice giving a (node, node) pair.
+    This takes O(len(tokens) * window), or O(distinct nodes ** 2) for the
+    whole sentence.
+    """
+
+    if window < 1:
+
+        # Every pair of occurrences: a pair of distinct nodes occurs
+        # frequency_a * frequency_b times, a node with itself
+        # frequency * (frequency - 1) / 2 times
+        frequency = Counter(node for position, node in tokens)
+        for node_a, frequency_a in frequency.iteritems():
+            for node_b, frequency_b in frequency.iteritems():
+                if node_a < node_b:
+                    counts[(node_a, node_b)] += frequency_a * frequency_b
+                elif node_a == node_b and frequency_a > 1:
+                    counts[(node_a, node_a)] += frequency_a * (frequency_a - 1) // 2
+
+        return counts
+
+    for i in range(len(tokens)):
+        position, node_a = tokens[i]
+        k = i + 1
+        while k < len(tokens) and tokens[k][0] - position < window:
+            node_b = tokens[k][1]
+            counts[(node_a, node_b) if node_a <= node_b else (node_b, node_a)] += 1
+            k += 1
+
+    return counts
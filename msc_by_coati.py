@@ -7,11 +7,14 @@
 
 import os
 import sys
+import time
 import ConfigParser
+import multiprocessing
 
 from common import *
 from common.grammar import GrammarScorer
-from core.coati_v2 import WordGraph
+from common.lm_server import GrammarClient
+from core.coati_v2 import WordGraph, sentence_vocabulary
 
 
 def event_based_msc(sentences, grammar_scorer, lambd, max_neighbors, queue_size, output_sent_num = 50):
@@ -23,6 +26,8 @@ def event_based_msc(sentences, grammar_scorer, lambd, max_neighbors, queue_size,
     :return: 分数#句子
     """
 
+    start_time = time.time()
+
     # 构建词图，并执行压缩
     # 忽略词数小于8的句子
     compresser = WordGraph(sentences, grammar_scorer)
@@ -30,6 +35,17 @@ def event_based_msc(sentences, grammar_scorer, lambd, max_neighbors, queue_size,
     # 获取压缩结果
     candidates = compresser.event_guided_multi_compress(lambd, max_neighbors, queue_size, output_sent_num)
 
+    # 本类别的语言模型打分统计（开启时）
+    stats = grammar_scorer.stats_snapshot(reset=True)
+    if stats is not None:
+        seconds = time.time() - start_time
+        logging.info('[events]lm stats: time[%.3fs / %.3fs, %.1f%%] sentences[%d] trigrams[%d] '
+                     'order hits[3:%d 2:%d 1:%d] backoff depth%s unk[%d] cache hit rate[%.3f] persistent hits[%d]',
+                     stats['seconds'], seconds, 100.0 * stats['seconds'] / max(seconds, 1e-6),
+                     stats['sentences'], stats['trigrams'], stats['order_hits'][3], stats['order_hits'][2],
+                     stats['order_hits'][1], stats['backoff_depth'], stats['unk_substitutions'],
+                     stats['cache_hit_rate'], stats['persistent_hits'])
+
     # 将图保存成文本形式
     # compresser.write_dot('graph.dot')
 
@@ -40,6 +56,66 @@ def event_based_msc(sentences, grammar_scorer, lambd, max_neighbors, queue_size,
 
     return results
 
+# 工作进程中的语言模型打分器，由init_worker设置
+worker_grammar_scorer = None
+
+
+def init_worker(grammar_scorer):
+
+    """
+    工作进程初始化：保存共享模型的打分器（只重新映射模型文件，不复制模型）
+    """
+
+    global worker_grammar_scorer
+
+    # 使用打分服务时，每个工作进程建立自己的连接
+    if isinstance(grammar_scorer, GrammarClient):
+        grammar_scorer = GrammarClient(grammar_scorer.socket_path)
+
+    worker_grammar_scorer = grammar_scorer
+
+
+def compress_cluster(args):
+
+    """
+    在工作进程中压缩一个类别的句子
+    :param args: (句子集合, lambd, max_neighbors, queue_size)
+    :return: event_based_msc的结果
+    """
+
+    sentences, lambd, max_neighbors, queue_size = args
+    results = event_based_msc(sentences, worker_grammar_scorer, lambd, max_neighbors, queue_size)
+
+    # 工作进程不会正常退出，每个类别之后写入新得分
+    worker_grammar_scorer.flush()
+
+    return results
+
+def load_vocabulary(sentences_dir, vocabulary_setting):
+
+    """
+    按配置收集待压缩语句的词表，用于过滤加载语言模型
+    :param sentences_dir: 子句所在文件路径
+    :param vocabulary_setting: topics（遍历主题文件收集）、词表文件路径（每行一个词）或空（不过滤）
+    :return: 词集合，不过滤时返回None
+    """
+
+    if not vocabulary_setting:
+        return None
+
+    if vocabulary_setting != 'topics':
+        with open(vocabulary_setting, 'r') as wordlist:
+            return set(line.strip() for line in wordlist if line.strip())
+
+    vocabulary = set()
+    for parent, dirs, files in os.walk(sentences_dir + "/weighted"):
+        for filename in files:
+            with open(os.path.join(parent, filename), 'r') as text:
+                vocabulary.update(sentence_vocabulary(
+                    line for line in (l.strip() for l in text) if line and not line.startswith('classes_')))
+
+    return vocabulary
+
 if __name__ == '__main__':
 
     if len(sys.argv) != 2:
@@ -60,6 +136,31 @@ if __name__ == '__main__':
     ''' 语言模型所在路径 '''
     ngram_modelpath = cf.get('emsc', 'ngram_model_path')
 
+    ''' 语言模型存储方式，dict、trie或mmap '''
+    ngram_storage = 'dict'
+    if cf.has_option('emsc', 'ngram_model_storage'):
+        ngram_storage = cf.get('emsc', 'ngram_model_storage')
+
+    ''' 语言模型打分服务的Unix域套接字路径（见common.lm_server），设置时不加载模型 '''
+    ngram_server = ''
+    if cf.has_option('emsc', 'ngram_model_server'):
+        ngram_server = cf.get('emsc', 'ngram_model_server')
+
+    ''' 只加载待压缩语句中的词构成的N元组: topics、词表文件路径或空 '''
+    ngram_vocabulary = ''
+    if cf.has_option('emsc', 'ngram_model_vocabulary'):
+        ngram_vocabulary = cf.get('emsc', 'ngram_model_vocabulary')
+
+    ''' 语言模型得分的持久缓存文件（SQLite），在多次运行之间复用得分，空则不使用 '''
+    ngram_score_cache = None
+    if cf.has_option('emsc', 'ngram_score_cache') and cf.get('emsc', 'ngram_score_cache'):
+        ngram_score_cache = cf.get('emsc', 'ngram_score_cache')
+
+    ''' 是否统计语言模型打分（调用次数、回退深度、缓存命中率、耗时等），按类别输出到日志 '''
+    ngram_stats = False
+    if cf.has_option('emsc', 'ngram_model_stats'):
+        ngram_stats = cf.getboolean('emsc', 'ngram_model_stats')
+
     ''' 路径得分和语言模型得分参数lambd '''
     lambd = cf.getfloat('emsc', 'lambd')
 
@@ -69,9 +170,29 @@ if __name__ == '__main__':
     ''' 队列容量 '''
     queue_size = cf.getint('emsc', 'queue_size')
 
+    ''' 并行压缩的进程数，各进程共享同一份语言模型 '''
+    workers = 1
+    if cf.has_option('emsc', 'workers'):
+        workers = cf.getint('emsc', 'workers')
+
     # 初始化语言模型打分器
-    logging.info('Initializing ngram model[%s]', ngram_modelpath)
-    grammar_scorer = GrammarScorer(ngram_modelpath)
+    if ngram_server:
+        logging.info('Connecting to ngram model server[%s]', ngram_server)
+        grammar_scorer = GrammarClient(ngram_server)
+    else:
+        logging.info('Initializing ngram model[%s]', ngram_modelpath)
+        vocabulary = load_vocabulary(sentences_dir, ngram_vocabulary)
+        if vocabulary is not None:
+            logging.info('Filtering ngram model with %d words', len(vocabulary))
+        grammar_scorer = GrammarScorer(ngram_modelpath, ngram_storage, vocabulary=vocabulary,
+                                       score_cache_path=ngram_score_cache, instrument=ngram_stats)
+
+    # 多进程时将模型放入共享的只读内存映射文件，各工作进程映射同一文件
+    pool = None
+    if workers > 1:
+        if not ngram_server:
+            grammar_scorer.share()
+        pool = multiprocessing.Pool(workers, init_worker, (grammar_scorer,))
 
     # 事件指导的多语句压缩
     for parent, dirs, files in os.walk(sentences_dir + "/weighted"):
@@ -99,14 +220,23 @@ if __name__ == '__main__':
             # 存放基于事件指导的压缩结果
             event_based_results = {}
 
-            for key in clusted_sentences:
-                # 执行多语句压缩
-                logging.info('[events]compressing, filename=%s, class=%s', filename, key)
-                event_based_results[key] = event_based_msc(clusted_sentences[key], grammar_scorer, lambd, max_neighbors, queue_size)
-                logging.info('[events]compress success, filename=%s, class=%s', filename, key)
+            if pool is not None:
+                # 各类别并行压缩
+                logging.info('[events]compressing %d classes with %d workers, filename=%s', len(clusted_sentences), workers, filename)
+                keys = list(clusted_sentences)
+                results = pool.map(compress_cluster, [(clusted_sentences[key], lambd, max_neighbors, queue_size) for key in keys])
+                event_based_results = dict(zip(keys, results))
+            else:
+                for key in clusted_sentences:
+                    # 执行多语句压缩
+                    logging.info('[events]compressing, filename=%s, class=%s', filename, key)
+                    event_based_results[key] = event_based_msc(clusted_sentences[key], grammar_scorer, lambd, max_neighbors, queue_size)
+                    logging.info('[events]compress success, filename=%s, class=%s', filename, key)
 
             logging.info('Compress file[%s] finished!', filename)
 
+            grammar_scorer.flush()
+
             # 保存结果到文件
             # 基于事件驱动的压缩结果
             savepath = save_dir + '/events'
@@ -122,4 +252,10 @@ if __name__ == '__main__':
 
             logging.info('Save file[%s] success!', os.path.join(savepath, filename))
 
+    if pool is not None:
+        pool.close()
+        pool.join()
+        if not ngram_server:
+            grammar_scorer.release()
+
     logging.info('program finish!')
\ No newline at end of file
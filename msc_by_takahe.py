@@ -58,7 +58,9 @@ def keyphrases_based_msc(sentences, output_sent_num = 50):
     candidates = compresser.get_compression(output_sent_num)
 
     # 利用keyphrases对压缩结果重新打分
-    reranker = takahe.keyphrase_reranker(sentences, candidates, lang='en')
+    # 重排序器直接使用词图切分好的句子，不再重复切分
+    reranker = takahe.keyphrase_reranker(compresser, candidates, lang='en')
+    logging.info('textrank: iterations[%d] residual[%g]', reranker.textrank_iterations, reranker.textrank_residual)
     reranked_candidates = reranker.rerank_nbest_compressions()
 
     results = []
@@ -120,7 +122,9 @@ def event_keyphrase_based_msc(sentences, output_sent_num=50):
     candidates = compresser.get_compression(output_sent_num)
 
     # 利用keyphrases对压缩结果重新打分
-    reranker = takahe.keyphrase_reranker(sentences, candidates, lang='en')
+    # 重排序器直接使用词图切分好的句子，不再重复切分
+    reranker = takahe.keyphrase_reranker(compresser, candidates, lang='en')
+    logging.info('textrank: iterations[%d] residual[%g]', reranker.textrank_iterations, reranker.textrank_residual)
     reranked_candidates = reranker.rerank_nbest_compressions()
 
     results = []
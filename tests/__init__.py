@@ -0,0 +1,14 @@
+# -*- coding: utf8 -*-
+
+"""
+模型存储及读取的一致性检查
+
+Run from the repository root:
+
+    python -m unittest discover -s tests -t .
+"""
+
+import logging
+
+# common.logger将日志写入固定路径下的文件，测试时先配置日志，使其配置不生效
+logging.basicConfig(level=logging.WARNING)
@@ -0,0 +1,418 @@
+# -*- coding: utf8 -*-
+
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+
+from common.grammar import GrammarScorer
+from common.ngram_binary import convert_model
+from tests.toy_model import SENTENCES, TOY_ARPA, write_model
+
+
+def child_scores(scorer):
+
+    """
+    在子进程中用反序列化得到的打分器打分
+    """
+
+    return os.getpid(), scorer.storage, scorer.modelpath, [scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+
+
+class ToyModelTestCase(unittest.TestCase):
+
+    """
+    在临时目录中写入小型模型
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.modelpath = write_model(self.directory)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def scorers(self, **options):
+
+        """
+        dict、trie及mmap方式的打分器
+        """
+
+        binpath = os.path.join(self.directory, 'toy.bin')
+        if not os.path.exists(binpath):
+            convert_model(self.modelpath, binpath)
+
+        return [GrammarScorer(self.modelpath, 'dict', **options),
+                GrammarScorer(self.modelpath, 'trie', **options),
+                GrammarScorer(binpath, 'mmap', **options)]
+
+
+class VocabularyTest(ToyModelTestCase):
+
+    """
+    只加载任务词表的N元组时得分不变
+    """
+
+    def test_vocabulary(self):
+
+        sentences = [['the', 'cat', 'sat', 'on', 'the', 'cat'], ['a', 'cat', 'sat'], ['cat']]
+        vocabulary = set(word for tokens in sentences for word in tokens)
+
+        for storage in ('dict', 'trie'):
+
+            full = GrammarScorer(self.modelpath, storage, cache_size=0)
+            restricted = GrammarScorer(self.modelpath, storage, vocabulary=vocabulary, cache_size=0)
+
+            # 不含dog、mat的N元组
+            self.assertLess(len(restricted.ngram_model), len(full.ngram_model))
+            self.assertNotIn('dog', restricted.ngram_model)
+            self.assertIn('<s> the', restricted.ngram_model)
+
+            for tokens in sentences:
+                self.assertEqual(restricted.cal_fluency_tokens(tokens), full.cal_fluency_tokens(tokens))
+
+
+class CacheTest(ToyModelTestCase):
+
+    """
+    三元组得分的LRU缓存
+    """
+
+    def test_scores(self):
+
+        for storage in ('dict', 'trie'):
+
+            reference = GrammarScorer(self.modelpath, storage, cache_size=0)
+            expected = [reference.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+            self.assertEqual(reference.cache_info()['size'], 0)
+
+            # 缓存容量足够大或很小，重复打分
+            for cache_size in (1, 3, 65536):
+                scorer = GrammarScorer(self.modelpath, storage, cache_size=cache_size)
+                for repeat in range(2):
+                    self.assertEqual([scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+
+    def test_cache_info(self):
+
+        # 6个互不相同的三元组
+        tokens = SENTENCES[0]
+        scorer = GrammarScorer(self.modelpath, cache_size=6)
+
+        scorer.cal_fluency_tokens(tokens)
+        self.assertEqual(scorer.cache_info(), {'hits': 0, 'misses': 6, 'evictions': 0, 'size': 6, 'capacity': 6})
+
+        scorer.cal_fluency_tokens(tokens)
+        self.assertEqual(scorer.cache_info(), {'hits': 6, 'misses': 6, 'evictions': 0, 'size': 6, 'capacity': 6})
+
+        scorer.clear_cache()
+        self.assertEqual(scorer.cache_info(), {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0, 'capacity': 6})
+
+    def test_eviction(self):
+
+        tokens = SENTENCES[0]
+        scorer = GrammarScorer(self.modelpath, cache_size=3)
+
+        # 容量3，依次访问6个三元组，淘汰最早的3个
+        scorer.cal_fluency_tokens(tokens)
+        self.assertEqual(scorer.cache_info(), {'hits': 0, 'misses': 6, 'evictions': 3, 'size': 3, 'capacity': 3})
+        self.assertEqual(list(scorer.cache), [('sat', 'on', 'the'), ('on', 'the', 'mat'), ('the', 'mat', '</s>')])
+
+        # 最近使用的三元组命中并移到末尾，其后的未命中淘汰最久未使用的
+        scorer.cal_ngram_fluency('on', 'the', 'mat')
+        scorer.cal_ngram_fluency('<s>', 'the', 'cat')
+        self.assertEqual(scorer.cache_info(), {'hits': 1, 'misses': 7, 'evictions': 4, 'size': 3, 'capacity': 3})
+        self.assertEqual(list(scorer.cache), [('the', 'mat', '</s>'), ('on', 'the', 'mat'), ('<s>', 'the', 'cat')])
+
+        # 按顺序重复访问超过容量的三元组，全部未命中
+        scorer.clear_cache()
+        scorer.cal_fluency_tokens(tokens)
+        scorer.cal_fluency_tokens(tokens)
+        self.assertEqual(scorer.cache_info(), {'hits': 0, 'misses': 12, 'evictions': 9, 'size': 3, 'capacity': 3})
+
+
+class BatchTest(ToyModelTestCase):
+
+    """
+    批量打分与逐句打分的结果完全相同
+    """
+
+    def test_toy_sentences(self):
+
+        for scorer in self.scorers(cache_size=0):
+            expected = [scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+            self.assertEqual(scorer.cal_fluency_batch(SENTENCES), expected)
+            self.assertEqual(scorer.cal_fluency_batch(SENTENCES[:1]), expected[:1])
+            self.assertEqual(scorer.cal_fluency_batch([]), [])
+
+    def test_random_sentences(self):
+
+        # 含词表外的词、<unk>及句中的<s>、</s>
+        words = ['the', 'cat', 'dog', 'sat', 'on', 'mat', 'cow', 'a', '<unk>', '<s>', '</s>']
+        generator = random.Random(3)
+        sentences = [[generator.choice(words) for i in range(generator.randint(0, 9))] for k in range(300)]
+
+        for scorer in self.scorers(cache_size=0):
+            self.assertEqual(scorer.cal_fluency_batch(sentences),
+                             [scorer.cal_fluency_tokens(tokens) for tokens in sentences])
+
+    def test_ids(self):
+
+        for scorer in self.scorers()[1:]:
+            sequences = [scorer.token_ids(tokens) for tokens in SENTENCES]
+            self.assertEqual(sequences[2][:2], [-1, -1])
+            self.assertEqual(scorer.cal_fluency_ids_batch(sequences),
+                             [scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES])
+
+
+class StateTest(ToyModelTestCase):
+
+    """
+    begin/advance/finish逐词累加的得分与整句打分完全相同
+    """
+
+    def accumulate(self, scorer, tokens):
+
+        state = scorer.begin()
+        score = 0.0
+        for word in tokens:
+            state, increment = scorer.advance(state, word)
+            score += increment
+
+        return score + scorer.finish(state)
+
+    def test_accumulation(self):
+
+        generator = random.Random(5)
+        words = ['the', 'cat', 'dog', 'sat', 'on', 'mat', 'cow', 'a']
+        sentences = SENTENCES + [[generator.choice(words) for i in range(generator.randint(0, 9))]
+                                 for k in range(100)]
+
+        for cache_size in (0, 4):
+            for scorer in self.scorers(cache_size=cache_size):
+                for tokens in sentences:
+                    self.assertEqual(self.accumulate(scorer, tokens), scorer.cal_fluency_tokens(tokens))
+
+    def test_states(self):
+
+        scorer = GrammarScorer(self.modelpath)
+
+        self.assertEqual(scorer.begin(), ('<s>',))
+        self.assertEqual(scorer.finish(scorer.begin()), 0.0)
+        self.assertEqual(scorer.advance(scorer.begin(), 'the'), (('<s>', 'the'), 0.0))
+
+        # 以相同两个词结尾的短语状态相同，其后的得分增量也相同
+        ends = []
+        for tokens in (['the', 'dog', 'sat', 'on'], ['a', 'cat', 'sat', 'on'], ['sat', 'on']):
+            state = scorer.begin()
+            for word in tokens:
+                state, increment = scorer.advance(state, word)
+            ends.append(state)
+        self.assertEqual(ends, [('sat', 'on')] * 3)
+        self.assertEqual(scorer.advance(ends[0], 'the'), (('on', 'the'), scorer.cal_ngram_fluency('sat', 'on', 'the')))
+        self.assertEqual(scorer.finish(ends[0]), scorer.cal_ngram_fluency('sat', 'on', '</s>'))
+
+
+class PersistentCacheTest(ToyModelTestCase):
+
+    """
+    持久缓存在多次运行之间复用得分
+    """
+
+    def test_second_run(self):
+
+        cachepath = os.path.join(self.directory, 'scores.sqlite')
+        reference = GrammarScorer(self.modelpath, cache_size=0)
+        expected = [reference.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+
+        # 第一次运行：全部计算并写入
+        first = GrammarScorer(self.modelpath, score_cache_path=cachepath, instrument=True)
+        self.assertEqual([first.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+        self.assertEqual(first.stats_snapshot()['persistent_hits'], 0)
+        first.flush()
+
+        # 第二次运行：语句得分全部来自持久缓存
+        second = GrammarScorer(self.modelpath, score_cache_path=cachepath, instrument=True)
+        self.assertEqual([second.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+        self.assertEqual(second.cal_fluency_batch(SENTENCES), expected)
+        snapshot = second.stats_snapshot(reset=True)
+        self.assertEqual(snapshot['persistent_hits'], 2 * len(SENTENCES))
+        self.assertEqual(snapshot['trigrams'], 0)
+
+        # 三元组得分也来自持久缓存，新的语句只计算未见过的三元组
+        self.assertEqual(second.cal_ngram_fluency('the', 'cat', 'sat'), reference.cal_ngram_fluency('the', 'cat', 'sat'))
+        self.assertEqual(second.cal_fluency_tokens(['the', 'cat', 'sat', 'on', 'the', 'dog']),
+                         reference.cal_fluency_tokens(['the', 'cat', 'sat', 'on', 'the', 'dog']))
+        snapshot = second.stats_snapshot()
+        self.assertEqual(snapshot['persistent_hits'], 4)
+        self.assertEqual(snapshot['cache_hits'], 1)
+        self.assertEqual(snapshot['trigrams'], 2)
+
+    def test_invalidation(self):
+
+        cachepath = os.path.join(self.directory, 'scores.sqlite')
+
+        first = GrammarScorer(self.modelpath, score_cache_path=cachepath)
+        scores = [first.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+        first.flush()
+
+        # 打分设置不同（存储方式）的得分分开存放
+        trie = GrammarScorer(self.modelpath, 'trie', score_cache_path=cachepath, instrument=True)
+        trie.cal_fluency_tokens(SENTENCES[0])
+        self.assertEqual(trie.stats_snapshot()['persistent_hits'], 0)
+
+        # 模型文件改变后旧得分失效
+        write_model(self.directory, text=TOY_ARPA.replace('-0.2218\tthe cat sat', '-0.5229\tthe cat sat'))
+        changed = GrammarScorer(self.modelpath, score_cache_path=cachepath, instrument=True)
+        self.assertNotEqual(changed.cal_fluency_tokens(SENTENCES[0]), scores[0])
+        self.assertEqual(changed.cal_fluency_tokens(SENTENCES[0]),
+                         GrammarScorer(self.modelpath, cache_size=0).cal_fluency_tokens(SENTENCES[0]))
+        self.assertEqual(changed.stats_snapshot()['persistent_hits'], 1)
+
+
+class StatsTest(ToyModelTestCase):
+
+    """
+    打分统计及其快照
+    """
+
+    # SENTENCES的19个三元组：6个三元组命中，(w1 w2)、(w2 w3)回退分别6、4个，
+    # 一元组回退3个；a、cow替换成<unk>共5次
+    TRIGRAMS = 19
+    BACKOFF_DEPTH = [6, 6, 4, 3]
+    UNK_SUBSTITUTIONS = 5
+
+    def test_not_instrumented(self):
+
+        scorer = GrammarScorer(self.modelpath)
+        scorer.cal_fluency_tokens(SENTENCES[0])
+        self.assertIsNone(scorer.stats)
+        self.assertIsNone(scorer.stats_snapshot())
+
+    def test_sentences(self):
+
+        for scorer in self.scorers(cache_size=0, instrument=True):
+
+            for tokens in SENTENCES:
+                scorer.cal_fluency_tokens(tokens)
+
+            snapshot = scorer.stats_snapshot()
+            self.assertEqual(snapshot['fluency_calls'], len(SENTENCES))
+            self.assertEqual(snapshot['sentences'], len(SENTENCES))
+            self.assertEqual(snapshot['trigrams'], self.TRIGRAMS)
+            self.assertEqual(snapshot['backoff_depth'], self.BACKOFF_DEPTH)
+            self.assertEqual(snapshot['order_hits'], {3: 6, 2: 10, 1: 3})
+            self.assertEqual(snapshot['unk_substitutions'], self.UNK_SUBSTITUTIONS)
+            self.assertEqual(snapshot['cache_hit_rate'], 0.0)
+            self.assertGreaterEqual(snapshot['seconds'], 0.0)
+
+    def test_batch(self):
+
+        # 向量化查找的统计与逐句打分相同
+        for scorer in self.scorers(cache_size=0, instrument=True)[1:]:
+
+            scorer.cal_fluency_batch(SENTENCES)
+
+            snapshot = scorer.stats_snapshot()
+            self.assertEqual(snapshot['batch_calls'], 1)
+            self.assertEqual(snapshot['fluency_calls'], 0)
+            self.assertEqual(snapshot['sentences'], len(SENTENCES))
+            self.assertEqual(snapshot['trigrams'], self.TRIGRAMS)
+            self.assertEqual(snapshot['backoff_depth'], self.BACKOFF_DEPTH)
+            self.assertEqual(snapshot['unk_substitutions'], self.UNK_SUBSTITUTIONS)
+
+    def test_cache(self):
+
+        scorer = GrammarScorer(self.modelpath, instrument=True)
+
+        # 15个不同的三元组，第一遍命中4次，第二遍全部命中
+        for repeat in range(2):
+            for tokens in SENTENCES:
+                scorer.cal_fluency_tokens(tokens)
+
+        snapshot = scorer.stats_snapshot(reset=True)
+        self.assertEqual(snapshot['cache_misses'], 15)
+        self.assertEqual(snapshot['cache_hits'], 2 * self.TRIGRAMS - 15)
+        self.assertEqual(snapshot['trigrams'], 15)
+        self.assertAlmostEqual(snapshot['cache_hit_rate'], (2 * self.TRIGRAMS - 15) / float(2 * self.TRIGRAMS))
+        self.assertEqual(scorer.cache_info()['hits'], snapshot['cache_hits'])
+
+        # reset后清零；advance、finish按三元组调用计数，不计语句
+        state, increment = scorer.advance(('<s>', 'the'), 'cat')
+        state, increment = scorer.advance(state, 'mat')
+        scorer.finish(state)
+
+        snapshot = scorer.stats_snapshot()
+        self.assertEqual(snapshot['ngram_calls'], 3)
+        self.assertEqual(snapshot['sentences'], 0)
+        self.assertEqual(snapshot['fluency_calls'], 0)
+        self.assertEqual(snapshot['cache_hits'], 1)
+        self.assertEqual(snapshot['trigrams'], 2)
+
+        # 快照是副本
+        snapshot['backoff_depth'][0] += 100
+        self.assertNotEqual(scorer.stats_snapshot()['backoff_depth'], snapshot['backoff_depth'])
+
+
+class SharedModelTest(ToyModelTestCase):
+
+    """
+    share()后子进程映射同一模型文件，得分不变
+    """
+
+    def test_pool(self):
+
+        for storage in ('dict', 'trie'):
+
+            scorer = GrammarScorer(self.modelpath, storage)
+            expected = [scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+
+            path = scorer.share()
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(scorer.storage, 'mmap')
+            if os.path.isdir('/dev/shm'):
+                self.assertEqual(os.path.dirname(path), '/dev/shm')
+            self.assertEqual([scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+
+            pool = multiprocessing.Pool(2)
+            try:
+                results = pool.map(child_scores, [scorer] * 4)
+            finally:
+                pool.close()
+                pool.join()
+
+            for pid, child_storage, child_path, scores in results:
+                self.assertNotEqual(pid, os.getpid())
+                self.assertEqual((child_storage, child_path), ('mmap', path))
+                self.assertEqual(scores, expected)
+
+            # 反序列化得到的打分器不负责删除文件
+            copy = pickle.loads(pickle.dumps(scorer, pickle.HIGHEST_PROTOCOL))
+            copy.release()
+            self.assertTrue(os.path.exists(path))
+
+            scorer.release()
+            self.assertFalse(os.path.exists(path))
+            self.assertIsNone(scorer.shared_path)
+
+            # 已映射的模型在文件删除后仍可打分
+            self.assertEqual([scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+            scorer.release()
+
+    def test_given_path(self):
+
+        # 指定路径时由调用者管理文件，release()不删除
+        scorer = GrammarScorer(self.modelpath)
+        path = os.path.join(self.directory, 'shared.bin')
+
+        self.assertEqual(scorer.share(path), path)
+        scorer.release()
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
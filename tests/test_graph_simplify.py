@@ -0,0 +1,83 @@
+# -*- coding: utf8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+from common.grammar import GrammarScorer
+from core import coati, coati_v2, takahe
+from tests.toy_cluster import SENTENCES, WEIGHT_SENTENCES
+from tests.toy_model import write_model
+
+
+SHORT_SENTENCES = ['Moscow/NNP condemned/VBD the/DT attack/NN ./PUNCT',
+                   'Ankara/NNP defends/VBZ its/PRP$ airspace/NN ./PUNCT']
+''' 只能构成短路径的句子，其结点在剪枝时删除 '''
+
+SHORT_WEIGHT_SENTENCES = ['Moscow/NNP/1.7 condemned/VBD/1.2 the/DT/1.1 attack/NN/1.5 ./PUNCT/1.4',
+                          'Ankara/NNP/1.7 defends/VBZ/1.2 its/PRP$/1.0 airspace/NN/1.5 ./PUNCT/1.4']
+
+
+def unpruned(wordgraph_class):
+
+    """
+    不做剪枝预处理的词图类
+    """
+
+    class UnprunedWordGraph(wordgraph_class):
+
+        def simplify_graph(self):
+            pass
+
+    return UnprunedWordGraph
+
+
+class PruneGraphTest(unittest.TestCase):
+
+    """
+    剪枝预处理不丢失满足约束的路径
+    """
+
+    def test_k_shortest_paths(self):
+
+        for wordgraph_class, sentences in ((takahe.word_graph, SENTENCES + SHORT_SENTENCES),
+                                           (coati.WordGraph, WEIGHT_SENTENCES + SHORT_WEIGHT_SENTENCES)):
+
+            for nb_words in (8, 14):
+
+                pruned = wordgraph_class(sentences, nb_words=nb_words)
+                full = unpruned(wordgraph_class)(sentences, nb_words=nb_words)
+
+                self.assertLess(pruned.graph.number_of_nodes(), full.graph.number_of_nodes())
+                self.assertEqual(pruned.simplify_stats['nodes_after'], pruned.graph.number_of_nodes())
+
+                expected = full.get_compression(100000)
+                self.assertGreater(len(expected), 0)
+                self.assertEqual(pruned.get_compression(100000), expected)
+
+    def test_pruning_bfs(self):
+
+        directory = tempfile.mkdtemp()
+        try:
+            grammar_scorer = GrammarScorer(write_model(directory))
+
+            sentences = ['the/DT/1.1 cat/NN/1.5 sat/VBD/1.2 on/IN/1.0 the/DT/1.1 mat/NN/1.5 with/IN/1.0 '
+                         'the/DT/1.1 dog/NN/1.5 ./PUNCT/1.4',
+                         'the/DT/1.1 dog/NN/1.5 sat/VBD/1.2 ./PUNCT/1.4',
+                         'a/DT/1.1 cow/NN/1.5 ./PUNCT/1.4']
+
+            pruned = coati_v2.WordGraph(sentences, grammar_scorer)
+            full = unpruned(coati_v2.WordGraph)(sentences, grammar_scorer)
+
+            self.assertGreater(pruned.simplify_stats['too_short_nodes'], 0)
+
+            # 队列及邻接结点数不受限制时，搜索到全部路径
+            expected = full.event_guided_multi_compress(1.0, 1000, 10 ** 6, 10 ** 6)
+            self.assertGreater(len(expected), 0)
+            self.assertEqual(pruned.event_guided_multi_compress(1.0, 1000, 10 ** 6, 10 ** 6), expected)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+# -*- coding: utf8 -*-
+
+import random
+import re
+import unittest
+
+from core import coati, keyphrases, takahe
+from tests.toy_cluster import SENTENCES, WEIGHT_SENTENCES
+
+
+def reference_clusters(keyphrase_candidates, keyphrase_scores):
+
+    """
+    改为倒排索引之前的聚类：每个关键短语与每个簇的代表短语逐一比较
+    """
+
+    descending = sorted(keyphrase_candidates,
+                        key=lambda x: len(keyphrase_candidates[x]),
+                        reverse=True)
+
+    clusters = {}
+    for keyphrase in descending:
+        found_cluster = False
+        keyphrase_words = set(keyphrase.split(' '))
+        for cluster in clusters:
+            if len(keyphrase_words.difference(cluster.split(' '))) == 0:
+                clusters[cluster].append(keyphrase)
+                found_cluster = True
+        if not found_cluster:
+            clusters[keyphrase] = [keyphrase]
+
+    best_candidate_keyphrases = []
+    for cluster in clusters:
+        sorted_cluster = sorted(clusters[cluster], key=lambda k: keyphrase_scores[k], reverse=True)
+        best_candidate_keyphrases.append(sorted_cluster[0])
+
+    non_redundant_keyphrases = []
+    sorted_keyphrases = sorted(best_candidate_keyphrases, key=lambda k: keyphrase_scores[k], reverse=True)
+    for keyphrase in sorted_keyphrases:
+        if not any(keyphrase in previous for previous in non_redundant_keyphrases):
+            non_redundant_keyphrases.append(keyphrase)
+
+    return clusters, set(non_redundant_keyphrases)
+
+
+def linear_matches(keyphrases, words):
+
+    """
+    改为自动机之前的逐短语扫描，限定为整词匹配
+    """
+
+    compression = ' %s ' % ' '.join(words)
+    return [keyphrase for keyphrase in keyphrases if ' %s ' % keyphrase in compression]
+
+
+def candidates_of(phrases):
+
+    return dict((phrase, [(word, 'NN') for word in phrase.split(' ')]) for phrase in phrases)
+
+
+class ClusterTest(unittest.TestCase):
+
+    """
+    倒排索引聚类与逐簇比较的结果相同
+    """
+
+    # 嵌套（giant tortoise ⊂ pinta island giant tortoise）、词重叠但不包含、
+    # 词序不同、子串但非整词（war ⊂ warplane）
+    PHRASES = ['pinta island giant tortoise', 'giant tortoise', 'island tortoise', 'tortoise',
+               'pinta island', 'giant island', 'russian military aircraft', 'military aircraft',
+               'aircraft military', 'russian warplane', 'warplane', 'war', 'syrian border', 'border',
+               'turkish border', 'turkish air force', 'air force', 'force']
+
+    def assertSameClusters(self, candidates, scores):
+
+        clusters, expected = reference_clusters(candidates, scores)
+        self.assertEqual(keyphrases.cluster_keyphrases(candidates, scores), expected)
+
+        # 每个被保留的短语都是某个簇的最优短语
+        for keyphrase in expected:
+            self.assertTrue(any(keyphrase in members and scores[keyphrase] == max(scores[k] for k in members)
+                                for members in clusters.values()))
+
+    def test_nested_phrases(self):
+
+        candidates = candidates_of(self.PHRASES)
+
+        # 短语越长得分越高、越短越高，以及全部相同（并列）
+        for scores in [dict((k, len(k)) for k in self.PHRASES),
+                       dict((k, 1.0 / len(k)) for k in self.PHRASES),
+                       dict((k, 1.0) for k in self.PHRASES)]:
+            self.assertSameClusters(candidates, scores)
+
+    def test_random_scores(self):
+
+        candidates = candidates_of(self.PHRASES)
+        generator = random.Random(7)
+
+        for trial in range(200):
+            scores = dict((k, generator.choice([0.5, 1.0, 1.5, 2.0, generator.random()])) for k in self.PHRASES)
+            subset = dict((k, candidates[k]) for k in self.PHRASES if generator.random() < 0.7)
+            self.assertSameClusters(subset, scores)
+
+    def test_reranker(self):
+
+        # 构造时已聚类：重新生成全部候选短语及其得分
+        reranker = takahe.keyphrase_reranker(SENTENCES, [], lang='en')
+        reranker.keyphrase_candidates = {}
+        reranker.keyphrase_scores = {}
+        reranker.generate_candidates()
+        reranker.score_keyphrase_candidates()
+
+        candidates = dict(reranker.keyphrase_candidates)
+        scores = dict(reranker.keyphrase_scores)
+        clusters, expected = reference_clusters(candidates, scores)
+
+        reranker.cluster_keyphrase_candidates()
+        self.assertEqual(set(reranker.keyphrase_candidates), expected)
+        self.assertEqual(set(reranker.keyphrase_scores), expected)
+
+
+class MatcherTest(unittest.TestCase):
+
+    """
+    自动机找到的短语与逐短语扫描相同
+    """
+
+    # 共同前缀（giant tortoise / giant island）、重叠（island giant / giant tortoise）、
+    # 短语的后缀也是短语（island giant tortoise / giant tortoise / tortoise）
+    PHRASES = ['pinta island', 'island giant', 'giant tortoise', 'giant island', 'island giant tortoise',
+               'tortoise', 'giant giant', 'pinta island giant tortoise', 'island island', 'war']
+
+    def test_matches(self):
+
+        matcher = keyphrases.KeyphraseMatcher(self.PHRASES)
+
+        for compression in ['the pinta island giant tortoise is dead',
+                            # 同一短语出现两次只计一次
+                            'giant tortoise and giant tortoise',
+                            'giant giant giant island island island giant',
+                            'island giant island giant tortoise',
+                            # 不是整词
+                            'the warplane and the tortoises',
+                            'tortoise', '']:
+            words = compression.split(' ') if compression else []
+            self.assertEqual(matcher.matches(words), linear_matches(self.PHRASES, words))
+
+        self.assertEqual(matcher.matches('giant tortoise giant tortoise'.split(' ')), ['giant tortoise', 'tortoise'])
+
+    def test_random_compressions(self):
+
+        matcher = keyphrases.KeyphraseMatcher(self.PHRASES)
+        vocabulary = ['pinta', 'island', 'giant', 'tortoise', 'war', 'the']
+        generator = random.Random(11)
+
+        for trial in range(2000):
+            words = [generator.choice(vocabulary) for i in range(generator.randint(0, 12))]
+            self.assertEqual(matcher.matches(words), linear_matches(self.PHRASES, words))
+
+    def test_reranker(self):
+
+        # 重排得分：每个出现的短语得分只加一次
+        reranker = takahe.keyphrase_reranker(SENTENCES, [], lang='en')
+        compressions = []
+        for sentence in reranker.sentences:
+            path = [(word, pos) for word, pos in sentence]
+            compressions.append((len(path) * 1.5, path))
+            compressions.append((len(path) * 2.0, path + path))
+        reranker.nbest_compressions = compressions
+
+        expected = []
+        for cummulative_score, path in compressions:
+            words = [u[0] for u in path]
+            total = 1.0 + sum(reranker.keyphrase_scores[k] for k in linear_matches(reranker.keyphrase_candidates, words))
+            expected.append((cummulative_score / (len(path) * total), path))
+        expected.sort()
+
+        reranked = reranker.rerank_nbest_compressions()
+        self.assertEqual([path for score, path in reranked], [path for score, path in expected])
+        for (score, path), (expected_score, expected_path) in zip(reranked, expected):
+            self.assertAlmostEqual(score, expected_score, places=12)
+
+
+class WeightedInputTest(unittest.TestCase):
+
+    """
+    word/POS/weight形式的输入去掉权重后与word/POS相同
+    """
+
+    def test_wordpos_to_tuple(self):
+
+        for module in [takahe, coati]:
+            reranker = module.keyphrase_reranker([], [], lang='en')
+            for word, expected in [('Syria/NNP', ('syria', 'NNP')),
+                                   ('Syria/NNP/2.172298', ('syria', 'NNP')),
+                                   ('Syria/NNP/2', ('syria', 'NNP')),
+                                   ('F/16/NN', ('f/16', 'NN')),
+                                   ('F/16/NN/1.5', ('f/16', 'NN')),
+                                   ('24/CD', ('24', 'CD')),
+                                   ('24/CD/0.75', ('24', 'CD')),
+                                   # 只有两段：数字是词性而不是权重
+                                   ('3/4', ('3', '4')),
+                                   ('a/DT/x1', ('a/dt', 'x1'))]:
+                self.assertEqual(reranker.wordpos_to_tuple(word), expected)
+
+    def test_reranker(self):
+
+        sentences = [re.sub(r'/[\d.]+( |$)', r'\1', sentence) for sentence in WEIGHT_SENTENCES]
+        self.assertNotIn('/2.', sentences[0])
+
+        for module in [takahe, coati]:
+            weighted = module.keyphrase_reranker(WEIGHT_SENTENCES, [], lang='en')
+            unweighted = module.keyphrase_reranker(sentences, [], lang='en')
+
+            self.assertTrue(weighted.keyphrase_candidates)
+            self.assertEqual(weighted.sentences, unweighted.sentences)
+            self.assertEqual(weighted.keyphrase_candidates, unweighted.keyphrase_candidates)
+            self.assertEqual(weighted.keyphrase_scores, unweighted.keyphrase_scores)
+
+
+if __name__ == '__main__':
+    unittest.main()
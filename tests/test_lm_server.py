@@ -0,0 +1,155 @@
+# -*- coding: utf8 -*-
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from common.grammar import GrammarScorer
+from common.lm_server import GrammarClient, LMServer
+from tests.toy_model import SENTENCES, write_model
+
+
+class LMServerTest(unittest.TestCase):
+
+    """
+    通过临时Unix域套接字打分，与本地打分器的结果相同
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.modelpath = write_model(self.directory)
+        self.socket_path = os.path.join(self.directory, 'lm.sock')
+
+        self.scorer = GrammarScorer(self.modelpath, cache_size=0)
+        ''' 本地打分器 '''
+
+        self.server = LMServer(GrammarScorer(self.modelpath), self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.client = GrammarClient(self.socket_path)
+
+    def tearDown(self):
+
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+        self.assertFalse(os.path.exists(self.socket_path))
+        shutil.rmtree(self.directory)
+
+    def test_fluency(self):
+
+        expected = [self.scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+
+        self.assertEqual([self.client.cal_fluency(' '.join(tokens)) for tokens in SENTENCES], expected)
+        self.assertEqual([self.client.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+        self.assertEqual(self.client.cal_fluency_batch(SENTENCES), expected)
+        self.assertEqual(self.client.cal_ngram_fluency('the', 'cat', 'sat'),
+                         self.scorer.cal_ngram_fluency('the', 'cat', 'sat'))
+
+        info = self.client.call('info')
+        self.assertEqual((info['modelpath'], info['storage']), (self.modelpath, 'dict'))
+
+    def test_pipelined(self):
+
+        # 先发送全部请求，再以任意顺序取结果
+        requests = [self.client.submit('fluency_tokens', sentences=[tokens]) for tokens in SENTENCES]
+        requests.append(self.client.submit('ngram', trigrams=[['<s>', 'the', 'dog'], ['cow', 'sat', 'on']]))
+
+        self.assertEqual(self.client.result(requests[-1]), [self.scorer.cal_ngram_fluency('<s>', 'the', 'dog'),
+                                                            self.scorer.cal_ngram_fluency('cow', 'sat', 'on')])
+        for request_id, tokens in reversed(zip(requests, SENTENCES)):
+            self.assertEqual(self.client.result(request_id), [self.scorer.cal_fluency_tokens(tokens)])
+
+        self.assertEqual(self.client.pending, [])
+        self.assertEqual(self.client.responses, {})
+
+        # 超过max_pending时先读取部分响应
+        client = GrammarClient(self.socket_path, max_pending=2)
+        requests = [client.submit('fluency_tokens', sentences=[tokens]) for tokens in SENTENCES]
+        self.assertLessEqual(len(client.pending), 2)
+        self.assertEqual([client.result(request_id)[0] for request_id in requests],
+                         [self.scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES])
+        client.close()
+
+    def test_unknown_op(self):
+
+        # 错误响应带请求编号，连接可继续使用
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        rfile = sock.makefile('rb')
+
+        sock.sendall(json.dumps({'id': 7, 'op': 'bogus'}) + '\n' + 'not json\n' +
+                     json.dumps({'id': 8, 'op': 'ngram', 'trigrams': [['the', 'cat', 'sat']]}) + '\n')
+        self.assertEqual(json.loads(rfile.readline()), {'id': 7, 'error': 'ValueError: unknown op: bogus'})
+        self.assertIn('error', json.loads(rfile.readline()))
+        self.assertEqual(json.loads(rfile.readline()),
+                         {'id': 8, 'result': [self.scorer.cal_ngram_fluency('the', 'cat', 'sat')]})
+
+        rfile.close()
+        sock.close()
+
+        self.assertRaises(RuntimeError, self.client.call, 'bogus')
+        self.assertEqual(self.client.cal_fluency_tokens(SENTENCES[0]), self.scorer.cal_fluency_tokens(SENTENCES[0]))
+
+    def test_states(self):
+
+        # 逐词累加与整句打分相同
+        for tokens in SENTENCES:
+            state = self.client.begin()
+            score = 0.0
+            for word in tokens:
+                state, increment = self.client.advance(state, word)
+                score += increment
+            self.assertEqual(score + self.client.finish(state), self.scorer.cal_fluency_tokens(tokens))
+
+    def test_expand(self):
+
+        words = ['cat', 'dog', 'cow', 'sat', 'the', 'cat']
+        client = GrammarClient(self.socket_path)
+
+        for state in [('<s>',), ('<s>', 'the'), ('sat', 'on'), ('a', 'cow')]:
+
+            expected = self.scorer.expand(state, words)
+
+            # 未缓存的三元组只用一次请求取得，再次扩展完全来自本地缓存
+            next_id = client.next_id
+            self.assertEqual(client.expand(state, words), expected)
+            self.assertEqual(client.next_id, next_id + 1)
+            self.assertEqual(client.expand(state, words), expected)
+            self.assertEqual(client.next_id, next_id + 1)
+
+            self.assertEqual([(next_state, increment, self.scorer.finish(next_state))
+                              for next_state, increment in [self.scorer.advance(state, word) for word in words]],
+                             expected)
+
+        self.assertEqual(client.expand(('sat', 'on'), []), [])
+        client.close()
+
+    def test_client_cache(self):
+
+        client = GrammarClient(self.socket_path, cache_size=2)
+
+        client.cal_ngram_fluency('the', 'cat', 'sat')
+        client.cal_ngram_fluency('cat', 'sat', 'on')
+        self.assertEqual(client.next_id, 2)
+
+        # 命中不发送请求；超过容量时淘汰最久未使用的
+        client.cal_ngram_fluency('the', 'cat', 'sat')
+        client.cal_ngram_fluency('sat', 'on', 'the')
+        self.assertEqual(client.next_id, 3)
+        self.assertEqual(list(client.cache), [('the', 'cat', 'sat'), ('sat', 'on', 'the')])
+
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
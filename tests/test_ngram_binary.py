@@ -0,0 +1,118 @@
+# -*- coding: utf8 -*-
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from common.bloom import MappedBloomFilter, hash_ids
+from common.grammar import GrammarScorer
+from common.ngram_binary import convert_model, open_binary_model
+from common.ngram_reader import NgramModelReader
+from common.ngram_trie import NgramTrieBuilder
+from tests.toy_model import ABSENT_NGRAMS, SENTENCES, write_model
+
+
+class NgramBinaryTest(unittest.TestCase):
+
+    """
+    二进制模型文件的转换及映射打开
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.modelpath = write_model(self.directory)
+        self.binpath = os.path.join(self.directory, 'toy.bin')
+
+        self.model = dict((ngram, (prob, backoff)) for ngram, prob, backoff in NgramModelReader(self.modelpath))
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+
+        convert_model(self.modelpath, self.binpath, dtype='float64')
+        trie = open_binary_model(self.binpath)
+
+        self.assertEqual(len(trie), len(self.model))
+        self.assertEqual(len(trie.vocab), 9)
+
+        for ngram, entry in self.model.iteritems():
+            self.assertEqual(trie[ngram], entry)
+
+        for ngram in ABSENT_NGRAMS:
+            self.assertNotIn(ngram, trie)
+
+    def test_fluency(self):
+
+        # float64存储时得分与dict模型完全相同
+        convert_model(self.modelpath, self.binpath, dtype='float64')
+        bloompath = os.path.join(self.directory, 'bloom.bin')
+        convert_model(self.modelpath, bloompath, dtype='float64', bloom_error_rate=0.01)
+
+        plain = GrammarScorer(self.modelpath, 'dict', cache_size=0)
+        mapped = GrammarScorer(self.binpath, 'mmap', cache_size=0)
+        bloom = GrammarScorer(bloompath, 'mmap', cache_size=0, bloom_error_rate=0.01)
+
+        expected = [plain.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+
+        self.assertEqual([mapped.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+        self.assertEqual([bloom.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+        self.assertEqual(mapped.cal_fluency_batch(SENTENCES), expected)
+
+    def test_mapped_bloom(self):
+
+        # 转换时写入的过滤器映射打开，与内存中建立的过滤器探测结果相同
+        convert_model(self.modelpath, self.binpath, dtype='float64', bloom_error_rate=0.01)
+        trie = open_binary_model(self.binpath)
+
+        builder = NgramTrieBuilder('float64')
+        for ngram, prob, backoff in NgramModelReader(self.modelpath):
+            builder.add(ngram, prob, backoff)
+        reference = builder.build()
+        reference.build_bloom(0.01)
+
+        self.assertEqual(sorted(trie.blooms), [3])
+        self.assertIsInstance(trie.blooms[3], MappedBloomFilter)
+        self.assertEqual(trie.blooms[3].array().tostring(), reference.blooms[3].array().tostring())
+
+        for ids in [(a, b, c) for a in range(9) for b in range(9) for c in range(9)]:
+            self.assertEqual(trie.blooms[3].contains_ids(ids), reference.blooms[3].contains_ids(ids))
+            self.assertEqual(trie.blooms[3].contains_hashes(*hash_ids(ids)), trie.blooms[3].contains_ids(ids))
+
+        for ngram, entry in self.model.iteritems():
+            self.assertEqual(trie[ngram], entry)
+        for ngram in ABSENT_NGRAMS:
+            self.assertNotIn(ngram, trie)
+
+        # 打分器及其反序列化得到的副本只映射文件中的过滤器
+        scorer = GrammarScorer(self.binpath, 'mmap', cache_size=0, bloom_error_rate=0.01)
+        self.assertIsInstance(scorer.ngram_model.blooms[3], MappedBloomFilter)
+        copy = pickle.loads(pickle.dumps(scorer))
+        self.assertIsInstance(copy.ngram_model.blooms[3], MappedBloomFilter)
+        self.assertEqual([copy.cal_fluency_tokens(tokens) for tokens in SENTENCES],
+                         [scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES])
+
+    def test_shared_bloom(self):
+
+        # share()将过滤器写入共享模型文件
+        scorer = GrammarScorer(self.modelpath, 'trie', cache_size=0, bloom_error_rate=0.01)
+        expected = [scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES]
+
+        scorer.share(self.binpath)
+        self.assertIsInstance(scorer.ngram_model.blooms[3], MappedBloomFilter)
+        self.assertEqual([scorer.cal_fluency_tokens(tokens) for tokens in SENTENCES], expected)
+
+    def test_not_a_model(self):
+
+        with open(self.binpath, 'wb') as binfile:
+            binfile.write('not a model' * 10)
+
+        self.assertRaises(ValueError, open_binary_model, self.binpath)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf8 -*-
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from common.grammar import GrammarScorer
+from common.ngram_binary import convert_model
+from common.ngram_quantize import quantization_report, quantize_values
+from tests.toy_model import SENTENCES, write_model
+
+
+def random_arpa(generator, nb_words=40, nb_bigrams=600, nb_trigrams=1500):
+
+    """
+    随机生成的三元模型，各阶的概率远多于255个不同的值，8位量化有损
+    :return: (模型文本, 词表)
+    """
+
+    words = ['w%d' % i for i in range(nb_words)]
+    vocabulary = words + ['</s>', '<s>', '<unk>']
+
+    def value(low, high):
+        return '%.6f' % generator.uniform(low, high)
+
+    bigrams = set()
+    while len(bigrams) < nb_bigrams:
+        bigrams.add((generator.choice(['<s>'] + words), generator.choice(words + ['</s>'])))
+    bigrams = sorted(bigrams)
+
+    trigrams = set()
+    while len(trigrams) < nb_trigrams:
+        w1, w2 = generator.choice(bigrams)
+        trigrams.add((w1, w2, generator.choice(words + ['</s>'])))
+    trigrams = sorted(trigrams)
+
+    lines = ['', '\\data\\', 'ngram 1=%d' % len(vocabulary), 'ngram 2=%d' % len(bigrams),
+             'ngram 3=%d' % len(trigrams), '', '\\1-grams:']
+    for word in vocabulary:
+        prob = '-99' if word == '<s>' else value(-4.0, -1.0)
+        lines.append('%s\t%s\t%s' % (prob, word, value(-1.0, 0.0)) if word != '</s>' else '%s\t%s' % (prob, word))
+    lines += ['', '\\2-grams:']
+    for bigram in bigrams:
+        lines.append('%s\t%s\t%s' % (value(-3.0, -0.1), ' '.join(bigram), value(-1.0, 0.0)))
+    lines += ['', '\\3-grams:']
+    for trigram in trigrams:
+        lines.append('%s\t%s' % (value(-2.5, -0.05), ' '.join(trigram)))
+    lines += ['', '\\end\\', '']
+
+    return '\n'.join(lines), words
+
+
+class QuantizeValuesTest(unittest.TestCase):
+
+    """
+    概率数组的量化
+    """
+
+    def test_lossless(self):
+
+        # 不同的值少于编码数时无损，不存在的N元组编码为0
+        values = np.array([-1.5, np.nan, -0.25, -1.5, -3.0, np.nan])
+        for bits in (8, 16):
+            codes, codebook = quantize_values(values, bits)
+            self.assertEqual(codes.dtype, np.uint8 if bits == 8 else np.uint16)
+            self.assertEqual(list(codes == 0), [False, True, False, False, False, True])
+            self.assertEqual(list(codebook[codes][~np.isnan(values)]), [-1.5, -0.25, -1.5, -3.0])
+            self.assertEqual(len(codebook), 4)
+
+    def test_lossy(self):
+
+        # 8位时每个值编码为所在等大小分箱的均值
+        values = np.random.RandomState(3).uniform(-5.0, 0.0, 10000)
+        codes, codebook = quantize_values(values, 8)
+
+        self.assertLessEqual(len(codebook), 256)
+        self.assertLess(np.abs(codebook[codes] - values).max(), 0.05)
+
+        codes, codebook = quantize_values(values, 16)
+        self.assertEqual(list(codebook[codes]), list(values))
+
+    def test_bits(self):
+
+        self.assertRaises(ValueError, quantize_values, [-1.0], 4)
+
+
+class QuantizedScorerTest(unittest.TestCase):
+
+    """
+    量化模型的得分与未量化模型的误差
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_toy_model(self):
+
+        # 小型模型各阶不同的值很少，量化无损，误差只来自float32
+        modelpath = write_model(self.directory)
+        reference = GrammarScorer(modelpath, cache_size=0)
+        expected = reference.cal_fluency_batch(SENTENCES)
+
+        for bits in (8, 16):
+            quantized = GrammarScorer(modelpath, 'trie', cache_size=0, quantize_bits=bits)
+            for tokens, score in zip(SENTENCES, expected):
+                self.assertAlmostEqual(quantized.cal_fluency_tokens(tokens), score, places=6)
+            self.assertEqual(quantized.cal_fluency_batch(SENTENCES),
+                             [quantized.cal_fluency_tokens(tokens) for tokens in SENTENCES])
+
+    def test_random_model(self):
+
+        generator = random.Random(11)
+        text, words = random_arpa(generator)
+        modelpath = write_model(self.directory, 'random.arpa', text)
+
+        clusters = [[[generator.choice(words + ['oov']) for i in range(generator.randint(3, 15))]
+                     for k in range(20)] for n in range(30)]
+
+        reference = GrammarScorer(modelpath, cache_size=0)
+
+        # 8位有损：得分的相对误差在5%以内，排序基本不变
+        report = quantization_report(reference, GrammarScorer(modelpath, 'trie', cache_size=0, quantize_bits=8),
+                                     clusters)
+        self.assertGreater(report['max_abs_diff'], 0.0)
+        self.assertLess(report['max_rel_diff'], 0.05)
+        self.assertGreater(report['kendall_tau'], 0.95)
+
+        # 16位：不同的值少于编码数，量化无损
+        report = quantization_report(reference, GrammarScorer(modelpath, 'trie', cache_size=0, quantize_bits=16),
+                                     clusters)
+        self.assertLess(report['max_rel_diff'], 1e-5)
+        self.assertEqual(report['same_ranking'], 1.0)
+
+        # 量化的二进制模型与量化的trie得分相同
+        binpath = os.path.join(self.directory, 'random.bin')
+        convert_model(modelpath, binpath, bits=8)
+        mapped = GrammarScorer(binpath, 'mmap', cache_size=0)
+        quantized = GrammarScorer(modelpath, 'trie', cache_size=0, quantize_bits=8)
+        for candidates in clusters[:5]:
+            self.assertEqual(mapped.cal_fluency_batch(candidates), quantized.cal_fluency_batch(candidates))
+
+
+if __name__ == '__main__':
+    unittest.main()
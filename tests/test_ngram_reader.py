@@ -0,0 +1,81 @@
+# -*- coding: utf8 -*-
+
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from common.ngram_reader import NgramModelReader
+from tests.toy_model import NGRAM_COUNT, TOY_ARPA, write_model
+
+
+class NgramReaderTest(unittest.TestCase):
+
+    """
+    ARPA、tsv及压缩模型文件的读取
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.modelpath = write_model(self.directory)
+        self.entries = list(NgramModelReader(self.modelpath))
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_arpa(self):
+
+        reader = NgramModelReader(self.modelpath)
+
+        self.assertEqual(reader.fmt, 'arpa')
+        self.assertEqual(reader.counts, {1: 9, 2: 7, 3: 4})
+
+        entries = list(reader)
+        self.assertEqual(len(entries), NGRAM_COUNT)
+        self.assertEqual(reader.stats['ngrams'], NGRAM_COUNT)
+        self.assertIn(('<s>', -99.0, -0.3010), entries)
+        self.assertIn(('mat </s>', -0.6021, 0.0), entries)
+        self.assertIn(('the cat sat', -0.2218, 0.0), entries)
+
+    def test_chunks(self):
+
+        # 行跨越读取块的边界
+        for chunk_size in (1, 7, 64):
+            self.assertEqual(list(NgramModelReader(self.modelpath, chunk_size=chunk_size)), self.entries)
+
+    def test_compressed(self):
+
+        path = os.path.join(self.directory, 'toy.arpa.gz')
+        modelfile = gzip.open(path, 'wb')
+        modelfile.write(TOY_ARPA)
+        modelfile.close()
+        self.assertEqual(list(NgramModelReader(path)), self.entries)
+
+        path = os.path.join(self.directory, 'toy.arpa.bz2')
+        modelfile = bz2.BZ2File(path, 'wb')
+        modelfile.write(TOY_ARPA)
+        modelfile.close()
+        self.assertEqual(list(NgramModelReader(path)), self.entries)
+
+    def test_tsv(self):
+
+        lines = ['%r\t%s\t%r' % (prob, ngram, backoff) for ngram, prob, backoff in self.entries]
+        path = write_model(self.directory, 'toy.tsv', '\n'.join(lines) + '\n')
+
+        reader = NgramModelReader(path)
+        self.assertEqual(reader.fmt, 'tsv')
+        self.assertEqual(list(reader), self.entries)
+
+    def test_count_mismatch(self):
+
+        path = write_model(self.directory, 'bad.arpa', TOY_ARPA.replace('ngram 2=7', 'ngram 2=8'))
+
+        self.assertRaises(ValueError, list, NgramModelReader(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
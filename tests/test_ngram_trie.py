@@ -0,0 +1,121 @@
+# -*- coding: utf8 -*-
+
+import random
+import shutil
+import tempfile
+import unittest
+
+from common.grammar import GrammarScorer
+from common.ngram_reader import NgramModelReader
+from common.ngram_trie import NgramTrieBuilder
+from tests.toy_model import ABSENT_NGRAMS, NGRAM_COUNT, SENTENCES, write_model
+
+
+class NgramTrieTest(unittest.TestCase):
+
+    """
+    NgramTrie与dict模型的一致性
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.modelpath = write_model(self.directory)
+
+        self.model = {}
+        ''' dict存储的模型 '''
+
+        builder = NgramTrieBuilder('float64')
+        for ngram, prob, backoff in NgramModelReader(self.modelpath):
+            self.model[ngram] = (prob, backoff)
+            builder.add(ngram, prob, backoff)
+
+        self.trie = builder.build()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_len(self):
+
+        # 各阶（包括一元组）都计数，前缀占位元组不计数
+        self.assertEqual(len(self.model), NGRAM_COUNT)
+        self.assertEqual(len(self.trie), len(self.model))
+
+    def test_lookup(self):
+
+        for ngram, entry in self.model.iteritems():
+            self.assertIn(ngram, self.trie)
+            self.assertEqual(self.trie[ngram], entry)
+            self.assertEqual(self.trie.lookup_words(ngram.split(' ')), entry)
+
+        for ngram in ABSENT_NGRAMS:
+            self.assertNotIn(ngram, self.trie)
+            self.assertIsNone(self.trie.lookup_words(ngram.split(' ')))
+
+    def test_insertion_order(self):
+
+        # 任意添加顺序得到相同的trie，重复添加的N元组以最后一次为准
+        entries = sorted(self.model.iteritems())
+        random.Random(7).shuffle(entries)
+
+        builder = NgramTrieBuilder('float64')
+        builder.add('the cat', -9.0, -9.0)
+        for ngram, (prob, backoff) in entries:
+            builder.add(ngram, prob, backoff)
+        builder.add('the dog', -0.5, -0.25)
+        trie = builder.build()
+
+        self.assertEqual(len(trie), len(self.model) + 1)
+        self.assertEqual(trie['the cat'], (-9.0, -9.0))
+        self.assertEqual(trie['the dog'], (-0.5, -0.25))
+
+        for ngram, entry in self.model.iteritems():
+            if ngram != 'the dog':
+                self.assertEqual(trie[ngram], entry)
+
+    def test_float32(self):
+
+        builder = NgramTrieBuilder()
+        for ngram, (prob, backoff) in self.model.iteritems():
+            builder.add(ngram, prob, backoff)
+        trie = builder.build()
+
+        self.assertEqual(len(trie), len(self.model))
+        for ngram, (prob, backoff) in self.model.iteritems():
+            self.assertAlmostEqual(trie[ngram][0], prob, places=6)
+            self.assertAlmostEqual(trie[ngram][1], backoff, places=6)
+
+    def test_bloom_lookup(self):
+
+        # 默认只过滤最高阶；一元组即使指定也不过滤
+        self.trie.build_bloom(0.01)
+        self.assertEqual(sorted(self.trie.blooms), [3])
+
+        self.trie.build_bloom(0.01, orders=[1, 2, 3])
+        self.assertEqual(sorted(self.trie.blooms), [2, 3])
+
+        self.assertEqual(len(self.trie), len(self.model))
+
+        for ngram, entry in self.model.iteritems():
+            self.assertEqual(self.trie.lookup_words(ngram.split(' ')), entry)
+
+        for ngram in ABSENT_NGRAMS:
+            self.assertIsNone(self.trie.lookup_words(ngram.split(' ')))
+
+    def test_bloom_fluency(self):
+
+        plain = GrammarScorer(self.modelpath, 'dict', cache_size=0)
+        trie = GrammarScorer(self.modelpath, 'trie', cache_size=0)
+        bloom = GrammarScorer(self.modelpath, 'trie', cache_size=0, bloom_error_rate=0.01)
+
+        for tokens in SENTENCES:
+            # trie默认以float32存储概率
+            self.assertAlmostEqual(trie.cal_fluency_tokens(tokens), plain.cal_fluency_tokens(tokens), places=6)
+            self.assertEqual(bloom.cal_fluency_tokens(tokens), trie.cal_fluency_tokens(tokens))
+
+        self.assertEqual(bloom.cal_fluency_batch(SENTENCES), trie.cal_fluency_batch(SENTENCES))
+
+
+if __name__ == '__main__':
+    unittest.main()
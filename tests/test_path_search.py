@@ -0,0 +1,149 @@
+# -*- coding: utf8 -*-
+
+import itertools
+import os
+import random
+import unittest
+
+from core import coati, takahe
+from core.path_search import BoundedFrontier
+from tests.toy_cluster import SENTENCES, WEIGHT_SENTENCES
+
+
+def sentence_keys(compressions):
+
+    """
+    (得分, 句子)列表按句子排序，用于比较不同的搜索方式（得分的累加顺序可能不同）
+    """
+
+    return sorted((' '.join(word for word, tag in path), weight) for weight, path in compressions)
+
+
+class BoundedFrontierTest(unittest.TestCase):
+
+    """
+    有容量限制的标号容器
+    """
+
+    def test_spill_order(self):
+
+        # 写出的标号按序读回，与不限容量时的出队顺序相同
+        generator = random.Random(5)
+        frontier = BoundedFrontier(8, 'spill')
+        reference = BoundedFrontier()
+
+        popped = []
+        expected = []
+        for i in range(2000):
+            label = (generator.random(), 'node', i)
+            frontier.push(label, [i])
+            reference.push(label, [i])
+            if generator.random() < 0.4:
+                popped.append(frontier.pop())
+                expected.append(reference.pop())
+
+            # 文件大小不超过当前写出的标号的两倍
+            if frontier.spill_file is not None:
+                live = sum(run[3] for run in frontier.runs)
+                self.assertLessEqual(os.fstat(frontier.spill_file.fileno()).st_size, 2 * live)
+
+        while len(reference) > 0:
+            popped.append(frontier.pop())
+            expected.append(reference.pop())
+
+        self.assertEqual(popped, expected)
+        self.assertEqual(len(frontier), 0)
+        self.assertEqual(frontier.stats['spilled'], frontier.stats['reloaded'])
+        self.assertGreater(frontier.stats['compactions'], 0)
+        self.assertEqual(os.fstat(frontier.spill_file.fileno()).st_size, 0)
+
+        frontier.close()
+
+    def test_capped_search(self):
+
+        for graph in (takahe.word_graph(SENTENCES, nb_words=8), coati.WordGraph(WEIGHT_SENTENCES, nb_words=8)):
+
+            unbounded = graph.get_compression(100000)
+
+            # 写出到文件不丢失标号，结果与不限容量时相同
+            spilled = graph.get_compression(100000, max_frontier=4, frontier_policy='spill')
+            self.assertEqual(spilled, unbounded)
+            self.assertGreater(graph.search_stats['spilled'], 0)
+            self.assertEqual(graph.search_stats['evictions'], 0)
+
+            # 淘汰的标号计入统计
+            evicted = graph.get_compression(100000, max_frontier=4, frontier_policy='evict')
+            self.assertEqual(graph.search_stats['policy'], 'evict')
+            self.assertEqual(graph.search_stats['max_frontier'], 4)
+            self.assertGreater(graph.search_stats['evictions'], 0)
+            self.assertLess(len(evicted), len(unbounded))
+
+            streamed = list(graph.iter_compression(max_frontier=4, frontier_policy='spill'))
+            self.assertEqual(sentence_keys(streamed), sentence_keys(unbounded))
+
+
+
+class StreamingSearchTest(unittest.TestCase):
+
+    """
+    流式搜索按得分非递减的顺序返回路径
+    """
+
+    def test_order(self):
+
+        for graph in (takahe.word_graph(SENTENCES, nb_words=8), coati.WordGraph(WEIGHT_SENTENCES, nb_words=8)):
+
+            for options in ({}, {'contract': True}, {'bidirectional': True}):
+                streamed = list(graph.iter_compression(**options))
+                weights = [weight for weight, path in streamed]
+
+                self.assertGreater(len(streamed), 100)
+                for previous, weight in zip(weights, weights[1:]):
+                    self.assertLessEqual(previous, weight + 1e-9)
+
+                # 没有重复的句子
+                sentences = [sentence for sentence, weight in sentence_keys(streamed)]
+                self.assertEqual(len(set(sentences)), len(sentences))
+
+            # 提前停止时得到的是最好的路径
+            first = list(itertools.islice(graph.iter_compression(), 10))
+            self.assertEqual(first, graph.get_compression(10))
+
+
+class BidirectionalSearchTest(unittest.TestCase):
+
+    """
+    双向搜索与单向搜索得到相同的路径
+    """
+
+    def assertSameCompressions(self, compressions, expected):
+
+        # 同样的得分序列（允许累加顺序带来的误差）及同样的路径集合
+        self.assertEqual(len(compressions), len(expected))
+        for (weight, path), (expected_weight, expected_path) in zip(compressions, expected):
+            self.assertAlmostEqual(weight, expected_weight, places=9)
+
+        keys = sentence_keys(compressions)
+        expected_keys = sentence_keys(expected)
+        self.assertEqual([sentence for sentence, weight in keys], [sentence for sentence, weight in expected_keys])
+        for (sentence, weight), (expected_sentence, expected_weight) in zip(keys, expected_keys):
+            self.assertAlmostEqual(weight, expected_weight, places=9)
+
+    def test_bidirectional(self):
+
+        for graph in (takahe.word_graph(SENTENCES, nb_words=8), coati.WordGraph(WEIGHT_SENTENCES, nb_words=8)):
+
+            expected = graph.get_compression(100000)
+            self.assertGreater(len(expected), 100)
+
+            for contract in (False, True):
+                self.assertSameCompressions(graph.get_compression(100000, contract=contract, bidirectional=True),
+                                            expected)
+                self.assertSameCompressions(graph.get_compression(100000, contract=contract), expected)
+
+            # 前k条
+            self.assertSameCompressions(graph.get_compression(20, bidirectional=True), expected[:20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+# -*- coding: utf8 -*-
+
+import unittest
+from collections import Counter
+
+import networkx as nx
+
+from core import takahe, textrank
+from tests.toy_cluster import SENTENCES
+
+
+def reference_textrank(graph, d=0.85, f_conv=0.0001):
+
+    """
+    逐结点遍历邻居的TextRank（改为稀疏矩阵迭代之前的实现），直到最大变化小于f_conv
+    """
+
+    scores = dict((node, 1.0) for node in graph.nodes())
+
+    while True:
+
+        previous = scores.copy()
+        residual = 0.0
+
+        for node_i in graph.nodes():
+
+            sum_vj = 0.0
+            for node_j in graph.neighbors_iter(node_i):
+                sum_wjk = 0.0
+                for node_k in graph.neighbors_iter(node_j):
+                    sum_wjk += graph[node_j][node_k]['weight']
+                sum_vj += graph[node_j][node_i]['weight'] * previous[node_j] / sum_wjk
+
+            scores[node_i] = (1 - d) + d * sum_vj
+            residual = max(residual, abs(scores[node_i] - previous[node_i]))
+
+        if residual < f_conv:
+            return scores
+
+
+def reference_graph():
+
+    """
+    小型带权无向图，含一个自环和一个孤立结点
+    """
+
+    graph = nx.Graph()
+    graph.add_weighted_edges_from([('turkey', 'jet', 3), ('turkey', 'border', 2), ('jet', 'border', 1),
+                                   ('border', 'syria', 4), ('syria', 'russia', 1), ('russia', 'bomber', 2),
+                                   ('bomber', 'jet', 1), ('airspace', 'turkey', 1), ('syria', 'syria', 1)])
+    graph.add_node('morning')
+
+    return graph
+
+
+def reference_cooccurrences(sentence, nodes, window):
+
+    """
+    改为Counter之前build_graph的边：逐对检查窗口内的两个词是否都是结点
+    """
+
+    edges = {}
+    max_window = window if window >= 1 else len(sentence)
+
+    for j in range(len(sentence)):
+        for k in range(j + 1, min(len(sentence), j + max_window)):
+            if sentence[j] in nodes and sentence[k] in nodes:
+                pair = tuple(sorted((sentence[j], sentence[k])))
+                edges[pair] = edges.get(pair, 0) + 1
+
+    return edges
+
+
+def ranking(scores):
+
+    return sorted(scores, key=lambda node: (-scores[node], node))
+
+
+class TextRankTest(unittest.TestCase):
+
+    """
+    稀疏矩阵迭代与逐结点实现的一致性
+    """
+
+    def test_reference_graph(self):
+
+        graph = reference_graph()
+        expected = reference_textrank(graph, f_conv=1e-12)
+
+        scores, iterations, residual = textrank.undirected_textrank(graph, f_conv=1e-12)
+        self.assertEqual(sorted(scores), sorted(expected))
+        for node in expected:
+            self.assertAlmostEqual(scores[node], expected[node], places=9)
+
+        # 默认阈值下得分相差在阈值量级，排序不变
+        scores, iterations, residual = textrank.undirected_textrank(graph)
+        self.assertEqual(ranking(scores), ranking(expected))
+        self.assertAlmostEqual(scores['morning'], 0.15)
+
+    def test_adjacency_lists(self):
+
+        # 没有SciPy时的邻接表实现与稀疏矩阵实现相同
+        graph = reference_graph()
+        scores, iterations, residual = textrank.undirected_textrank(graph)
+        adjacency_scores, adjacency_iterations, adjacency_residual = \
+            textrank._adjacency_textrank(graph, graph.nodes(), 0.85, 0.0001, 100, False)
+
+        self.assertEqual(adjacency_iterations, iterations)
+        for node in scores:
+            self.assertAlmostEqual(adjacency_scores[node], scores[node], places=12)
+
+    def test_reranker_graph(self):
+
+        reranker = takahe.keyphrase_reranker(SENTENCES, [], lang='en')
+        expected = reference_textrank(reranker.graph, f_conv=1e-12)
+
+        # 默认阈值下得分误差在1e-4量级：得分相近（或相等）的结点之间的顺序不确定，
+        # 其它结点的顺序不变
+        for node_a in expected:
+            for node_b in expected:
+                if expected[node_a] > expected[node_b] + 1e-3:
+                    self.assertGreater(reranker.word_scores[node_a], reranker.word_scores[node_b])
+
+        for node in expected:
+            self.assertAlmostEqual(reranker.word_scores[node], expected[node], delta=1e-3)
+
+    def test_empty_graph(self):
+
+        self.assertEqual(textrank.undirected_textrank(nx.Graph()), ({}, 0, 0.0))
+
+
+
+class ConvergenceTest(unittest.TestCase):
+
+    """
+    迭代在收敛时停止，并报告迭代次数及最终残差
+    """
+
+    def test_iterations(self):
+
+        graph = reference_graph()
+
+        scores, iterations, residual = textrank.undirected_textrank(graph, f_conv=0.0001, max_iterations=100)
+        self.assertGreater(iterations, 1)
+        self.assertLess(iterations, 100)
+        self.assertLess(residual, 0.0001)
+
+        # 少一次迭代时尚未收敛
+        scores, previous_iterations, previous_residual = \
+            textrank.undirected_textrank(graph, f_conv=0.0001, max_iterations=iterations - 1)
+        self.assertEqual(previous_iterations, iterations - 1)
+        self.assertGreaterEqual(previous_residual, 0.0001)
+
+        # 阈值越小迭代越多
+        tight_iterations = textrank.undirected_textrank(graph, f_conv=1e-10)[1]
+        self.assertGreater(tight_iterations, iterations)
+        self.assertLess(tight_iterations, 100)
+
+    def test_max_iterations(self):
+
+        scores, iterations, residual = textrank.undirected_textrank(reference_graph(), f_conv=0.0, max_iterations=7)
+        self.assertEqual(iterations, 7)
+        self.assertGreater(residual, 0.0)
+
+    def test_relative(self):
+
+        # 相对变化：残差为变化与新得分之比
+        scores, iterations, residual = textrank.undirected_textrank(reference_graph(), f_conv=0.0001, relative=True)
+        self.assertLess(iterations, 100)
+        self.assertLess(residual, 0.0001)
+
+        scores, iterations, residual = textrank.undirected_textrank(reference_graph(), relative=True, max_iterations=1)
+        self.assertAlmostEqual(residual, max(abs(score - 1.0) / score for score in scores.values()))
+
+    def test_reranker(self):
+
+        reranker = takahe.keyphrase_reranker(SENTENCES, [], lang='en')
+        self.assertGreater(reranker.textrank_iterations, 1)
+        self.assertLess(reranker.textrank_iterations, 100)
+        self.assertLess(reranker.textrank_residual, 0.0001)
+        self.assertEqual(reranker.undirected_TextRank(), (reranker.textrank_iterations, reranker.textrank_residual))
+
+
+class CooccurrenceTest(unittest.TestCase):
+
+    """
+    Counter统计的共现次数与逐对检查的结果相同
+    """
+
+    def test_count_cooccurrences(self):
+
+        # 重复的词、被过滤的词（位置不连续）
+        sentence = ['jet', 'turkey', 'the', 'jet', 'border', 'of', 'syria', 'jet', 'border', 'syria']
+        nodes = set(['jet', 'turkey', 'border', 'syria'])
+        tokens = [(j, word) for j, word in enumerate(sentence) if word in nodes]
+
+        for window in [0, 1, 2, 3, 4, 20]:
+            counts = textrank.count_cooccurrences(tokens, window, Counter())
+            self.assertEqual(dict(counts), reference_cooccurrences(sentence, nodes, window))
+
+        # 多个句子累加到同一个Counter
+        counts = Counter()
+        textrank.count_cooccurrences(tokens, 2, counts)
+        textrank.count_cooccurrences(tokens, 2, counts)
+        self.assertEqual(dict(counts), dict((pair, 2 * count) for pair, count in
+                                            reference_cooccurrences(sentence, nodes, 2).items()))
+
+        self.assertEqual(textrank.count_cooccurrences([], 0, Counter()), Counter())
+
+    def test_reranker_graph(self):
+
+        reranker = takahe.keyphrase_reranker(SENTENCES, [], lang='en', stopwords=['turkish'])
+
+        for window in [0, 2, 3, 5]:
+
+            reranker.graph = nx.Graph()
+            reranker.build_graph(window)
+
+            nodes = set(reranker.graph.nodes())
+            edges = {}
+            for sentence in reranker.sentences:
+                for pair, count in reference_cooccurrences(sentence, nodes, window).items():
+                    edges[pair] = edges.get(pair, 0) + count
+
+            self.assertEqual(nodes, set(token for sentence in reranker.sentences for token in sentence
+                                        if token[1] in reranker.syntactic_filter))
+            self.assertNotIn(('turkish', 'JJ'), nodes)
+            self.assertEqual(dict((tuple(sorted((a, b))), data['weight']) for a, b, data in reranker.graph.edges(data=True)),
+                             edges)
+
+
+if __name__ == '__main__':
+    unittest.main()
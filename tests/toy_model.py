@@ -0,0 +1,73 @@
+# -*- coding: utf8 -*-
+
+"""
+测试用的小型ARPA三元模型
+
+The trigram "the cat sat" has no "the cat" bigram, so that the trie stores a
+prefix-only placeholder for it, and the trigrams have no backoff column.
+"""
+
+import os
+
+TOY_ARPA = '''
+\\data\\
+ngram 1=9
+ngram 2=7
+ngram 3=4
+
+\\1-grams:
+-1.2041\t</s>
+-99\t<s>\t-0.3010
+-2.0000\t<unk>
+-1.0000\tthe\t-0.2218
+-1.5229\tcat\t-0.1761
+-1.6990\tdog\t-0.2000
+-1.3010\tsat\t-0.1249
+-1.8239\ton\t-0.3979
+-1.9031\tmat\t-0.1000
+
+\\2-grams:
+-0.3010\t<s> the\t-0.1000
+-0.6990\tthe dog\t-0.0969
+-0.4771\tcat sat\t-0.2218
+-0.5229\tdog sat\t-0.1549
+-0.3979\tsat on\t-0.0458
+-0.2218\ton the\t-0.0792
+-0.6021\tmat </s>
+
+\\3-grams:
+-0.1249\t<s> the dog
+-0.2218\tthe cat sat
+-0.0969\tcat sat on
+-0.1549\tsat on the
+
+\\end\\
+'''
+
+NGRAM_COUNT = 20
+''' TOY_ARPA中N元组的个数 '''
+
+ABSENT_NGRAMS = ['cow', 'the cow', 'the cat', 'mat the', 'the dog barked', 'dog sat on', 'on the mat the']
+''' 模型中不存在的N元组（"the cat"只是"the cat sat"的前缀） '''
+
+SENTENCES = [['the', 'cat', 'sat', 'on', 'the', 'mat'],
+             ['the', 'dog', 'sat', 'on', 'the', 'cat'],
+             ['a', 'cow', 'sat', 'on', 'the', 'mat'],
+             ['mat'],
+             []]
+''' 待打分的语句，含词表外的词 '''
+
+
+def write_model(directory, name='toy.arpa', text=TOY_ARPA):
+
+    """
+    将模型文本写入directory下的文件
+    :return: 文件路径
+    """
+
+    path = os.path.join(directory, name)
+
+    with open(path, 'wb') as modelfile:
+        modelfile.write(text)
+
+    return path